@@ -1,8 +1,11 @@
 from starepandas.tools import *
 from starepandas.io.folder import folder2catalog
-from starepandas.io.granules import read_granule
+from starepandas.io.granules import read_granule, read_granules, build_sidecars
 from starepandas.io.granules import guess_companion_path
-from starepandas.io.pod import read_pods
+from starepandas.io.granules import enable_grid_cache, disable_grid_cache
+from starepandas.io.pod import read_pods, iter_pods, compact_pods
+from starepandas.io.pod import enable_pod_cache, disable_pod_cache, pod_cache_info
+from starepandas.io.manifest import rebuild_manifest
 from starepandas.io.database import read_sql_table
 from starepandas.io.geotiff import read_geotiff
 
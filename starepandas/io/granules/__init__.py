@@ -1,11 +1,17 @@
+import concurrent.futures
 import glob
+import logging
+import os
 import re
+import pandas
 import starepandas
 from .modis import Mod09GA, Mod05, Mod09, Mod03
 from .viirsl2 import VNP02DNB, VNP03DNB, VNP03MOD, VNP03IMG, CLDMSKL2VIIRS, VNP09
 from .ssmis import SSMIS
 from .atms import ATMS
 from .imergl3 import L3IMERG, DYAMONDv2
+from .sidecars import build_sidecar, build_sidecars
+from .grids import enable_grid_cache, disable_grid_cache
 
 class UnsupportedFileError(Exception):
     def __init__(self, file_path):
@@ -13,6 +19,10 @@ class UnsupportedFileError(Exception):
         self.message = 'cannot handle {}'.format(file_path)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        # Keeps the error intact when it is raised in a worker process
+        return type(self), (self.file_path,)
+
 
 class SidecarNotFoundError(Exception):
     def __init__(self, file_path):
@@ -20,6 +30,9 @@ class SidecarNotFoundError(Exception):
         self.message = 'Could not find sidecar for {}'.format(file_path)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        return type(self), (self.file_path,)
+
 
 class CompanionNotFoundError(Exception):
     def __init__(self, file_path):
@@ -27,6 +40,9 @@ class CompanionNotFoundError(Exception):
         self.message = 'Could not find companion for {}'.format(file_path)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        return type(self), (self.file_path,)
+
 
 class MultipleCompanionsFoundError(Exception):
     def __init__(self, file_path):
@@ -34,6 +50,9 @@ class MultipleCompanionsFoundError(Exception):
         self.message = 'More than one possible companion found for {}. Specify the prefix'.format(file_path)
         super().__init__(self.message)
 
+    def __reduce__(self):
+        return type(self), (self.file_path,)
+
 
 def guess_companion_path(granule_path, folder=None, prefix=None):
     """
@@ -192,6 +211,7 @@ def read_granule(file_path,
                  keep_na_sids=False,
                  datasets=None,
                  roi=None,
+                 mode='nullable',
                  **kwargs):
     """ Reads a granule into a STAREDataFrame
 
@@ -217,11 +237,19 @@ def read_granule(file_path,
         toggle whether to read the timestamp
     keep_na_sids:
         toggle whether to keep rows containing NA values for sids
+    roi: array-like
+        SIDs of a region of interest; only the rows intersecting it are returned. With a sidecar,
+        granules whose STARE cover does not intersect the ROI are skipped without reading them, and of the
+        others only the scan lines holding intersecting pixels are read (c.f. Granule.set_roi).
+        Otherwise (add_sids), the granule is read completely and subset afterwards.
+    mode: str
+        'nullable' (default) or 'fast'; c.f. Granule.to_df. 'fast' returns int64 SIDs and
+        the datasets without copying them, dropping pixels without SIDs.
 
     Returns
     --------
     df: starepandas.STAREDataFrame
-        A dataframe holding the granule data
+        A dataframe holding the granule data; None if the granule does not intersect roi
 
     Examples
     ----------
@@ -231,26 +259,155 @@ def read_granule(file_path,
 
     granule = granule_factory(file_path, sidecar_path, nom_res)
 
-    if add_sids:
-        latlon = True
-        sidecar = False
+    # Closes the sidecar handles once the granule is read
+    with granule:
+        if add_sids:
+            latlon = True
+            sidecar = False
 
-    if read_timestamp:
-        granule.read_timestamps()
+        if roi is not None:
+            if not sidecar and not add_sids:
+                raise ValueError('read_granule requires SIDs (sidecar or add_sids) to subset to roi.')
+            if sidecar and granule.windowed and not granule.set_roi(roi, sidecar_path):
+                return None
+
+        if read_timestamp:
+            granule.read_timestamps()
+
+        if latlon:
+            if sidecar:
+                granule.read_sidecar_latlon()
+            else:
+                granule.read_latlon()
 
-    if latlon:
         if sidecar:
-            granule.read_sidecar_latlon()
-        else:
-            granule.read_latlon()
+            if granule.window is None:
+                granule.read_sidecar_index(sidecar_path)
+        elif add_sids:
+            granule.add_sids(adapt_resolution)
 
-    if sidecar:
-        granule.read_sidecar_index(sidecar_path)
-    elif add_sids:
-        granule.add_sids(adapt_resolution)
+        granule.read_data()
 
-    granule.read_data()
+        df = granule.to_df(xy=xy, mode=mode)
+
+        if roi is not None and granule.roi_mask is None:
+            sids = df[df._sid_column_name]
+            df = starepandas.speedy_subset(df[sids.notna()], roi)
+        return df
+
+
+def granule_size(file_path):
+    """ Returns the size of a local granule file; 0 if unknown (e.g. on S3)."""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def iter_granules(paths, num_workers=1, roi_sids=None, errors='warn', failures=None, **kwargs):
+    """ Reads granules in worker processes and yields them as STAREDataFrames as they finish.
+
+    C.f. :func:`read_granules` for the parameters.
+    """
+    if errors not in ['raise', 'warn', 'ignore']:
+        raise ValueError('iter_granules argument errors="%s" not understood.' % errors)
+    yield from _map_granules(read_granule, paths, num_workers=num_workers, errors=errors, failures=failures,
+                             message='Reading granule %s failed: %r', roi=roi_sids, **kwargs)
 
-    df = granule.to_df(xy=xy)
 
-    return df
+def _map_granules(func, paths, num_workers=1, errors='warn', failures=None, message='%s failed: %r', **kwargs):
+    """ Calls func(path, **kwargs) for each of paths in num_workers processes and yields the results as they finish.
+
+    Paths are submitted largest first. None results are not yielded. Exceptions are raised, logged with message,
+    or ignored according to errors ('raise', 'warn', or 'ignore'), and appended to failures if given.
+    Pending paths are cancelled if the generator is closed or an exception is raised.
+    """
+    # Largest granules first, so that no worker is left with a large granule at the end
+    paths = sorted(paths, key=granule_size, reverse=True)
+
+    def failed(file_path, error):
+        if errors == 'raise':
+            raise error
+        if errors == 'warn':
+            logging.warning(message % (file_path, error))
+        if failures is not None:
+            failures.append((file_path, error))
+
+    if num_workers is None or num_workers <= 1:
+        for file_path in paths:
+            try:
+                result = func(file_path, **kwargs)
+            except Exception as error:
+                failed(file_path, error)
+                continue
+            if result is not None:
+                yield result
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(func, file_path, **kwargs): file_path for file_path in paths}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as error:
+                    failed(futures[future], error)
+                    continue
+                if result is not None:
+                    yield result
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def read_granules(paths, num_workers=1, iterate=False, roi_sids=None, errors='warn', failures=None, **kwargs):
+    """ Reads a batch of granules in parallel processes into a STAREDataFrame
+
+    Each granule is read by :func:`read_granule` in a pool of num_workers processes.
+    Granules are submitted largest first, which balances the work of granules of different sizes.
+
+    Parameters
+    -----------
+    paths: list
+        paths of the granules
+    num_workers: int
+        number of worker processes. 1 reads the granules one after the other in this process. (default: 1)
+    iterate: bool
+        if True, a generator yielding the STAREDataFrame of each granule as soon as it is read is returned
+        instead of the concatenated STAREDataFrame. The granules are then yielded in the order they finish.
+    roi_sids: array-like
+        if given, each granule is subset to the rows intersecting the SIDs in its worker (c.f. the roi argument of
+        :func:`read_granule`), so that only the rows of the ROI are sent back. Granules not intersecting the
+        ROI are skipped. Requires SIDs (sidecar or add_sids).
+    errors: str
+        how to handle granules that cannot be read: 'raise' aborts the batch, 'warn' (default) logs a warning
+        and skips the granule, 'ignore' skips it silently.
+    failures: list
+        if given, a (path, exception) tuple is appended for every granule that could not be read.
+    kwargs:
+        passed on to :func:`read_granule`
+
+    Returns
+    --------
+    df: starepandas.STAREDataFrame
+        the concatenated granules; None if no granule could be read
+
+    Examples
+    ----------
+    # >>> import glob
+    # >>> import starepandas
+    # >>> paths = glob.glob('granules/MOD05_L2.A2019336.*.hdf')
+    # >>> failures = []
+    # >>> sdf = starepandas.read_granules(paths, num_workers=8, sidecar=True, latlon=True, nom_res='5km',
+    # ...                                 roi_sids=roi, failures=failures)
+    """
+    granules = iter_granules(paths, num_workers=num_workers, roi_sids=roi_sids, errors=errors, failures=failures,
+                             **kwargs)
+    if iterate:
+        return granules
+    dfs = list(granules)
+    if dfs == []:
+        return None
+    df = pandas.concat(dfs)
+    df.reset_index(inplace=True, drop=True)
+    return starepandas.STAREDataFrame(df)
@@ -0,0 +1,153 @@
+import collections
+import numpy
+import pandas
+
+
+BitField = collections.namedtuple('BitField', ['first', 'last', 'dtype', 'categories'],
+                                  defaults=['uint8', None])
+BitField.__doc__ = """ A field of a QA flag: the bits first to last (inclusive, 0 being the least significant bit).
+
+dtype is 'uint8' or bool. If categories are given, the field value is the code of categories[value];
+decoded series are then categorical, with values beyond the categories being NaN.
+"""
+
+
+# C.f. the MOD09 user guide, table 13: 1km state QA
+MOD09_STATE = {
+    'cloud': BitField(0, 1, categories=['clear', 'cloudy', 'mixed', 'not set']),
+    'cloud_shadow': BitField(2, 2, bool),
+    'land_water': BitField(3, 5, categories=['shallow ocean', 'land', 'coastline', 'shallow inland water',
+                                             'ephemeral water', 'deep inland water', 'continental ocean',
+                                             'deep ocean']),
+    'aerosol': BitField(6, 7, categories=['climatology', 'low', 'average', 'high']),
+    'cirrus': BitField(8, 9, categories=['none', 'small', 'average', 'high']),
+    'cloud_internal': BitField(10, 10, bool),
+    'fire_internal': BitField(11, 11, bool),
+    'snow_mod35': BitField(12, 12, bool),
+    'adjacent_cloud': BitField(13, 13, bool),
+    'salt_pan': BitField(14, 14, bool),
+    'snow_internal': BitField(15, 15, bool)
+}
+
+# C.f. the MOD09 user guide, table 10: 500m, 1km and coarse resolution band QA
+MOD09_BAND_QA = {
+    'modland': BitField(0, 1),
+    'band1_quality': BitField(2, 5),
+    'band2_quality': BitField(6, 9),
+    'band3_quality': BitField(10, 13),
+    'band4_quality': BitField(14, 17),
+    'band5_quality': BitField(18, 21),
+    'band6_quality': BitField(22, 25),
+    'band7_quality': BitField(26, 29),
+    'atmospheric_correction': BitField(30, 30, bool),
+    'adjacency_correction': BitField(31, 31, bool)
+}
+
+VNP09_QF1 = {
+    'cloud_mask_quality': BitField(0, 1, categories=['poor', 'low', 'medium', 'high']),
+    'cloud': BitField(2, 3, categories=['confident clear', 'probably clear', 'probably cloudy', 'confident cloudy']),
+    'day_night': BitField(4, 4, bool),
+    'low_sun': BitField(5, 5, bool),
+    'sun_glint': BitField(6, 7, categories=['none', 'geometry', 'wind speed', 'geometry and wind speed'])
+}
+
+VNP09_QF2 = {
+    'land_water': BitField(0, 2, categories=['land and desert', 'land no desert', 'inland water', 'sea water',
+                                             'undefined', 'coastal']),
+    'shadow': BitField(3, 3, bool),
+    'heavy_aerosol': BitField(4, 4, bool),
+    'snow_ice': BitField(5, 5, bool),
+    'thin_cirrus_reflective': BitField(6, 6, bool),
+    'thin_cirrus_emissive': BitField(7, 7, bool)
+}
+
+# First byte of the Cloud_Mask of CLDMSK_L2_VIIRS (and MOD35)
+CLDMSK_BYTE0 = {
+    'cloud_mask_determined': BitField(0, 0, bool),
+    'cloud': BitField(1, 2, categories=['confident cloudy', 'probably cloudy', 'probably clear', 'confident clear']),
+    'day': BitField(3, 3, bool),
+    'sun_glint_free': BitField(4, 4, bool),
+    'snow_ice_free': BitField(5, 5, bool),
+    'land_water': BitField(6, 7, categories=['water', 'coastal', 'desert', 'land'])
+}
+
+
+def unsigned(values):
+    """ Returns a view of the integer array values as unsigned integers of the same width.
+
+    Float arrays (e.g. of flags that went through a join with missing rows) are cast to int64 first.
+    """
+    values = numpy.asarray(values)
+    if values.dtype.kind == 'f':
+        values = values.astype(numpy.int64)
+    if values.dtype.kind == 'i':
+        return values.view('u{}'.format(values.dtype.itemsize))
+    return values
+
+
+def extract_bits(values, first, last):
+    """ Extracts the bits first to last (inclusive) of the unsigned integer array values.
+
+    Examples
+    ----------
+    >>> import numpy
+    >>> extract_bits(numpy.array([0b0110, 0b1001], dtype=numpy.uint8), 1, 2)
+    array([3, 0], dtype=uint8)
+    """
+    return (values >> values.dtype.type(first)) & values.dtype.type((1 << (last - first + 1)) - 1)
+
+
+def decode_bitfields(values, spec):
+    """ Decodes integer QA flags into their fields with shifts and masks.
+
+    Parameters
+    -----------
+    values: numpy.ndarray, numpy.ma.MaskedArray, or pandas.Series
+        the QA flags
+    spec: dict
+        :class:`BitField` by field name, e.g. :data:`MOD09_STATE`
+
+    Returns
+    --------
+    fields: dict or pandas.DataFrame
+        For arrays, a dict of uint8 or bool arrays (masked with the mask of values) of the shape of values.
+        For series, a DataFrame with the index of values and uint8, bool, or categorical columns;
+        nullable (UInt8 and boolean) columns if values has NA.
+
+    Examples
+    ----------
+    >>> import pandas
+    >>> state = pandas.Series([0b0000000000001001, 0b1000000000000100])
+    >>> decode_bitfields(state, MOD09_STATE)[['cloud', 'cloud_shadow', 'land_water', 'snow_internal']]
+        cloud  cloud_shadow     land_water  snow_internal
+    0  cloudy         False           land          False
+    1   clear          True  shallow ocean           True
+    """
+    if isinstance(values, pandas.Series):
+        na = values.isna().to_numpy()
+        ints = values.to_numpy(dtype=numpy.int64, na_value=0) if na.any() else values.to_numpy()
+        fields = decode_bitfields(ints, spec)
+        columns = {}
+        for name, field in spec.items():
+            codes = fields[name]
+            if field.categories is not None:
+                codes = numpy.where(na | (codes >= len(field.categories)), -1, codes).astype(numpy.int8)
+                column = pandas.Categorical.from_codes(codes, categories=field.categories, validate=False)
+            elif na.any():
+                column = pandas.array(codes, dtype='boolean' if field.dtype is bool else 'UInt8')
+                column[na] = pandas.NA
+            else:
+                column = codes
+            columns[name] = column
+        return pandas.DataFrame(columns, index=values.index)
+
+    mask = numpy.ma.getmask(values)
+    ints = unsigned(numpy.ma.getdata(values))
+    fields = {}
+    for name, field in spec.items():
+        bits = extract_bits(ints, field.first, field.last)
+        bits = bits != 0 if field.dtype is bool else bits.astype(field.dtype)
+        if mask is not numpy.ma.nomask:
+            bits = numpy.ma.masked_array(bits, mask)
+        fields[name] = bits
+    return fields
@@ -5,8 +5,16 @@ import pystare
 import pandas
 
 
+def sidecar_name(file_path):
+    """ Returns the conventional sidecar path of a granule: its path with the extension replaced by '_stare.nc'."""
+    return '.'.join(file_path.split('.')[0:-1]) + '_stare.nc'
+
+
 class Granule:
 
+    # Whether the loader reads all its 2D arrays through read_rows, i.e. supports scan-line windows (c.f. set_roi)
+    windowed = False
+
     def __init__(self, file_path, sidecar_path=None, nom_res=None):
         self.file_path = file_path
         self.sidecar_path = sidecar_path
@@ -15,8 +23,14 @@ class Granule:
         self.lon = None
         self.sids = None
         self.stare_cover = None
+        self.window = None
+        self.roi_mask = None
         self.ts_start = None
         self.ts_end = None
+        # Open sidecar handles by path (c.f. open_sidecar)
+        self.sidecars = {}
+        # The 1D (lat, lon) coordinates of fixed-grid products, which share their SIDs through the grid cache
+        self.grid = None
         if nom_res:
             self.nom_res = nom_res
         else:
@@ -24,7 +38,7 @@ class Granule:
         self.companion_prefix = None
 
     def guess_sidecar_path(self):
-        name = '.'.join(self.file_path.split('.')[0:-1]) + '_stare.nc'
+        name = sidecar_name(self.file_path)
         if 's3://' == self.file_path[0:5]:
             tokens = starepandas.io.s3.parse_s3_url(name)
             names, _ = starepandas.io.s3.s3_glob(name)
@@ -44,49 +58,234 @@ class Granule:
             prefix = self.companion_prefix
         return starepandas.io.granules.guess_companion_path(self.file_path, prefix=prefix, folder=folder)
 
+    def set_grid(self, lat, lon):
+        """ Sets the geolocation of a fixed-grid product to the mesh grid of its 1D lat and lon coordinates.
+
+        If the grid cache is enabled (c.f. :func:`~starepandas.io.granules.grids.enable_grid_cache`),
+        the mesh grid and the SIDs (c.f. :meth:`add_sids`) are memory-mapped from the cache and shared between granules.
+        """
+        self.grid = (lat, lon)
+        if starepandas.io.granules.grids.GRID_CACHE_DIR is not None:
+            self.lat, self.lon = starepandas.io.granules.grids.grid_latlon(lat, lon)
+        else:
+            self.lon, self.lat = numpy.meshgrid(lon, lat, indexing='xy')
+
     def add_sids(self, adapt_resolution=True):
+        if self.grid is not None and starepandas.io.granules.grids.GRID_CACHE_DIR is not None:
+            self.sids = starepandas.io.granules.grids.grid_sids(*self.grid, adapt_resolution=adapt_resolution)
+            return
         self.sids = pystare.from_latlon_2d(lat=self.lat, lon=self.lon, adapt_level=adapt_resolution)
 
-    def read_sidecar_index(self, sidecar_path=None):
-        if sidecar_path is not None:
-            scp = sidecar_path
-        elif self.sidecar_path is not None:
-            scp = self.sidecar_path
-        else:
-            scp = self.guess_sidecar_path()
-        ds = starepandas.io.s3.nc4_dataset_wrapper(scp)
+    def read_rows(self, variable, factor=1):
+        """ Reads the scan lines of the window (c.f. :meth:`set_roi`) from an HDF4 dataset or netCDF variable.
+
+        factor is the number of granule rows per row of the variable, e.g. 2 for a 1km dataset of a 500m granule.
+        Such variables are read from the first to the last row overlapping the window; :meth:`trim_rows` cuts
+        them to the window after they were resampled.
+        """
+        if self.window is None:
+            return variable[:]
+        start, stop = self.window
+        return variable[start // factor:-(-stop // factor)]
+
+    def trim_rows(self, array, factor=1):
+        """ Cuts an array read by :meth:`read_rows` and resampled by factor to the window."""
+        if self.window is None or factor == 1:
+            return array
+        start, stop = self.window
+        offset = start % factor
+        return array[offset:offset + stop - start]
+
+    def set_roi(self, roi_sids, sidecar_path=None):
+        """ Restricts reading to the scan lines of the granule intersecting a region of interest.
+
+        The STARE cover of the sidecar is checked against roi_sids first, so that granules not
+        intersecting the ROI are rejected without reading their index. Otherwise, the sidecar index is read
+        and the window of scan lines holding intersecting pixels is set. Subsequent reads of the index,
+        geolocations, and data only read the window, and :meth:`to_df` only returns the intersecting pixels.
+
+        Parameters
+        -----------
+        roi_sids: array-like
+            SIDs of the region of interest
+        sidecar_path: str
+            path of the sidecar file. Guessed if not provided.
+
+        Returns
+        --------
+        intersects: bool
+            False if no pixel of the granule intersects the ROI
+        """
+        roi_sids = numpy.asarray(roi_sids, dtype=numpy.int64)
+        self.window = None
+        self.roi_mask = None
+        self.read_sidecar_cover(sidecar_path)
+        if not pystare.intersects(numpy.ma.getdata(self.stare_cover), roi_sids).any():
+            return False
+
+        self.read_sidecar_index(sidecar_path)
+        sids = numpy.ma.getdata(self.sids)
+        mask = starepandas.speedy_intersects(sids.flatten(), roi_sids).reshape(sids.shape)
+        mask &= ~numpy.ma.getmaskarray(self.sids)
+        rows = numpy.flatnonzero(mask.any(axis=1))
+        if len(rows) == 0:
+            return False
+        self.window = (int(rows[0]), int(rows[-1]) + 1)
+        self.sids = self.sids[self.window[0]:self.window[1]]
+        self.roi_mask = mask[self.window[0]:self.window[1]]
+        return True
+
+    def n_rows(self):
+        """ Returns the number of scan lines of the granule; by default the rows of the index of its sidecar."""
+        return self.sidecar_rows()
+
+    def sidecar_rows(self, sidecar_path=None):
+        """ Returns the number of rows of the index of the sidecar without reading it."""
+        ds = self.open_sidecar(sidecar_path)
         try:
-            self.sids = ds['STARE_index_{}'.format(self.nom_res)][:, :].astype(numpy.int64)
+            return ds['STARE_index_{}'.format(self.nom_res)].shape[0]
         except IndexError:
-            # If we don't have a nomres?
-            self.sids = ds['STARE_index{}'.format(self.nom_res)][:, :].astype(numpy.int64)
+            return ds['STARE_index{}'.format(self.nom_res)].shape[0]
 
-    def read_sidecar_cover(self, sidecar_path=None):
+    def iter_blocks(self, rows_per_block=256, latlon=True, sidecar=False, sidecar_path=None, add_sids=False,
+                    adapt_resolution=True, xy=False, read_timestamp=False, mode='nullable'):
+        """ Reads the granule in blocks of scan lines and yields them as STAREDataFrames.
+
+        Each block is read as a window (c.f. :meth:`read_rows`), i.e. only the hyperslabs of its rows are
+        read from the geolocation, the sidecar, and the datasets. Memory is hence bounded by the size of a
+        block rather than the size of the granule. If an ROI is set (c.f. :meth:`set_roi`), only the blocks of
+        its window are read and blocks without intersecting pixels are skipped.
+
+        Parameters
+        -----------
+        rows_per_block: int
+            number of scan lines per block
+        latlon: bool
+            toggle whether to read the latitude and longitude
+        sidecar: bool
+            toggle whether to read the SIDs (and latitude and longitude) from the sidecar
+        sidecar_path: str
+            path of the sidecar file. Guessed if not provided.
+        add_sids: bool
+            toggle whether to look up the SIDs of the latitude and longitude of every block
+        adapt_resolution: bool
+            toggle whether to adapt the resolution of looked up SIDs
+        xy: bool
+            toggle whether to add the array coordinates of the granule
+        read_timestamp: bool
+            toggle whether to read the timestamps
+        mode: str
+            'nullable' (default) or 'fast'; c.f. :meth:`to_df`
+
+        Yields
+        --------
+        df: STAREDataFrame
+            the observations of a block of scan lines
+
+        Examples
+        ----------
+        # >>> granule = starepandas.io.granules.granule_factory('VNP03IMG.A2022308.1930.002.2022309041547.nc')
+        # >>> for df in granule.iter_blocks(rows_per_block=512, sidecar=True):
+        # ...     df.write_pods(pod_root, level=6, chunk_name='VNP03IMG.A2022308.1930', append=True)
+        """
+        if not self.windowed:
+            raise ValueError('{} does not support reading blocks of scan lines.'.format(type(self).__name__))
+        if add_sids:
+            latlon = True
+            sidecar = False
+        if read_timestamp:
+            self.read_timestamps()
+
+        window, roi_mask = self.window, self.roi_mask
+        if window is not None:
+            start, stop = window
+        elif sidecar:
+            start, stop = 0, self.sidecar_rows(sidecar_path)
+        else:
+            start, stop = 0, self.n_rows()
+        try:
+            for block_start in range(start, stop, rows_per_block):
+                block_stop = min(block_start + rows_per_block, stop)
+                if roi_mask is not None:
+                    self.roi_mask = roi_mask[block_start - start:block_stop - start]
+                    if not self.roi_mask.any():
+                        continue
+                self.window = (block_start, block_stop)
+                self.data = {}
+                self.lat, self.lon, self.sids = None, None, None
+                if latlon:
+                    if sidecar:
+                        self.read_sidecar_latlon(sidecar_path)
+                    else:
+                        self.read_latlon()
+                if sidecar:
+                    self.read_sidecar_index(sidecar_path)
+                elif add_sids:
+                    self.add_sids(adapt_resolution)
+                self.read_data()
+                yield self.to_df(xy=xy, mode=mode)
+        finally:
+            # Leaves the granule as it was before, not holding the arrays of the last block
+            self.window, self.roi_mask = window, roi_mask
+            self.data = {}
+            self.lat, self.lon, self.sids = None, None, None
+
+    def open_sidecar(self, sidecar_path=None):
+        """ Returns the (cached) netCDF handle of the sidecar.
+
+        Each sidecar is opened (or, on S3, downloaded) once per granule; the read_sidecar_* methods all read from
+        the same handle. Handles stay open until :meth:`close` is called, e.g. by using the granule as
+        a context manager.
+
+        Parameters
+        -----------
+        sidecar_path: str
+            path of the sidecar file. Default: self.sidecar_path, guessed if not set.
+        """
         if sidecar_path:
             scp = sidecar_path
         elif self.sidecar_path:
             scp = self.sidecar_path
         else:
-            scp = self.guess_sidecar_path()
-        ds = starepandas.io.s3.nc4_dataset_wrapper(scp)
+            scp = self.sidecar_path = self.guess_sidecar_path()
+        if scp not in self.sidecars:
+            self.sidecars[scp] = starepandas.io.s3.nc4_dataset_wrapper(scp)
+        return self.sidecars[scp]
+
+    def close(self):
+        """ Closes the sidecar handles opened by :meth:`open_sidecar`."""
+        while self.sidecars:
+            _, ds = self.sidecars.popitem()
+            ds.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read_sidecar_index(self, sidecar_path=None):
+        ds = self.open_sidecar(sidecar_path)
+        try:
+            self.sids = self.read_rows(ds['STARE_index_{}'.format(self.nom_res)]).astype(numpy.int64)
+        except IndexError:
+            # If we don't have a nomres?
+            self.sids = self.read_rows(ds['STARE_index{}'.format(self.nom_res)]).astype(numpy.int64)
+
+    def read_sidecar_cover(self, sidecar_path=None):
+        ds = self.open_sidecar(sidecar_path)
         self.stare_cover = ds['STARE_cover'][:].astype(numpy.int64)
 
     def read_sidecar_latlon(self, sidecar_path=None):
-        if sidecar_path is not None:
-            scp = sidecar_path
-        elif self.sidecar_path is not None:
-            scp = self.sidecar_path
-        else:
-            scp = self.guess_sidecar_path()
-        ds = starepandas.io.s3.nc4_dataset_wrapper(scp)
+        ds = self.open_sidecar(sidecar_path)
         try:
-            self.lat = ds['Latitude_{}'.format(self.nom_res)][:, :]
-            self.lon = ds['Longitude_{}'.format(self.nom_res)][:, :]
+            self.lat = self.read_rows(ds['Latitude_{}'.format(self.nom_res)])
+            self.lon = self.read_rows(ds['Longitude_{}'.format(self.nom_res)])
         except IndexError:
-            self.lat = ds['Latitude{}'.format(self.nom_res)][:, :]
-            self.lon = ds['Longitude{}'.format(self.nom_res)][:, :]
+            self.lat = self.read_rows(ds['Latitude{}'.format(self.nom_res)])
+            self.lon = self.read_rows(ds['Longitude{}'.format(self.nom_res)])
 
-    def to_df(self, xy=False):
+    def to_df(self, xy=False, mode='nullable'):
         """ Converts the granule object to a dataframe
 
         Parameters
@@ -94,13 +293,22 @@ class Granule:
         xy: bool
             If true, add columns for the original array coordinates
             For MODIS, x will be in scan direction / across swath / data samples
+        mode: str
+            'nullable' (default) converts integer datasets to nullable integer types and the SIDs to Int64,
+            masking fill values with NA. 'fast' wraps the flattened arrays without copying them (c.f. :meth:`to_df_fast`).
 
         Returns
         --------
         df: STAREDataFrame
-            dataframe containing lat, lon, xy, and data; one row per observation
+            dataframe containing lat, lon, xy, and data; one row per observation.
+            If an ROI is set (c.f. :meth:`set_roi`), only the observations intersecting it.
 
         """
+        if mode == 'fast':
+            return self.to_df_fast(xy=xy)
+        elif mode != 'nullable':
+            raise ValueError('to_df argument mode="%s" not understood.' % mode)
+
         df = {}
 
         if self.lat is not None:
@@ -114,13 +322,7 @@ class Granule:
             df['ts_start'] = self.ts_start
             df['ts_end'] = self.ts_end
         if xy:
-            if self.lat is not None:
-                indices = numpy.indices(self.lat.shape, dtype='uint16')
-            elif self.sids is not None:
-                indices = numpy.indices(self.sids.shape, dtype='uint16')
-            else:
-                ds = list(self.data.values())[0]
-                indices = numpy.indices(ds.shape, dtype='uint16')
+            indices = self.xy_indices()
             # Careful indices() gives first the row (y), then the column (x) indices
             df['x'] = indices[1].flatten()
             df['y'] = indices[0].flatten()
@@ -135,6 +337,72 @@ class Granule:
                 dtype = dtype.name.replace('ui', 'UI')
             series = pandas.Series(self.data[key].flatten(), dtype=dtype)
             df[key] = series
-        return starepandas.STAREDataFrame(df)
+        df = starepandas.STAREDataFrame(df)
+        if self.roi_mask is not None:
+            df = df[self.roi_mask.flatten()]
+        return df
+
+    def xy_indices(self):
+        """ Returns the row (y) and column (x) indices of the pixels of the granule (or its window)."""
+        if self.lat is not None:
+            shape = self.lat.shape
+        elif self.sids is not None:
+            shape = self.sids.shape
+        else:
+            shape = list(self.data.values())[0].shape
+        indices = numpy.indices(shape, dtype='uint16')
+        if self.window is not None:
+            indices[0] += self.window[0]
+        return indices
+
+    def to_df_fast(self, xy=False):
+        """ Converts the granule object to a dataframe of native numpy columns without copying the arrays.
+
+        The flattened arrays are wrapped as they are instead of being converted to nullable types:
+
+        - SIDs are int64 and pixels with masked (fill value) SIDs are dropped.
+        - integer datasets keep the fill values of the granule as sentinels.
+        - masked values of float datasets are NaN.
+
+        Arrays are only copied to drop masked SIDs, to set masked floats to NaN, or to cut an ROI
+        (c.f. :meth:`set_roi`).
+
+        Parameters
+        -----------
+        xy: bool
+            If true, add columns for the original array coordinates
+
+        Returns
+        --------
+        df: STAREDataFrame
+            dataframe containing lat, lon, xy, and data; one row per observation
+        """
+        df = {}
+        if self.lat is not None:
+            df['lat'] = numpy.ma.getdata(self.lat).ravel()
+            df['lon'] = numpy.ma.getdata(self.lon).ravel()
+        if self.sids is not None:
+            df['sids'] = numpy.ma.getdata(self.sids).ravel().astype(numpy.int64, copy=False)
+        if self.ts_start is not None and self.ts_end is not None:
+            df['ts_start'] = self.ts_start
+            df['ts_end'] = self.ts_end
+        if xy:
+            indices = self.xy_indices()
+            df['x'] = indices[1].ravel()
+            df['y'] = indices[0].ravel()
+        for key, data in self.data.items():
+            if data.dtype.kind == 'f' and numpy.ma.is_masked(data):
+                data = data.filled(numpy.nan)
+            df[key] = numpy.ma.getdata(data).ravel()
+
+        valid = None
+        if self.sids is not None and numpy.ma.is_masked(self.sids):
+            valid = ~numpy.ma.getmaskarray(self.sids).ravel()
+        if self.roi_mask is not None:
+            valid = self.roi_mask.ravel() if valid is None else valid & self.roi_mask.ravel()
+        df = starepandas.STAREDataFrame(df, copy=False)
+        if valid is not None:
+            df = df[valid]
+        return df
 
 
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import numpy
+import pystare
+import starepandas
+
+GRID_CACHE_DIR = None
+
+
+def enable_grid_cache(cache_dir=None):
+    """ Enables the on-disk cache of the lat/lon meshgrids and SIDs of fixed-grid products (e.g. IMERG, DYAMOND).
+
+    Granules on the same grid (c.f. :attr:`Granule.grid <starepandas.io.granules.granule.Granule.grid>`) then
+    share a single meshgrid and SID array, which are computed once and stored as .npy files in cache_dir.
+    They are memory-mapped read-only, so that processes reading granules of the same grid share the pages.
+
+    Parameters
+    -----------
+    cache_dir: str
+        directory of the cache. Default: ~/.cache/starepandas/grids
+
+    Returns
+    --------
+    cache_dir: str
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> starepandas.enable_grid_cache('/scratch/grids')
+    # >>> sdf = starepandas.read_granules(imerg_paths, add_sids=True)
+    """
+    global GRID_CACHE_DIR
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'starepandas', 'grids')
+    os.makedirs(cache_dir, exist_ok=True)
+    GRID_CACHE_DIR = cache_dir
+    return cache_dir
+
+
+def disable_grid_cache():
+    """ Disables the grid cache. The cached grids are kept on disk."""
+    global GRID_CACHE_DIR
+    GRID_CACHE_DIR = None
+
+
+def grid_key(lat, lon):
+    """ Returns the key of the grid of the 1D latitude and longitude coordinates lat and lon."""
+    digest = hashlib.sha1()
+    for coordinates in (lat, lon):
+        coordinates = numpy.ascontiguousarray(coordinates, dtype=numpy.double)
+        digest.update(str(coordinates.shape).encode())
+        digest.update(coordinates.tobytes())
+    return digest.hexdigest()
+
+
+def cached_array(name, compute, cache_dir=None):
+    """ Loads the array name from the cache, computing and storing it first if it is not cached yet."""
+    cache_dir = GRID_CACHE_DIR if cache_dir is None else cache_dir
+    fname = os.path.join(cache_dir, '{}.npy'.format(name))
+    if not os.path.exists(fname):
+        tmp_path = starepandas.staredataframe.temporary_path(fname)
+        try:
+            with open(tmp_path, 'wb') as f:
+                numpy.save(f, compute())
+            os.replace(tmp_path, fname)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return numpy.load(fname, mmap_mode='r')
+
+
+def grid_latlon(lat, lon, cache_dir=None):
+    """ Returns the (nlat, nlon) meshgrids of the 1D coordinates lat and lon from the grid cache."""
+    key = grid_key(lat, lon)
+    lat_grid = cached_array('{}_lat'.format(key), lambda: numpy.meshgrid(lon, lat, indexing='xy')[1], cache_dir)
+    lon_grid = cached_array('{}_lon'.format(key), lambda: numpy.meshgrid(lon, lat, indexing='xy')[0], cache_dir)
+    return lat_grid, lon_grid
+
+
+def grid_sids(lat, lon, adapt_resolution=True, level=None, cache_dir=None):
+    """ Returns the (nlat, nlon) SIDs of the grid of the 1D coordinates lat and lon from the grid cache.
+
+    Parameters
+    -----------
+    lat: array-like
+        1D latitudes of the grid rows
+    lon: array-like
+        1D longitudes of the grid columns
+    adapt_resolution: bool
+        if True, the level of the SIDs is adapted to the grid spacing (c.f. pystare.from_latlon_2d)
+    level: int
+        level of the SIDs if adapt_resolution is False
+    """
+    key = '{}_sids_{}'.format(grid_key(lat, lon), 'adapt' if adapt_resolution else level)
+
+    def compute():
+        lat_grid, lon_grid = grid_latlon(lat, lon, cache_dir)
+        if adapt_resolution:
+            return pystare.from_latlon_2d(lat=lat_grid, lon=lon_grid, adapt_level=True)
+        return pystare.from_latlon_2d(lat=lat_grid, lon=lon_grid, level=level)
+    return cached_array(key, compute, cache_dir)
@@ -67,6 +67,8 @@ class L3IMERG(Granule):
             Array holding STARE indices (SIDs) for the data (populated by self.add_sids(), self.read_sidecar_index() or user provided). Defaults to None.
         stare_cover : Union[npt.ArrayLike, None]
             Array holding STARE cover SIDs for the data (populated by self.read_sidecar_cover() or user provided). Defaults to None.
+        grid : Union[tuple, None]
+            1D (lat, lon) coordinates of the grid (populated by self.read_latlon()). Granules on the same grid share their mesh grid and SIDs through the grid cache (c.f. starepandas.enable_grid_cache()). Defaults to None.
         ts_start : Union[datetime, None]
             Datetime object holding the start time for the data (populated by user provided). Defaults to None.
         ts_end : Union[datetime, None]
@@ -163,6 +165,8 @@ class DYAMONDv2(L3IMERG):
         Array holding STARE indices (SIDs) for the data (populated by self.add_sids(), self.read_sidecar_index() or user provided). Defaults to None.
     stare_cover : Union[npt.ArrayLike, None]
         Array holding STARE cover SIDs for the data (populated by self.read_sidecar_cover() or user provided). Defaults to None.
+    grid : Union[tuple, None]
+        1D (lat, lon) coordinates of the grid (populated by self.read_latlon()). Granules on the same grid share their mesh grid and SIDs through the grid cache (c.f. starepandas.enable_grid_cache()). Defaults to None.
     ts_start : Union[datetime, None]
         Datetime object holding the start time for the data (populated by user provided). Defaults to None.
     ts_end : Union[datetime, None]
@@ -320,6 +324,4 @@ class DYAMONDv2(L3IMERG):
         lon = self.netcdf['lon'][:].astype(numpy.double)
 
         # Make a (lat=1800, lon=3600) mesh grid to match the sidecar SIDs array
-        lon, lat = numpy.meshgrid(lon, lat, copy=True, indexing='xy')
-        self.lon = lon
-        self.lat = lat
+        self.set_grid(lat, lon)
@@ -1,8 +1,12 @@
 from starepandas.io.granules.granule import Granule
+from starepandas.io.granules.bitfields import decode_bitfields, MOD09_STATE, MOD09_BAND_QA
 import starepandas.io.s3
+import starepandas.tools.temporal_conversions
+import astropy.time
 import dask
 import datetime
 import numpy
+import pandas
 import pystare
 import shapely
 import matplotlib.patches
@@ -56,19 +60,53 @@ def parse_hdfeos_metadata(string):
     return out
 
 
+def repeat_view(array, factor):
+    """ Returns a read-only (rows, factor, cols, factor) view of the 2D array with every pixel repeated
+    factor times along both axes. No data is copied; flattening the view yields the flattened resampled array.
+
+    Examples
+    ----------
+    >>> import numpy
+    >>> repeat_view(numpy.array([[1, 2]]), 2).reshape(2, 4)
+    array([[1, 1, 2, 2],
+           [1, 1, 2, 2]])
+    """
+    rows, cols = array.shape
+    return numpy.broadcast_to(array[:, None, :, None], (rows, factor, cols, factor))
+
+
+def scale(data, scale_factor):
+    """ Applies a scale factor in place. Factors < 1 are multiplied, others divided by."""
+    if scale_factor < 1:
+        # This is insane
+        numpy.multiply(data, scale_factor, out=data, casting='unsafe')
+    else:
+        numpy.divide(data, scale_factor, out=data, casting='unsafe')
+
+
 class Modis(Granule):
 
+    windowed = True
+    scale_dtype = numpy.float32
+
     def __init__(self, file_path, sidecar_path=None, nom_res=None):
         super(Modis, self).__init__(file_path, sidecar_path, nom_res=nom_res)
         self.hdf = starepandas.io.s3.sd_wrapper(file_path)
 
     def read_latlon(self, track_first=False):
-        self.lon = self.hdf.select('Longitude').get().astype(numpy.double)
-        self.lat = self.hdf.select('Latitude').get().astype(numpy.double)
+        if self.window is None:
+            self.lon = self.hdf.select('Longitude').get().astype(numpy.double)
+            self.lat = self.hdf.select('Latitude').get().astype(numpy.double)
+        else:
+            self.lon = self.read_rows(self.hdf.select('Longitude')).astype(numpy.double)
+            self.lat = self.read_rows(self.hdf.select('Latitude')).astype(numpy.double)
         if track_first:
             self.lon = numpy.ascontiguousarray(self.lon.transpose())
             self.lat = numpy.ascontiguousarray(self.lat.transpose())
 
+    def n_rows(self):
+        return self.hdf.select('Latitude').info()[2][0]
+
     def read_timestamps(self):
         meta = get_hdfeos_metadata(self.file_path)
         meta_group = meta['CoreMetadata']['INVENTORYMETADATA']['RANGEDATETIME']
@@ -83,38 +121,72 @@ class Modis(Granule):
             self.ts_start = datetime.datetime.strptime(beginning_date + beginning_time, '"%Y-%m-%d""%H:%M:%S"')
             self.ts_end = datetime.datetime.strptime(end_date + end_time, '"%Y-%m-%d""%H:%M:%S"')
 
-    def read_dataset(self, dataset_name, resample_factor=None):
+    def read_dataset(self, dataset_name, resample_factor=None, dtype=None):
+        """ Reads a dataset into self.data, masking its fill values and applying its scale factor.
+
+        Parameters
+        -----------
+        dataset_name: str
+            name of the HDF dataset
+        resample_factor: int
+            number of granule pixels per dataset pixel along each axis, e.g. 2 for a 1km dataset of a 500m granule
+        dtype: str or numpy.dtype
+            dtype of scaled datasets; default :attr:`scale_dtype`. Datasets without scale factor keep their dtype.
+        """
         ds = self.hdf.select(dataset_name)
-        data = ds.get()
-        dtype = data.dtype
-        if resample_factor is not None:
-            data = self.resample(array=data, factor=resample_factor)
+        factor = resample_factor or 1
+        if self.window is None:
+            data = ds.get()
+        else:
+            data = self.read_rows(ds, factor=factor)
 
         attributes = ds.attributes()
+        scale_factor = attributes.get('scale_factor')
+        if scale_factor is not None:
+            dtype = numpy.dtype(dtype or self.scale_dtype)
 
+        # Masking before resampling keeps the comparison at the native resolution
+        mask = None
         if '_FillValue' in attributes.keys():
-            fill_value = attributes['_FillValue']
-            mask = data == fill_value
-            data = numpy.ma.array(data, mask=mask)
-
-        if 'scale_factor' in attributes.keys():
-            scale_factor = attributes['scale_factor']
-            if scale_factor < 1:
-                # This is insane
-                data = data * scale_factor
-            else:
-                data = data / scale_factor
+            mask = self.resample_mask(data == attributes['_FillValue'], factor)
+        data = self.trim_rows(self.resample(data, factor, dtype=dtype), factor)
 
+        if scale_factor is not None:
+            scale(data, scale_factor)
+        if mask is not None:
+            data = numpy.ma.array(data, mask=mask)
         self.data[dataset_name] = data
 
-    def resample(self, array, factor):
-        array = array.repeat(factor, axis=0)
-        array = array.repeat(factor, axis=1)
-        return array
+    def resample(self, array, factor, dtype=None):
+        """ Repeats every pixel of the 2D array factor times along both axes.
 
-    def decode_band_quality(self, qa_name):
+        The broadcast view of :func:`repeat_view` is written once into the output array of dtype
+        (default: the dtype of array) rather than repeating each axis into an intermediate copy.
+        The result is materialized rather than kept as a view until :meth:`to_df`: numpy cannot reshape the
+        broadcast view to 2D without copying it, and the datasets of a granule are 2D arrays that windows
+        (c.f. :meth:`trim_rows`), ROI masks, the bitfield decoders, and users index.
         """
-        Decode QA
+        dtype = array.dtype if dtype is None else numpy.dtype(dtype)
+        if factor == 1:
+            return array.astype(dtype, copy=False)
+        rows, cols = array.shape
+        resampled = numpy.empty((rows * factor, cols * factor), dtype=dtype)
+        resampled.reshape(rows, factor, cols, factor)[...] = repeat_view(array, factor)
+        return resampled
+
+    def resample_mask(self, mask, factor):
+        """ Resamples (c.f. :meth:`resample`) and trims a fill mask read at the resolution of its dataset.
+
+        Returns numpy.ma.nomask if no pixel is masked, so that datasets without fill values carry no mask array.
+        """
+        if not mask.any():
+            return numpy.ma.nomask
+        return self.trim_rows(self.resample(mask, factor), factor)
+
+    def decode_band_quality(self, qa_name):
+        """ Decodes the band QA dataset qa_name into the fields of :data:`~bitfields.MOD09_BAND_QA`.
+
+        The fields are added to self.data as (masked) uint8 and bool arrays.
 
         31      adjacency correction performed      1: yes; 0: no
         30      atmospheric correction performed    1: yes; 0: no
@@ -137,14 +209,13 @@ class Modis(Granule):
             11: other reasons some or all bands may be fill value
         Note that a value of (11) overrides a value of (01).";
         """
-        qa = self.data[qa_name]
-        # qa = state_series.apply(lambda x: '{:032b}'.format(x)[::-1])
-        # df = starepandas.STAREDataFrame(index=state.index)
-        # df['modland_qa'] = state.str.slice(start=0, stop=2).apply(lambda x: x[::-1]).astype('u1')
+        self.data.update(decode_bitfields(self.data[qa_name], MOD09_BAND_QA))
 
     def decode_state(self, state_ds):
-        """
-        Decode the state
+        """ Decodes the state QA dataset state_ds into the fields of :data:`~bitfields.MOD09_STATE`.
+
+        The fields are added to self.data as (masked) uint8 and bool arrays;
+        categorical fields (e.g. cloud) hold their codes.
 
         15  internal snow algorithm flag     1: yes; 0: no
         14  Salt pan                         1: yes; 0: no
@@ -160,28 +231,7 @@ class Modis(Granule):
         2   cloud shadow                     1: yes; 0: no
         0-1 cloud state                     00: clear; 01: cloudy; 10: mixed; 11: not set assumed clear
         """
-        state = self.data[state_ds]
-        binary_repr = numpy.vectorize(numpy.binary_repr)
-        state = binary_repr(state, width=16)
-
-        def slicer_vectorized(a, start, end):
-            b = a.data.view((str, 1))
-            # need to flip because of major byte order
-            b = numpy.flip(b)
-            b = b.reshape(a.shape[0], a.shape[1], 16)
-            b = b[:, :, start:end]
-            b = numpy.flip(b)
-            b = numpy.frombuffer(b.tobytes(), dtype=(str, end - start))
-            b = b.reshape(a.shape)
-            b = numpy.ma.masked_array(b, a.mask)
-            b = b.astype('i1')
-            return b
-
-        self.data['cloud'] = slicer_vectorized(state, 0, 2)
-        self.data['cloud_shadow'] = slicer_vectorized(state, 2, 3).astype(bool)
-        self.data['cloud_internal'] = slicer_vectorized(state, 10, 11).astype(bool)
-        self.data['snow_mod35'] = slicer_vectorized(state, 12, 13).astype(bool)
-        self.data['snow_internal'] = slicer_vectorized(state, 15, 16).astype(bool)
+        self.data.update(decode_bitfields(self.data[state_ds], MOD09_STATE))
 
 
 class Mod09(Modis):
@@ -218,6 +268,21 @@ class Mod09(Modis):
             self.read_dataset(dataset_name=dataset_name, resample_factor=None)
 
 
+# MODIS scan geometry. C.f. https://modis.gsfc.nasa.gov/data/atbd/atbd_mod28_v3.pdf table 3.3
+TAI93_EPOCH = astropy.time.Time('1993-01-01T00:00:00', scale='utc')
+T_FRAME = 333.333e-6  # seconds
+N_FRAMES = 1354  # 1km frames per scan
+F_30 = -14  # frame position of the leading band 30, which 'EV start time' refers to
+N_DETECTORS = {'1km': 10, '500m': 20, '250m': 40}
+N_SAMPLES = {'1km': 1, '500m': 2, '250m': 4}
+FRAME_OFFSETS = {'1km': 0, '500m': 0.5, '250m': 0.75}
+BAND_RESOLUTIONS = {1: '250m', 2: '250m', 3: '500m', 4: '500m', 5: '500m', 6: '500m', 7: '500m'}
+BAND_FRAMES = {1: 0.25, 2: 2, 3: 0.5, 4: 3.5, 5: 1, 6: -0.5, 7: -3, 8: -2, 9: -5, 10: -8, 11: 7, 12: 10,
+               '13H': 5.5, '13L': 5.5, '14H': -2.5, '14L': -2.5, 13: 5.5, 14: -2.5, 15: -5, 16: -8, 17: -10,
+               18: 9, 19: 11, 20: 4, 21: 6, 22: 9, 23: 11, 24: -8, 25: -10, 26: -5, 27: -5, 28: -8, 29: -11,
+               30: -14, 31: 12, 32: 15, 33: -1, 34: 2, 35: 5, 36: 8}
+
+
 class Mod03(Modis):
     def __init__(self, file_path, sidecar_path=None, nom_res='1km', read_ifov_times=False):
         super(Mod03, self).__init__(file_path, sidecar_path, nom_res=nom_res)
@@ -237,102 +302,66 @@ class Mod03(Modis):
                 resample_factor = None
             self.read_dataset(dataset_name=dataset_name, resample_factor=resample_factor)
 
-    def read_scan_times(self):
-        """C.f. https://modis.gsfc.nasa.gov/data/atbd/atbd_mod28_v3.pdf page 3-23."""
-
-        raise NotImplementedError
-        
-        dataset_name = 'EV start time'
-        ds_ev_start_time = self.hdf.select(dataset_name) # I.e. t_0 start of band 30
-        ev_type = numpy.double
-        t_0 = ds_ev_start_time.get() #
-        print('t_0 shape, type: ',t_0.shape,type(t_0),t_0.dtype,type(t_0[0]))
-        t_frame   = 333.333e-6 # seconds
-        t_latch_0k = numpy.zeros([203,1354],dtype=ev_type)
-        t_offset_j  = numpy.zeros([36],dtype=ev_type)
-        f_30 = -14 # leading band location
-
-        # cf. ATBD Table 3.3 pg 3-18
-        f_j = {
-            'Ideal Band': 0,
-            0: 0,
-            1: 0.25,
-            2: 2,
-            3: 0.5,
-            4: 3.5,
-            5: 1,
-            6: -0.5,
-            7: -3,
-            8: -2,
-            9: -5,
-            10: -8,
-            11: 7,
-            12: 10,
-            '13H': 5.5,
-            '13L': 5.5,
-            '14H': -2.5,
-            '14L': -2.5,
-            13: 5.5,
-            14: -2.5,
-            15: -5,
-            16: -8,
-            17: -10,
-            18: 9,
-            19: 11,
-            20: 4,
-            21: 6,
-            22: 9,
-            23: 11,
-            24: -8,
-            25: -10,
-            26: -5,
-            27: -5,
-            28: -8,
-            29: -11,
-            30: -14,
-            31: 12,
-            32: 15,
-            33: -1,
-            34: 2,
-            35: 5,
-            36: 8
-            }
-
-        f_offset_j = {1:0.75, 2:0.75} # 250m
-        for j in range(3, 7): # 500m
-            f_offset_j[j] = 0.5
-        for j in range(8, 36): # 1km            
-            f_offset_j[j] = 0   
-
-        n_samples = {1:4, 2:4} # 250m
-        for j in range(3, 7): # 500m
-            n_samples[j] = 2
-        for j in range(8,36): # 1km
-            n_samples[j] = 1 
-    
-        for s in range(203): # scan
-            for k in range(1354): # frame
-                t_latch_0k[s, k] = t_0[s] + t_frame * (k - f_30)
-
-        for j in range(36):
-            t_offset_j[j] = t_frame*(f_j[j]-f_offset_j[j])
-
-        # "The time offsets t_offset of the samples i of higher resolution bands are: t_o_ij = t_o_j+T_f*((i-1)/Nsamp[j])
-        if self.nom_res == '500m':
-            resample_factor_along  = 20
-            resample_factor_across = 2
-            t_latch_ijk = numpy.zeros([203,1354*2],dtype=ev_type)
+    def read_scan_times(self, band=None, tids=True, forward_res=48, reverse_res=48):
+        """ Computes the observation (latch) time of every pixel from the 'EV start time' of its scan.
+
+        The latch time of frame k of band j in scan s is t_0[s] + t_frame * (k - f_30 + f_j - f_offset_j),
+        with the sample i of bands finer than 1km being sampled t_frame * i / n_samples later.
+        C.f. https://modis.gsfc.nasa.gov/data/atbd/atbd_mod28_v3.pdf page 3-23 and table 3.3.
+        All detectors of a scan latch simultaneously.
+
+        Parameters
+        -----------
+        band: int or str
+            MODIS band to compute the times for. Default: the ideal band, sampled at the granule resolution.
+        tids: bool
+            If True, the times are added to self.data as STARE temporal index values ('tids'),
+            otherwise as datetime64[ms] ('ts').
+        forward_res: int. Valid range is 0..48
+            The forward resolution of the TIDs
+        reverse_res: int. Valid range is 0..48
+            The reverse resolution of the TIDs
+        """
+        if band is None:
+            f_band = 0
+            f_offset = FRAME_OFFSETS[self.nom_res]
+            n_samples = N_SAMPLES[self.nom_res]
         else:
-            resample_factor_along = 10
-            resample_factor_across = None
-            t_latch_ijk = numpy.zeros([203,1354],dtype=ev_type)
-            t_latch_ijk[:] = t_latch_0k[:] + 0.0 # need to add t_ovvsetj[j] but what j to use?
+            band_res = BAND_RESOLUTIONS.get(band, '1km')
+            f_band = BAND_FRAMES[band]
+            f_offset = FRAME_OFFSETS[band_res]
+            n_samples = N_SAMPLES[band_res]
+        n_detectors = N_DETECTORS[self.nom_res]
+
+        ds = self.hdf.select('EV start time')
+        t_0 = numpy.ma.masked_less(self.read_rows(ds, factor=n_detectors), 0)
+        if t_0.count() == 0:
+            raise ValueError('{} has no valid EV start time'.format(self.file_path))
+
+        # Converting the TAI93 scan start times to UTC; only the scan starts go through astropy.
+        # Missing scans get the time of a valid scan so they do not widen the span of times to convert
+        scan_start = TAI93_EPOCH.tai + astropy.time.TimeDelta(t_0.filled(t_0.min()), format='sec')
+        scan_start = scan_start.utc.datetime64.astype('datetime64[us]').astype(numpy.int64) / 1000
+
+        # Offsets of the samples of a scan in ms
+        frames = numpy.arange(N_FRAMES * n_samples) / n_samples
+        offsets = T_FRAME * (frames - F_30 + f_band - f_offset) * 1000
+
+        ms = numpy.rint(scan_start[:, None] + offsets[None, :]).astype(numpy.int64)
+        ms = ms.repeat(n_detectors, axis=0)
+        ms = self.trim_rows(ms, factor=n_detectors)
+        mask = self.trim_rows(numpy.ma.getmaskarray(t_0).repeat(n_detectors), factor=n_detectors)
+
+        if tids:
+            times = starepandas.tools.temporal_conversions.tivs_from_ms_since_epoch(ms, forward_res, reverse_res)
+            name = 'tids'
+        else:
+            times = ms.astype('datetime64[ms]')
+            name = 'ts'
+        if mask.any():
+            times = numpy.ma.masked_array(times, numpy.broadcast_to(mask[:, None], times.shape))
+        self.data[name] = times
 
-        t_ = t_latch_0k.repeat(resample_factor_along,axis=0)
-        if resample_factor_across is not None:
-            t_ = t_latch_0k.repeat(resample_factor_across,axis=1)        
-        self.data['t_'] = t_  # not a good variable name!
-        return
 
 class Mod05(Modis):
 
@@ -360,6 +389,9 @@ class Mod09GA(Modis):
     def read_latlon(self):
         pass
 
+    def n_rows(self):
+        return self.hdf.select('sur_refl_b01_1').info()[2][0]
+
     def read_data(self):
         # Note: those are the 500 m observations!
         dataset_names = ['sur_refl_b01_1', 'sur_refl_b02_1', 'sur_refl_b03_1', 'sur_refl_b04_1', 'sur_refl_b05_1',
@@ -370,7 +402,8 @@ class Mod09GA(Modis):
 
 def decode_state(state_series):
     """
-    Decode the state
+    Decode the state into the fields of :data:`~bitfields.MOD09_STATE`: categorical cloud, land_water, aerosol
+    and cirrus columns and bool flag columns.
 
     15  internal snow algorithm flag     1: yes; 0: no
     14  Salt pan                         1: yes; 0: no
@@ -392,18 +425,14 @@ def decode_state(state_series):
     0-1 cloud state                     00: clear; 01: cloudy; 10: mixed; 11: not set assumed clear
     """
 
-    state = state_series.apply(lambda x: '{:016b}'.format(x)[::-1])
-    df = starepandas.STAREDataFrame(index=state.index)
-    df['cloud'] = state.str.slice(start=0, stop=2).apply(lambda x: x[::-1])
-    df['cloud_shadow'] = state.str.slice(start=2, stop=3).astype('u1').astype(bool)
-    df['cloud_internal'] = state.str.slice(start=10, stop=11).astype('u1').astype(bool)
-    df['snow_mod35'] = state.str.slice(start=12, stop=13).astype('u1').astype(bool)
-    df['snow_internal'] = state.str.slice(start=15, stop=16).astype('u1').astype(bool)
-    return df
+    return starepandas.STAREDataFrame(decode_bitfields(state_series, MOD09_STATE))
 
 
 def decode_qa(qa_series):
     """
+    Returns the MODLAND QA bits of the (non-NA) band QA values as a uint8 series named 'modland'.
+    C.f. :data:`~bitfields.MOD09_BAND_QA` for the other fields.
+
         31      adjacency correction performed      1: yes; 0: no
         30      atmospheric correction performed    1: yes; 0: no
         26-29   band 7 data quality four bit range
@@ -429,12 +458,9 @@ def decode_qa(qa_series):
             3: other reasons some or all bands may be fill value
         Note that a value of (11) overrides a value of (01).";
     """
-    qa = qa_series[qa_series.isna() == False]
-    qa = qa.apply(lambda x: '{:032b}'.format(x)[::-1])
-    qa = qa.str.slice(start=0, stop=2)
-    qa = qa.apply(lambda x: x[::-1]).astype('u1')
-    qa = qa.rename('modland')
-    return qa
+    qa = qa_series[qa_series.notna()]
+    modland = decode_bitfields(qa.to_numpy(dtype=numpy.int64), {'modland': MOD09_BAND_QA['modland']})['modland']
+    return pandas.Series(modland, index=qa.index, name='modland')
 
 
 def read_mod09(file_path, roi_sids):
@@ -443,6 +469,7 @@ def read_mod09(file_path, roi_sids):
     mod09.read_data_500m()
     mod09.read_sidecar_index()
     mod09.read_sidecar_latlon()
+    mod09.close()
     mod09.read_timestamps()
 
     # Adding the QA State flag
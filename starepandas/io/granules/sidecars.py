@@ -0,0 +1,239 @@
+import glob
+import os
+import re
+import netCDF4
+import numpy
+import pystare
+import starepandas
+from starepandas.io.granules.granule import sidecar_name
+
+
+# The lowest 5 bits of a SID hold its level; the trixel of a level L SID is held in the bits above 59 - 2 * L
+LEVEL_BITS = 31
+
+
+def trixel_bit(level):
+    """ Returns the lowest bit of the trixel (path) bits of SIDs of level."""
+    return 59 - 2 * level
+
+
+class CoverCompressor:
+    """ Compresses the SIDs of a granule into a STARE cover block by block.
+
+    Each block of SIDs is merged into the cover of the previous blocks: duplicate SIDs and SIDs contained in
+    coarser SIDs are dropped, and SIDs whose 3 siblings are in the cover as well are replaced by their parent.
+    This works on the bits of the SIDs alone, so that the cost of a block only depends on its size
+    and the size of the cover.
+
+    Examples
+    ----------
+    >>> import pystare
+    >>> sids = pystare.from_latlon([10, 10, 11], [20, 20.5, 20], 6)
+    >>> compressor = CoverCompressor()
+    >>> compressor.add(sids)
+    >>> len(compressor.cover)
+    2
+    >>> # A level 4 SID containing the first two SIDs
+    >>> compressor.add(pystare.spatial_clear_to_resolution(pystare.spatial_coerce_resolution(sids[:1], 4)))
+    >>> pystare.spatial_resolution(compressor.cover)
+    array([4, 6])
+    """
+
+    def __init__(self):
+        self.cover = numpy.array([], dtype=numpy.int64)
+
+    def add(self, sids):
+        sids = numpy.concatenate([self.cover, numpy.asarray(sids, dtype=numpy.int64).ravel()])
+        self.cover = self.merge_siblings(self.prune(sids))
+
+    @staticmethod
+    def prune(sids):
+        """ Drops duplicate SIDs and SIDs contained in other SIDs."""
+        sids = numpy.unique(sids)
+        location = sids & ~LEVEL_BITS
+        level = sids & LEVEL_BITS
+        upper = location | (((numpy.int64(1) << trixel_bit(level)) - 1) & ~LEVEL_BITS)
+        # Containing SIDs sort before the SIDs they contain
+        order = numpy.lexsort((level, location))
+        sids, location, upper = sids[order], location[order], upper[order]
+        keep = numpy.ones(sids.size, dtype=bool)
+        keep[1:] = location[1:] > numpy.maximum.accumulate(upper)[:-1]
+        return sids[keep]
+
+    @staticmethod
+    def merge_siblings(sids):
+        """ Replaces every complete set of 4 sibling SIDs by their parent, from the finest level up."""
+        for level in range(27, 0, -1):
+            at_level = (sids & LEVEL_BITS) == level
+            if numpy.count_nonzero(at_level) < 4:
+                continue
+            children = sids[at_level]
+            parents = (children & ~LEVEL_BITS & ~(numpy.int64(3) << trixel_bit(level))) | (level - 1)
+            unique_parents, counts = numpy.unique(parents, return_counts=True)
+            complete = unique_parents[counts == 4]
+            if complete.size == 0:
+                continue
+            merged = numpy.isin(parents, complete)
+            sids = numpy.concatenate([sids[~at_level], children[~merged], complete])
+        return numpy.sort(sids)
+
+
+def is_up_to_date(sidecar_path, granule_path):
+    """ Whether the sidecar exists and is at least as recent as its granule."""
+    try:
+        return os.path.getmtime(sidecar_path) >= os.path.getmtime(granule_path)
+    except OSError:
+        return False
+
+
+def build_sidecar(granule_path, sidecar_path=None, level=None, nom_res=None, cover_res=None, rows_per_block=256,
+                  latlon=True, overwrite=False, zlib=True, complevel=4):
+    """ Builds the STARE sidecar of a granule from its geolocation.
+
+    Only the geolocation of the granule is read (:meth:`~starepandas.io.granules.granule.Granule.read_latlon`).
+    The SIDs are looked up and written in blocks of rows_per_block scan lines into chunked, compressed variables,
+    so that only one block of SIDs is held in memory.
+    The STARE cover is compressed block by block with a :class:`CoverCompressor`.
+    The sidecar is written to a temporary file first and moved into place when complete.
+
+    Parameters
+    -----------
+    granule_path: str
+        path of the granule
+    sidecar_path: str
+        path of the sidecar. Default: the granule path with the extension replaced by '_stare.nc'
+    level: int
+        STARE level of the SIDs. Default: adapted to the resolution of the geolocation
+    nom_res: str
+        nominal resolution passed to the granule loader; also the suffix of the variable names
+    cover_res: int
+        resolution the SIDs are coerced to for the cover. Default: the resolution of the SIDs
+    rows_per_block: int
+        scan lines per block and per chunk of the variables
+    latlon: bool
+        if True, the geolocation is written to the sidecar as well
+    overwrite: bool
+        if False, sidecars at least as recent as their granule are not rebuilt
+    zlib: bool
+        toggle zlib compression of the variables
+    complevel: int
+        zlib compression level
+
+    Returns
+    --------
+    sidecar_path: str
+        the path of the built sidecar; None if the sidecar was up to date
+    """
+    if sidecar_path is None:
+        sidecar_path = sidecar_name(granule_path)
+    if not overwrite and is_up_to_date(sidecar_path, granule_path):
+        return None
+
+    granule = starepandas.io.granules.granule_factory(granule_path, nom_res=nom_res)
+    granule.read_latlon()
+    if granule.lat is None:
+        raise ValueError('{} has no geolocation to build a sidecar from'.format(granule_path))
+
+    suffix = '_{}'.format(granule.nom_res) if granule.nom_res else ''
+    i, j = granule.lat.shape
+    chunks = [min(rows_per_block, i), j]
+    tmp_path = starepandas.staredataframe.temporary_path(sidecar_path)
+    try:
+        with netCDF4.Dataset(tmp_path, 'w', format='NETCDF4') as root_group:
+            root_group.createDimension('i', i)
+            root_group.createDimension('j', j)
+            sids_netcdf = root_group.createVariable('STARE_index{}'.format(suffix), 'u8', ('i', 'j'),
+                                                    chunksizes=chunks, shuffle=True, zlib=zlib, complevel=complevel)
+            sids_netcdf.long_name = 'SpatioTemporal Adaptive Resolution Encoding (STARE) index'
+            if latlon:
+                lat_netcdf = root_group.createVariable('Latitude{}'.format(suffix), 'f8', ('i', 'j'),
+                                                       chunksizes=chunks, shuffle=True, zlib=zlib, complevel=complevel)
+                lon_netcdf = root_group.createVariable('Longitude{}'.format(suffix), 'f8', ('i', 'j'),
+                                                       chunksizes=chunks, shuffle=True, zlib=zlib, complevel=complevel)
+
+            compressor = CoverCompressor()
+            for start in range(0, i, rows_per_block):
+                stop = min(start + rows_per_block, i)
+                # With level None, the level of each SID is adapted to the geolocation of its block
+                lat, lon = granule.lat[start:stop], granule.lon[start:stop]
+                if level is None:
+                    block = pystare.from_latlon_2d(lat=lat, lon=lon, adapt_level=True)
+                else:
+                    block = pystare.from_latlon_2d(lat=lat, lon=lon, level=level)
+                sids_netcdf[start:stop] = block
+                if latlon:
+                    lat_netcdf[start:stop] = lat
+                    lon_netcdf[start:stop] = lon
+                block = block.flatten()
+                if cover_res is not None:
+                    block = pystare.spatial_coerce_resolution(block, cover_res)
+                # The compressor merges siblings by their trixel bits, which requires cleared SIDs
+                compressor.add(pystare.spatial_clear_to_resolution(block))
+
+            cover = compressor.cover
+            root_group.createDimension('l', cover.size)
+            cover_netcdf = root_group.createVariable('STARE_cover', 'u8', ('l',), chunksizes=[max(cover.size, 1)],
+                                                     shuffle=True, zlib=zlib, complevel=complevel)
+            cover_netcdf.long_name = 'SpatioTemporal Adaptive Resolution Encoding (STARE) cover'
+            cover_netcdf[:] = cover
+        os.replace(tmp_path, sidecar_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sidecar_path
+
+
+def build_sidecars(folder, product='', level=None, num_workers=None, errors='warn', failures=None, **kwargs):
+    """ Builds the STARE sidecars of all granules of a product in a folder in parallel processes.
+
+    Granules whose sidecar is at least as recent as the granule are skipped (unless overwrite=True is passed),
+    so that an interrupted backfill can simply be restarted.
+
+    Parameters
+    -----------
+    folder: str
+        folder containing the granules
+    product: str
+        leading part of the names of the granules, e.g. 'MOD05_L2' or 'VNP03MOD'. Default: all supported granules
+    level: int
+        STARE level of the SIDs. Default: adapted to the resolution of the geolocation
+    num_workers: int
+        number of worker processes. Default: the number of CPUs
+    errors: str
+        how to handle granules whose sidecar cannot be built: 'raise', 'warn' (default), or 'ignore'
+        (c.f. :func:`~starepandas.read_granules`).
+    failures: list
+        if given, a (path, exception) tuple is appended for every granule whose sidecar could not be built.
+    kwargs:
+        passed on to :func:`build_sidecar`, e.g. nom_res, cover_res or overwrite
+
+    Returns
+    --------
+    sidecar_paths: list
+        paths of the built sidecars
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> starepandas.build_sidecars('granules/', product='MOD05_L2', num_workers=32, nom_res='5km')
+    """
+    if errors not in ['raise', 'warn', 'ignore']:
+        raise ValueError('build_sidecars argument errors="%s" not understood.' % errors)
+    paths = []
+    for path in sorted(glob.glob(os.path.join(folder, '{}*'.format(product)))):
+        if path.endswith('_stare.nc') or not os.path.isfile(path):
+            continue
+        loaders = starepandas.io.granules.granule_factory_library
+        if not any(re.search(regex, path, re.IGNORECASE) for regex in loaders):
+            continue
+        paths.append(path)
+    if not kwargs.get('overwrite', False):
+        paths = [path for path in paths if not is_up_to_date(sidecar_name(path), path)]
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    sidecar_paths = starepandas.io.granules._map_granules(build_sidecar, paths, num_workers=num_workers,
+                                                          errors=errors, failures=failures,
+                                                          message='Building the sidecar of %s failed: %r',
+                                                          level=level, **kwargs)
+    return sorted(sidecar_paths)
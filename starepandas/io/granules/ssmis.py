@@ -114,13 +114,7 @@ class SSMIS(Granule):
     def read_sidecar_latlon(self, sidecar_path=None):
         self.lat = {}
         self.lon = {}
-        if sidecar_path is not None:
-            scp = sidecar_path
-        elif self.sidecar_path is not None:
-            scp = self.sidecar_path
-        else:
-            scp = self.guess_sidecar_path()
-        ds = starepandas.io.s3.nc4_dataset_wrapper(scp)
+        ds = self.open_sidecar(sidecar_path)
 
         for scan in self.scans:
             self.lat[scan] = ds[scan]['Latitude'][:].astype(numpy.double)
@@ -128,24 +122,12 @@ class SSMIS(Granule):
 
     def read_sidecar_index(self, sidecar_path=None):
         self.sids = {}
-        if sidecar_path is not None:
-            scp = sidecar_path
-        elif self.sidecar_path is not None:
-            scp = self.sidecar_path
-        else:
-            scp = self.guess_sidecar_path()
-        ds = starepandas.io.s3.nc4_dataset_wrapper(scp)
+        ds = self.open_sidecar(sidecar_path)
         for scan in self.scans:
             self.sids[scan] = ds[scan]['STARE_index'][:, :].astype(numpy.int64)
 
     def read_sidecar_cover(self, sidecar_path=None):
-        if sidecar_path is not None:
-            scp = sidecar_path
-        elif self.sidecar_path is not None:
-            scp = self.sidecar_path
-        else:
-            scp = self.guess_sidecar_path()
-        ds = starepandas.io.s3.nc4_dataset_wrapper(scp)
+        ds = self.open_sidecar(sidecar_path)
         self.stare_cover = ds['STARE_cover'][:].astype(numpy.int64)
 
     def to_df(self, xy=False):
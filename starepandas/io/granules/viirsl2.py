@@ -1,13 +1,16 @@
 from starepandas.io.granules.granule import Granule
 import starepandas.io.s3
 import numpy
-from starepandas.io.granules.modis import Modis
+from starepandas.io.granules.modis import Modis, scale
+from starepandas.io.granules.bitfields import decode_bitfields, VNP09_QF1, VNP09_QF2, CLDMSK_BYTE0
 import datetime
 import pystare
 
 
 class VIIRSL2(Granule):
 
+    windowed = True
+
     def __init__(self, file_path, sidecar_path=None, nom_res='750m'):
         super().__init__(file_path, sidecar_path, nom_res=nom_res)
         self.netcdf = starepandas.io.s3.nc4_dataset_wrapper(self.file_path, 'r', format='NETCDF4')
@@ -17,8 +20,11 @@ class VIIRSL2(Granule):
         self.ts_end = self.netcdf.time_coverage_end
 
     def read_latlon(self):
-        self.lat = self.netcdf.groups['geolocation_data']['latitude'][:].astype(numpy.double)
-        self.lon = self.netcdf.groups['geolocation_data']['longitude'][:].astype(numpy.double)
+        self.lat = self.read_rows(self.netcdf.groups['geolocation_data']['latitude']).astype(numpy.double)
+        self.lon = self.read_rows(self.netcdf.groups['geolocation_data']['longitude']).astype(numpy.double)
+
+    def n_rows(self):
+        return self.netcdf.groups['geolocation_data']['latitude'].shape[0]
 
 
 class VNP03DNB(VIIRSL2):
@@ -40,9 +46,9 @@ class VNP03DNB(VIIRSL2):
         """
 
         group = self.netcdf.groups['geolocation_data']
-        self.data['moon_illumination_fraction'] = group['moon_illumination_fraction'][:]
-        self.data['land_water_mask'] = group['land_water_mask'][:]
-        self.data['quality_flag'] = group['quality_flag'][:]
+        self.data['moon_illumination_fraction'] = self.read_rows(group['moon_illumination_fraction'])
+        self.data['land_water_mask'] = self.read_rows(group['land_water_mask'])
+        self.data['quality_flag'] = self.read_rows(group['quality_flag'])
 
 
 class VNP03MOD(VIIRSL2):
@@ -55,13 +61,13 @@ class VNP03MOD(VIIRSL2):
         reads the data from a VNP03MOD granule into the self.data dictionary.
         """
 
-        self.data['land_water_mask'] = self.netcdf.groups['geolocation_data']['land_water_mask'][:]
-        self.data['quality_flag'] = self.netcdf.groups['geolocation_data']['quality_flag'][:]
+        self.data['land_water_mask'] = self.read_rows(self.netcdf.groups['geolocation_data']['land_water_mask'])
+        self.data['quality_flag'] = self.read_rows(self.netcdf.groups['geolocation_data']['quality_flag'])
 
-        self.data['sensor_azimuth'] = self.netcdf.groups['geolocation_data']['sensor_azimuth'][:]
-        self.data['sensor_zenith'] = self.netcdf.groups['geolocation_data']['sensor_zenith'][:]
-        self.data['solar_azimuth'] = self.netcdf.groups['geolocation_data']['solar_azimuth'][:]
-        self.data['solar_zenith'] = self.netcdf.groups['geolocation_data']['solar_zenith'][:]
+        self.data['sensor_azimuth'] = self.read_rows(self.netcdf.groups['geolocation_data']['sensor_azimuth'])
+        self.data['sensor_zenith'] = self.read_rows(self.netcdf.groups['geolocation_data']['sensor_zenith'])
+        self.data['solar_azimuth'] = self.read_rows(self.netcdf.groups['geolocation_data']['solar_azimuth'])
+        self.data['solar_zenith'] = self.read_rows(self.netcdf.groups['geolocation_data']['solar_zenith'])
 
         self.read_latlon()
         # self.read_timestamps()
@@ -80,14 +86,17 @@ class VNP02DNB(VIIRSL2):
         self.companion_prefix = 'VNP03DNB'
 
     def read_data(self):
-        dnb = self.netcdf.groups['observation_data']['DNB_observations'][:]
-        quality_flags = self.netcdf.groups['observation_data']['DNB_quality_flags'][:]
+        dnb = self.read_rows(self.netcdf.groups['observation_data']['DNB_observations'])
+        quality_flags = self.read_rows(self.netcdf.groups['observation_data']['DNB_quality_flags'])
         self.data['DNB_observations'] = dnb
         self.data['DNB_quality_flags'] = quality_flags
 
     def read_latlon(self):
         pass
 
+    def n_rows(self):
+        return self.netcdf.groups['observation_data']['DNB_observations'].shape[0]
+
 
 class VNP02MOD(VIIRSL2):
     pass
@@ -111,7 +120,21 @@ class CLDMSKL2VIIRS(VIIRSL2):
         :return: None
         """
 
-        self.data['Integer_Cloud_Mask'] = self.netcdf.groups['geophysical_data']['Integer_Cloud_Mask'][:]
+        self.data['Integer_Cloud_Mask'] = self.read_rows(self.netcdf.groups['geophysical_data']['Integer_Cloud_Mask'])
+
+    def read_cloud_mask(self):
+        """
+        reads the first byte of the Cloud_Mask and decodes it into the fields of
+        :data:`~bitfields.CLDMSK_BYTE0` (e.g. cloud, day, snow_ice_free, land_water), which are added
+        to the self.data dictionary. Categorical fields hold their codes.
+
+        :return: None
+        """
+        cloud_mask = self.netcdf.groups['geophysical_data']['Cloud_Mask']
+        start, stop = self.window if self.window is not None else (None, None)
+        # The bytes are the first dimension of the Cloud_Mask
+        byte0 = cloud_mask[0, start:stop]
+        self.data.update(decode_bitfields(byte0, CLDMSK_BYTE0))
 
         # There appear to be 10 QA dimensions which are nowhere documented. Leaving this open for now
         # Cloud Mask QA (1km) Bit 1: 0 not useful 1 useful. Bit 2-7: confidence levels
@@ -146,30 +169,31 @@ class VNP09(Modis):
         for dataset_name in datasets:
             self.read_dataset(dataset_name=dataset_name, resample_factor=None)
 
-    def read_dataset(self, dataset_name, resample_factor=None):
+    def read_dataset(self, dataset_name, resample_factor=None, dtype=None):
         ds = self.hdf.select(dataset_name)
-        data = ds.get()
-        dtype = data.dtype
-        if resample_factor is not None:
-            data = self.resample(array=data, factor=resample_factor)
+        factor = resample_factor or 1
+        if self.window is None:
+            data = ds.get()
+        else:
+            data = self.read_rows(ds, factor=factor)
 
         attributes = ds.attributes()
+        if 'Scale' in attributes.keys():
+            dtype = numpy.dtype(dtype or self.scale_dtype)
 
+        mask = None
         if 'FILL_VALUES' in attributes.keys():
             # fill_values = attributes['FILL_VALUES']
-            mask = data < 0
-            data = numpy.ma.array(data, mask=mask)
+            mask = self.resample_mask(data < 0, factor)
+        data = self.trim_rows(self.resample(data, factor, dtype=dtype), factor)
 
         if 'Scale' in attributes.keys():
             # why would you name it "Scale" in VNP09 and "scal_factor" in MOD09. Also ... those are floats.
             scale_factor = attributes['Scale']
             scale_factor = 10000
-            if scale_factor < 1:
-                # This is insane
-                data = data * scale_factor
-            else:
-                data = data / scale_factor
-
+            scale(data, scale_factor)
+        if mask is not None:
+            data = numpy.ma.array(data, mask=mask)
         self.data[dataset_name] = data
 
     def read_timestamps(self):
@@ -185,6 +209,8 @@ class VNP09(Modis):
 
 def decode_qf1(qf):
     """
+    Decodes the QF1 series into the columns of :data:`~bitfields.VNP09_QF1`.
+
     Bits are listed from the MSB (bit 7) to the LSB (bit 0):
     6-7    SUN GLINT
        00 -- none
@@ -208,15 +234,13 @@ def decode_qf1(qf):
        10 -- medium\n\t
        11 -- high\n";
     """
-    qf = qf.apply(lambda x: '{:08b}'.format(x))
-    df = starepandas.STAREDataFrame(index=qf.index)
-    df['cloud_mask_quality'] = qf.str.slice(start=-2)
-    df['cloud'] = qf.str.slice(start=-4, stop=-2)
-    return df
+    return starepandas.STAREDataFrame(decode_bitfields(qf, VNP09_QF1))
 
 
 def decode_qf2(qf):
     """
+    Decodes the QF2 series into the columns of :data:`~bitfields.VNP09_QF2`.
+
     Bits are listed from the MSB (bit 7) to the LSB (bit 0):\
     7      thin cirrus emissive;
            0 -- no cloud
@@ -240,11 +264,7 @@ def decode_qf2(qf):
            011 -- sea water\n\t
            101 -- coastal\n";
     """
-    qf = qf.apply(lambda x: '{:08b}'.format(x))
-    df = starepandas.STAREDataFrame(index=qf.index)
-    df['land_water'] = qf.str.slice(start=-3)
-    df['shadow'] = qf.str.slice(start=-3, stop=-4).astype(bool)
-    return df
+    return starepandas.STAREDataFrame(decode_bitfields(qf, VNP09_QF2))
 
 
 def read_vnp09(file_path,
@@ -262,7 +282,6 @@ def read_vnp09(file_path,
 
     # Read the VNP09
     vnp09 = VNP09(file_path, nom_res=nom_res)
-    vnp09.read_data()
 
     # Getting the geolocation info
     if nom_res == '750m':
@@ -270,6 +289,15 @@ def read_vnp09(file_path,
     elif nom_res == '375m':
         vnp03_path = vnp09.guess_companion_path(prefix='VNP03IMG', folder=companion_folder)
     vnp03 = starepandas.io.granules.VNP03MOD(vnp03_path)
+
+    # Only reading the scan lines intersecting the ROI
+    if roi_sids is not None and sidecar:
+        if not vnp03.set_roi(roi_sids, sidecar_path):
+            return None
+        vnp09.window = vnp03.window
+        vnp09.roi_mask = vnp03.roi_mask
+
+    vnp09.read_data()
     vnp03.read_data()
 
     if read_timestamp:
@@ -281,8 +309,9 @@ def read_vnp09(file_path,
         else:
             vnp03.read_latlon()
 
-    if sidecar:
+    if sidecar and vnp03.window is None:
         vnp03.read_sidecar_index(sidecar_path)
+    vnp03.close()
 
     # Converting to DF and joining
     vnp09 = vnp09.to_df(xy=xy)
@@ -295,7 +324,7 @@ def read_vnp09(file_path,
     vnp09 = vnp09.join(qf1).join(qf2)
 
     # Subsetting
-    if roi_sids is not None:
+    if roi_sids is not None and vnp03.roi_mask is None:
         try:
             vnp09 = starepandas.speedy_subset(vnp09, roi_sids)
         except:
@@ -0,0 +1,255 @@
+import json
+import numpy
+import os
+import pandas
+import pyarrow.parquet
+import pystare
+import re
+import sqlite3
+import starepandas.io.pod
+
+MANIFEST_NAME = 'manifest.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS chunks (
+    path TEXT PRIMARY KEY,
+    pod TEXT NOT NULL,
+    sid INTEGER NOT NULL,
+    chunk TEXT NOT NULL,
+    tid INTEGER,
+    n_rows INTEGER,
+    n_bytes INTEGER,
+    columns TEXT,
+    format TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_sid ON chunks (sid);
+CREATE INDEX IF NOT EXISTS chunks_tid ON chunks (tid);
+'''
+
+MANIFEST_COLUMNS = ['path', 'pod', 'sid', 'chunk', 'tid', 'n_rows', 'n_bytes', 'columns', 'format']
+
+
+def manifest_path(pod_root):
+    return os.path.join(pod_root, MANIFEST_NAME)
+
+
+def has_manifest(pod_root):
+    return os.path.exists(manifest_path(pod_root))
+
+
+def connect(pod_root):
+    """ Opens (and if necessary creates) the manifest of a pod root."""
+    con = sqlite3.connect(manifest_path(pod_root), timeout=60)
+    con.executescript(SCHEMA)
+    return con
+
+
+def pod_sid(pod):
+    """ Converts a pod name (hex string, int string, or int) into its integer SID."""
+    if isinstance(pod, str):
+        return int(pod, 16) if pod.startswith('0x') else int(pod)
+    return int(pod)
+
+
+def chunk_record(pod_root, fname, pod, n_rows, columns, format, tid=None):
+    """ Assembles the manifest record of a freshly written chunk."""
+    return {'path': os.path.relpath(fname, pod_root),
+            'pod': str(pod),
+            'sid': pod_sid(pod),
+            'chunk': os.path.basename(fname),
+            'tid': None if tid is None else int(tid),
+            'n_rows': None if n_rows is None else int(n_rows),
+            'n_bytes': os.path.getsize(fname),
+            'columns': json.dumps([str(c) for c in columns]),
+            'format': format}
+
+
+def update_manifest(pod_root, records, append=False):
+    """ Inserts or updates chunk records in the manifest of pod_root.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory of the STAREPods
+    records: list
+        list of dicts as created by :func:`chunk_record`
+    append: bool
+        if True, the row counts of existing records are incremented rather than replaced
+    """
+    if len(records) == 0:
+        return
+    n_rows = 'chunks.n_rows + excluded.n_rows' if append else 'excluded.n_rows'
+    sql = '''INSERT INTO chunks ({columns}) VALUES ({values})
+             ON CONFLICT(path) DO UPDATE SET n_rows={n_rows}, n_bytes=excluded.n_bytes, tid=excluded.tid,
+             columns=excluded.columns, format=excluded.format'''
+    sql = sql.format(columns=', '.join(MANIFEST_COLUMNS), values=', '.join(['?'] * len(MANIFEST_COLUMNS)),
+                     n_rows=n_rows)
+    con = connect(pod_root)
+    with con:
+        con.executemany(sql, [tuple(r[c] for c in MANIFEST_COLUMNS) for r in records])
+    con.close()
+
+
+def remove_from_manifest(pod_root, paths):
+    """ Removes the records of the chunks at paths (relative to pod_root or absolute) from the manifest."""
+    con = connect(pod_root)
+    with con:
+        con.executemany('DELETE FROM chunks WHERE path = ?',
+                        [(os.path.relpath(p, pod_root) if os.path.isabs(p) else p,) for p in paths])
+    con.close()
+
+
+def replace_in_manifest(pod_root, paths, records):
+    """ Replaces the records of the chunks at paths (relative to pod_root) by records in a single transaction."""
+    con = connect(pod_root)
+    sql = 'INSERT OR REPLACE INTO chunks ({columns}) VALUES ({values})'.format(
+        columns=', '.join(MANIFEST_COLUMNS), values=', '.join(['?'] * len(MANIFEST_COLUMNS)))
+    with con:
+        con.executemany('DELETE FROM chunks WHERE path = ?', [(p,) for p in paths])
+        con.executemany(sql, [tuple(r[c] for c in MANIFEST_COLUMNS) for r in records])
+    con.close()
+
+
+def read_manifest(pod_root):
+    """ Returns the complete manifest of pod_root as a pandas.DataFrame."""
+    con = connect(pod_root)
+    df = pandas.read_sql_query('SELECT * FROM chunks ORDER BY path', con)
+    con.close()
+    return df
+
+
+def query_manifest(pod_root, sids=None, tids=None, pattern=None):
+    """ Looks up the chunks of pod_root matching the query.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory of the STAREPods
+    sids: array-like
+        pod names or SIDs of the pods to look up. Default: all pods
+    tids: array-like
+        STARE temporal index values; only chunks whose TID cover overlaps one of tids are returned.
+    pattern: str
+        regular expression that the chunk paths have to contain
+
+    Returns
+    --------
+    chunks: pandas.DataFrame
+        the manifest records of the matching chunks, with paths relative to pod_root
+    """
+    con = connect(pod_root)
+    if sids is None:
+        chunks = pandas.read_sql_query('SELECT * FROM chunks ORDER BY path', con)
+    else:
+        con.execute('CREATE TEMP TABLE query (sid INTEGER PRIMARY KEY)')
+        con.executemany('INSERT OR IGNORE INTO query VALUES (?)', [(pod_sid(sid),) for sid in sids])
+        chunks = pandas.read_sql_query('SELECT chunks.* FROM chunks JOIN query USING (sid) ORDER BY path', con)
+    con.close()
+
+    if pattern is not None:
+        search = re.compile('.*{pattern}.*'.format(pattern=pattern))
+        chunks = chunks[[search.match(p) is not None for p in chunks['path']]]
+
+    if tids is not None:
+        chunks = chunks[chunks['tid'].notna()]
+        chunk_tids = chunks['tid'].to_numpy(dtype=numpy.int64)
+        overlap = numpy.zeros(len(chunks), dtype=bool)
+        for tid in numpy.array(tids).astype(numpy.int64):
+            query = numpy.full(chunk_tids.shape, fill_value=tid, dtype=numpy.int64)
+            overlap |= pystare.temporal_value_intersection_if_overlap(query, chunk_tids) > 0
+        chunks = chunks[overlap]
+    return chunks.reset_index(drop=True)
+
+
+def stale_pods(pod_root, pods):
+    """ Returns the pods of pods whose directory (or one of whose tpod directories) changed after the manifest.
+
+    Chunks added without updating the manifest, e.g. by write_pods(manifest=False), by code predating the
+    manifest, or by hand, leave their pod (or tpod) directory newer than the manifest. Chunks added within the
+    filesystem's timestamp resolution of the last manifest update are not detected.
+    """
+    manifest_mtime = os.stat(manifest_path(pod_root)).st_mtime_ns
+    stale = []
+    for pod in pods:
+        pod_path = os.path.join(pod_root, str(pod))
+        try:
+            if os.stat(pod_path).st_mtime_ns > manifest_mtime:
+                stale.append(pod)
+                continue
+            with os.scandir(pod_path) as entries:
+                if any(entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime_ns > manifest_mtime
+                       for entry in entries):
+                    stale.append(pod)
+        except FileNotFoundError:
+            continue
+    return stale
+
+
+TID_PATTERN = re.compile('^(?:0x[0-9a-f]{16}_\\d+-)?(0x[0-9a-f]{16})-')
+
+
+def rebuild_manifest(pod_root, read_chunks=True, verbose=False):
+    """ (Re)creates the manifest of an existing pod root from the pods on disk.
+
+    The TID cover of a chunk is parsed from its name if it follows the naming of
+    ``write_pods_granule`` ('{tid}-{chunk_name}') or ``write_pods_tpod``.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory of the STAREPods
+    read_chunks: bool
+        if True, pickled chunks are decoded to record their row count and columns.
+        Parquet and arrow chunks are always inspected through their metadata only.
+    verbose: bool
+
+    Returns
+    --------
+    n_chunks: int
+        the number of chunks recorded
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> starepandas.rebuild_manifest('tests/data/pods/')
+    # 8
+    """
+    records = []
+    for pod_entry in sorted(os.scandir(pod_root), key=lambda e: e.name):
+        if not pod_entry.is_dir():
+            continue
+        try:
+            pod_sid(pod_entry.name)
+        except ValueError:
+            continue
+        for dir_path, _, file_names in os.walk(pod_entry.path):
+            for file_name in sorted(file_names):
+                fname = os.path.join(dir_path, file_name)
+                if file_name.endswith('.tmp') or file_name.startswith('.') or os.path.islink(fname):
+                    # links of chunks spanning several tpods are not chunks of their own, dotfiles are locks
+                    continue
+                if verbose:
+                    print('inspecting ', fname)
+                match = TID_PATTERN.match(file_name)
+                tid = int(match.group(1), 16) if match else None
+                format = starepandas.io.pod.pod_format(fname)
+                if format == 'parquet':
+                    metadata = pyarrow.parquet.read_metadata(fname)
+                    n_rows = metadata.num_rows
+                    columns = metadata.schema.to_arrow_schema().names
+                elif format == 'arrow':
+                    table = starepandas.io.pod.open_arrow(fname)
+                    n_rows = table.num_rows
+                    columns = table.schema.names
+                elif read_chunks:
+                    df = starepandas.io.pod.read_pod(fname, format=format)
+                    n_rows = 0 if df is None else len(df)
+                    columns = [] if df is None else df.columns
+                else:
+                    n_rows, columns = None, []
+                records.append(chunk_record(pod_root, fname, pod_entry.name, n_rows, columns, format, tid))
+
+    if has_manifest(pod_root):
+        os.remove(manifest_path(pod_root))
+    update_manifest(pod_root, records)
+    return len(records)
@@ -1,28 +1,574 @@
 import bz2
+import collections
+import concurrent.futures
+import contextlib
+import functools
 import glob
+import importlib.util
+import io
+import itertools
+import json
+import logging
 import numpy
 import os
 import pandas
 import pickle
-import puremagic
+import pyarrow.compute
+import pyarrow.ipc
+import pyarrow.parquet
 import pystare
 import re
+import tempfile
+import threading
+import time
 import starepandas
+import starepandas.io.manifest
 
-def generic_open(filename):
+PARQUET_MAGIC = b'PAR1'
+ARROW_MAGIC = b'ARROW1'
+
+COMPRESSION_MAGIC = {b'BZh': 'bz2', b'\x28\xb5\x2f\xfd': 'zstd', b'\x04\x22\x4d\x18': 'lz4'}
+
+CODEC_MODULES = {'zstd': 'zstandard', 'lz4': 'lz4.frame'}
+
+
+def compression_method(compress):
+    """ Splits compress into the compression method and level.
+
+    compress is None, a method ('bz2', 'zstd', or 'lz4'), or, as for pandas.to_pickle, a dict like
+    {'method': 'zstd', 'level': 19}. The level is None for the default level of the method.
+    """
+    if isinstance(compress, dict):
+        return compress.get('method'), compress.get('level')
+    return compress, None
+
+
+def import_codec(method):
+    """ Imports the optional package implementing the compression method."""
     try:
-        ext = puremagic.from_file(filename)
-    except puremagic.PureError:
-        return open
-    if ext == '.bz2':
-        return bz2.open
-    elif ext == '.pickle':
-        return open
+        return importlib.import_module(CODEC_MODULES[method])
+    except ImportError:
+        raise ImportError("{} compressed pods require the {} package.".format(method, CODEC_MODULES[method]))
+
+
+def open_compressed(filename, mode='rb', compress=None):
+    """ Opens a pod chunk compressed with compress (c.f. :func:`compression_method`) as a binary file.
+
+    Appending ('ab') adds another compressed stream, which is read as a continuation of the previous ones.
+    """
+    method, level = compression_method(compress)
+    if method is None:
+        return open(filename, mode)
+    elif method == 'bz2':
+        return bz2.open(filename, mode, compresslevel=9 if level is None else level)
+    elif method == 'zstd':
+        zstandard = import_codec(method)
+        f = open(filename, mode)
+        if 'r' in mode:
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+        return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(f)
+    elif method == 'lz4':
+        lz4_frame = import_codec(method)
+        return lz4_frame.open(filename, mode, compression_level=0 if level is None else level)
+    raise ValueError('compress="%s" not understood.' % method)
+
+
+def generic_open(filename):
+    """ Returns a function opening filename, which is detected to be uncompressed, bz2, zstd, or lz4 compressed."""
+    return functools.partial(open_compressed, compress=pod_compression(filename))
+
+
+def pod_compression(filename):
+    """ Returns the compression ('bz2', 'zstd', 'lz4', or None) of a pickled pod chunk from its magic bytes."""
+    with open(filename, 'rb') as f:
+        head = f.read(4)
+    for magic, method in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return method
+    return None
+
+
+def pod_format(filename):
+    """ Guesses the format of a pod chunk ('parquet', 'arrow', or 'pickle') from its magic bytes."""
+    with open(filename, 'rb') as f:
+        head = f.read(len(ARROW_MAGIC))
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if head == ARROW_MAGIC:
+        return 'arrow'
+    return 'pickle'
+
+
+def recorded_sid_column(schema, default='sids'):
+    """ Returns the name of the SID column recorded in the arrow schema of a parquet or arrow chunk."""
+    metadata = schema.metadata or {}
+    return json.loads(metadata.get(b'starepandas', b'{}')).get('sid_column', default)
+
+
+def open_arrow(filename):
+    """ Memory maps an Arrow IPC (Feather v2) chunk and returns its table without reading or copying any columns."""
+    return pyarrow.ipc.open_file(pyarrow.memory_map(filename, 'r')).read_all()
+
+
+def read_pod_pickle(filename):
+    """ Reads all dataframes pickled (and possibly appended) into a pickle chunk."""
+    frames = []
+    with generic_open(filename)(filename, 'rb') as f:
+        while True:
+            try:
+                frames.append(pandas.read_pickle(f))
+            except EOFError:
+                break
+    return frames
+
+
+def temporal_columns(columns, tid_column=None):
+    """ Returns the columns that :func:`tid_mask` compares rows by."""
+    tid_column = starepandas.staredataframe.DEFAULT_TID_COLUMN_NAME if tid_column is None else tid_column
+    if tid_column in columns:
+        return [tid_column]
+    time_columns = [c for c in ['ts_start', 'ts_end'] if c in columns]
+    if time_columns:
+        return time_columns
+    if 'timestamp' in columns:
+        return ['timestamp']
+    raise ValueError('Cannot filter by time: no TID ({}), ts_start/ts_end, or timestamp column'.format(tid_column))
+
+
+def tid_mask(df, filter_tids, tid_column=None):
+    """ Tests which rows of df temporally overlap any of filter_tids.
+
+    Rows are compared by their TIDs if df has a TID column. Otherwise, the interval [ts_start, ts_end]
+    (or the instant in ts_start or timestamp) of the rows is compared to the bounds of filter_tids.
+
+    Parameters
+    -----------
+    df: pandas.DataFrame
+        the rows to test
+    filter_tids: array-like
+        STARE temporal index values
+    tid_column: str
+        name of the TID column. Default: 'tids'
+
+    Returns
+    --------
+    mask: numpy.array
+        boolean array; True for rows overlapping any of filter_tids
+    """
+    filter_tids = numpy.atleast_1d(numpy.asarray(filter_tids, dtype=numpy.int64))
+    columns = temporal_columns(df.columns, tid_column)
+    mask = numpy.zeros(len(df), dtype=bool)
+    if len(df) == 0:
+        return mask
+
+    if len(columns) == 1 and not pandas.api.types.is_datetime64_any_dtype(df[columns[0]].dtype):
+        row_tids, inverse = numpy.unique(df[columns[0]].to_numpy(dtype=numpy.int64), return_inverse=True)
+        overlap = numpy.zeros(len(row_tids), dtype=bool)
+        for tid in filter_tids:
+            query = numpy.full(row_tids.shape, fill_value=tid, dtype=numpy.int64)
+            overlap |= pystare.temporal_value_intersection_if_overlap(query, row_tids) > 0
+        return overlap[inverse]
+
+    start = df[columns[0]].to_numpy(dtype='datetime64[ms]')
+    end = df[columns[-1]].to_numpy(dtype='datetime64[ms]')
+    lower = pystare.to_ms_since_epoch_utc(pystare.lower_bound_ms(filter_tids)).astype('datetime64[ms]')
+    upper = pystare.to_ms_since_epoch_utc(pystare.upper_bound_ms(filter_tids)).astype('datetime64[ms]')
+    for lo, hi in zip(lower, upper):
+        mask |= (start <= hi) & (end >= lo)
+    return mask
+
+
+def sid_bounds(sids):
+    """ Returns the (inclusive) range of SID values that can intersect sids.
+
+    As for :func:`starepandas.speedy_subset`, the SIDs tested against the range are assumed to be at least
+    as fine as sids.
+
+    Parameters
+    -----------
+    sids: array-like
+        a set of SIDs, e.g. an ROI cover
+
+    Returns
+    --------
+    sid_range: tuple
+        (sid_min, sid_max)
+    """
+    sids = numpy.asarray(sids, dtype=numpy.int64)
+    top_bound = pystare.spatial_clear_to_resolution(sids.max())
+    top_bound += pystare.spatial_increment_from_level(pystare.spatial_resolution(top_bound))
+    return int(sids.min()), int(top_bound)
+
+
+def prune_row_groups(metadata, sid_column, sid_range):
+    """ Returns the indices of the row groups whose SID statistics overlap sid_range.
+
+    Parameters
+    -----------
+    metadata: pyarrow.parquet.FileMetaData
+        the metadata of a parquet chunk
+    sid_column: str
+        name of the SID column
+    sid_range: tuple
+        (sid_min, sid_max), inclusive
+
+    Returns
+    --------
+    row_groups: list
+        indices of the row groups that may contain SIDs within sid_range
+    """
+    sid_min, sid_max = sid_range
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        keep = True
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            if column.path_in_schema != sid_column:
+                continue
+            stats = column.statistics
+            if stats is not None and stats.has_min_max:
+                keep = stats.max >= sid_min and stats.min <= sid_max
+        if keep:
+            row_groups.append(i)
+    return row_groups
+
+
+def read_pod_parquet(filename, columns=None, sid_range=None, sid_column=None, filter_sids=None, filter_tids=None,
+                     tid_column=None):
+    """ Reads a parquet chunk, projecting columns and pruning row groups by SID range.
+
+    Parameters
+    -----------
+    filename: str
+        path to the chunk
+    columns: list
+        columns to read. Default: all columns
+    sid_range: tuple
+        (sid_min, sid_max); only row groups whose SID statistics overlap the range are read and only rows
+        with sid_min <= sid <= sid_max are returned.
+    sid_column: str
+        name of the SID column. Defaults to the name recorded when the chunk was written.
+    filter_sids: array-like
+        only rows with SIDs intersecting filter_sids are returned.
+    filter_tids: array-like
+        only rows temporally overlapping one of filter_tids are returned (c.f. :func:`tid_mask`).
+    tid_column: str
+        name of the TID column
+
+    Returns
+    --------
+    df: pandas.DataFrame
+    """
+    pf = pyarrow.parquet.ParquetFile(filename)
+    if sid_column is None:
+        sid_column = recorded_sid_column(pf.schema_arrow)
+
+    if filter_sids is not None and sid_range is None:
+        sid_range = sid_bounds(filter_sids)
+
+    row_groups = list(range(pf.num_row_groups))
+    filter_columns = []
+    if sid_range is not None:
+        row_groups = prune_row_groups(pf.metadata, sid_column, sid_range)
+        filter_columns.append(sid_column)
+    if filter_tids is not None:
+        filter_columns += temporal_columns(pf.schema_arrow.names, tid_column)
+    read_columns = columns
+    if columns is not None:
+        read_columns = list(columns) + [c for c in dict.fromkeys(filter_columns) if c not in columns]
+
+    table = pf.read_row_groups(row_groups, columns=read_columns)
+    pf.close()
+    if sid_range is not None:
+        sids = table.column(sid_column)
+        mask = pyarrow.compute.and_(pyarrow.compute.greater_equal(sids, sid_range[0]),
+                                    pyarrow.compute.less_equal(sids, sid_range[1]))
+        table = table.filter(mask)
+    if filter_sids is not None:
+        sids = table.column(sid_column).to_numpy()
+        table = table.filter(pyarrow.array(starepandas.speedy_intersects(sids, filter_sids)))
+    if filter_tids is not None:
+        times = table.select(temporal_columns(table.schema.names, tid_column)).to_pandas()
+        table = table.filter(pyarrow.array(tid_mask(times, filter_tids, tid_column)))
+    df = table.to_pandas()
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def read_pod_arrow(filename, columns=None, sid_range=None, sid_column=None, filter_sids=None, filter_tids=None,
+                   tid_column=None):
+    """ Reads an Arrow IPC (Feather v2) chunk through a memory map.
+
+    Nothing is decoded: the numeric (including SID) columns of the returned frame are read-only views of the
+    mapped file, so that only the pages that are touched are read from disk, and repeated reads are served
+    from the page cache. Arrow chunks are SID sorted; sid_range (and the bounds of filter_sids) are
+    located by binary search and slice the views without copying. Only the masks of filter_sids and filter_tids
+    copy the selected rows.
+
+    C.f. :func:`read_pod_parquet` for the parameters.
+
+    Returns
+    --------
+    df: pandas.DataFrame
+    """
+    table = open_arrow(filename)
+    if sid_column is None:
+        sid_column = recorded_sid_column(table.schema)
+    if filter_sids is not None and sid_range is None:
+        sid_range = sid_bounds(filter_sids)
+
+    if sid_range is not None:
+        sids = table.column(sid_column).to_numpy()
+        start = numpy.searchsorted(sids, sid_range[0], side='left')
+        stop = numpy.searchsorted(sids, sid_range[1], side='right')
+        table = table.slice(start, stop - start)
+    if filter_sids is not None:
+        sids = table.column(sid_column).to_numpy()
+        table = table.filter(pyarrow.array(starepandas.speedy_intersects(sids, filter_sids)))
+    if filter_tids is not None:
+        times = table.select(temporal_columns(table.schema.names, tid_column)).to_pandas()
+        table = table.filter(pyarrow.array(tid_mask(times, filter_tids, tid_column)))
+    if columns is not None:
+        table = table.select(list(columns))
+    return table.to_pandas(split_blocks=True)
+
+
+def read_pod(filename, columns=None, format=None, sid_range=None, sid_column=None, filter_sids=None,
+             filter_tids=None, tid_column=None):
+    """ Reads a single pod chunk.
+
+    Parameters
+    -----------
+    filename: str
+        path to the chunk
+    columns: list
+        columns to read. Default: all columns
+    format: str
+        'pickle', 'parquet', or 'arrow'. Guessed from the magic bytes of the chunk if None.
+    sid_range: tuple
+        (sid_min, sid_max); only rows with sid_min <= sid <= sid_max are returned.
+        Parquet chunks skip row groups outside of the range without decoding them.
+    sid_column: str
+        name of the SID column
+    filter_sids: array-like
+        only rows with SIDs intersecting filter_sids (e.g. an ROI cover) are returned.
+        Parquet chunks skip row groups outside of the SID bounds of filter_sids.
+    filter_tids: array-like
+        only rows temporally overlapping one of filter_tids are returned (c.f. :func:`tid_mask`).
+    tid_column: str
+        name of the TID column
+
+    Returns
+    --------
+    df: pandas.DataFrame
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> df = starepandas.io.pod.read_pod('pods/0x0a00000000000004/MOD09.parquet', columns=['sids', 'sur_refl_b01'])
+    """
+    format = pod_format(filename) if format is None else format
+    if format == 'parquet':
+        return read_pod_parquet(filename, columns=columns, sid_range=sid_range, sid_column=sid_column,
+                                filter_sids=filter_sids, filter_tids=filter_tids, tid_column=tid_column)
+    elif format == 'arrow':
+        return read_pod_arrow(filename, columns=columns, sid_range=sid_range, sid_column=sid_column,
+                              filter_sids=filter_sids, filter_tids=filter_tids, tid_column=tid_column)
+    elif format != 'pickle':
+        raise ValueError('read_pod argument format="%s" not understood.' % format)
+
+    frames = read_pod_pickle(filename)
+    if len(frames) == 0:
+        return None
+    df = pandas.concat(frames) if len(frames) > 1 else frames[0]
+    return filter_pod(df, columns=columns, sid_range=sid_range, sid_column=sid_column, filter_sids=filter_sids,
+                      filter_tids=filter_tids, tid_column=tid_column)
+
+
+def filter_pod(df, columns=None, sid_range=None, sid_column=None, filter_sids=None, filter_tids=None,
+               tid_column=None):
+    """ Applies the row filters and column projection of :func:`read_pod` to a decoded chunk."""
+    if sid_column is None:
+        sid_column = getattr(df, '_sid_column_name', None) or starepandas.staredataframe.DEFAULT_SID_COLUMN_NAME
+    if sid_range is not None:
+        sids = df[sid_column]
+        df = df[(sids >= sid_range[0]) & (sids <= sid_range[1])]
+    if filter_sids is not None:
+        df = df[starepandas.speedy_intersects(df[sid_column].to_numpy(), filter_sids)]
+    if filter_tids is not None:
+        if tid_column is None and isinstance(df, starepandas.STAREDataFrame):
+            tid_column = df._tid_column_name
+        df = df[tid_mask(df, filter_tids, tid_column)]
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+PodCacheInfo = collections.namedtuple('PodCacheInfo', ['hits', 'misses', 'evictions', 'entries', 'bytes',
+                                                       'max_bytes'])
+
+
+class PodCache:
+    """ A least recently used cache of decoded pod chunks with a byte budget.
+
+    Chunks are keyed by (path, mtime, size, columns), so that a chunk that is rewritten or appended to
+    is decoded anew; the entries of its previous versions are dropped when the new version is cached.
+    Frames larger than the budget are not cached.
+
+    Parameters
+    -----------
+    max_bytes: int
+        the budget for the (deep) memory usage of the cached frames
+    """
+
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.frames = collections.OrderedDict()
+        self.paths = collections.defaultdict(set)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.frames:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.frames.move_to_end(key)
+            return self.frames[key][0]
+
+    def put(self, key, df):
+        n_bytes = 0 if df is None else int(df.memory_usage(deep=True).sum())
+        if n_bytes > self.max_bytes:
+            return
+        with self.lock:
+            # Previous versions of the chunk (with another mtime or size) cannot be hit again
+            for stale in [k for k in self.paths[key[0]] if k[1:3] != key[1:3]]:
+                self.pop(stale)
+            if key in self.frames:
+                self.pop(key)
+            self.frames[key] = (df, n_bytes)
+            self.paths[key[0]].add(key)
+            self.bytes += n_bytes
+            while self.bytes > self.max_bytes:
+                self.pop(next(iter(self.frames)))
+                self.evictions += 1
+
+    def pop(self, key):
+        df, n_bytes = self.frames.pop(key)
+        self.paths[key[0]].discard(key)
+        if not self.paths[key[0]]:
+            del self.paths[key[0]]
+        self.bytes -= n_bytes
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.paths.clear()
+            self.bytes = 0
+
+    def info(self):
+        return PodCacheInfo(self.hits, self.misses, self.evictions, len(self.frames), self.bytes, self.max_bytes)
+
+
+POD_CACHE = None
+
+
+def enable_pod_cache(max_bytes=2**30):
+    """ Enables (or resizes) the decoded-pod cache consulted by :func:`read_pods` and :func:`iter_pods`.
+
+    Meant for interactive sessions querying overlapping regions: chunks are decoded once and served from
+    memory afterwards. Row filters (sid_range, filter_sids, filter_tids) are applied to the cached chunks,
+    so that different queries hit the same entries; only the column projection is part of the key.
+
+    Parameters
+    -----------
+    max_bytes: int
+        memory budget of the cache. The least recently used chunks are evicted beyond it. (default: 1 GiB)
+
+    Returns
+    --------
+    cache: PodCache
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> starepandas.enable_pod_cache(max_bytes=8 * 2**30)
+    # >>> sdf = starepandas.read_pods('pods/', roi_sids=roi)
+    # >>> sdf = starepandas.read_pods('pods/', roi_sids=roi)
+    # >>> starepandas.pod_cache_info()
+    # PodCacheInfo(hits=12, misses=12, evictions=0, entries=12, bytes=401652736, max_bytes=8589934592)
+    """
+    global POD_CACHE
+    if POD_CACHE is None:
+        POD_CACHE = PodCache(max_bytes)
     else:
-        raise Exception("Filetype %s not implemented for %s"%(ext,filename))
+        with POD_CACHE.lock:
+            POD_CACHE.max_bytes = max_bytes
+            while POD_CACHE.bytes > POD_CACHE.max_bytes:
+                POD_CACHE.pop(next(iter(POD_CACHE.frames)))
+                POD_CACHE.evictions += 1
+    return POD_CACHE
+
+
+def disable_pod_cache():
+    """ Disables the decoded-pod cache and releases the cached chunks."""
+    global POD_CACHE
+    if POD_CACHE is not None:
+        POD_CACHE.clear()
+    POD_CACHE = None
+
+
+def pod_cache_info():
+    """ Returns the hits, misses, evictions, entries, and bytes of the decoded-pod cache, or None if disabled."""
+    return None if POD_CACHE is None else POD_CACHE.info()
+
+
+def cached_read_pod(filename, columns=None, format=None, sid_range=None, sid_column=None, filter_sids=None,
+                    filter_tids=None, tid_column=None, cache=None):
+    """ Reads a chunk like :func:`read_pod`, serving the decoded chunk from cache if possible.
+
+    Pickles are cached with all columns since they are decoded completely anyway. Parquet and arrow chunks
+    are cached with the requested columns and those the row filters need.
+    """
+    cache = POD_CACHE if cache is None else cache
+    format = pod_format(filename) if format is None else format
+    read_columns = None
+    if columns is not None and format != 'pickle':
+        if format == 'parquet':
+            schema = pyarrow.parquet.read_schema(filename)
+        else:
+            schema = open_arrow(filename).schema
+        sid_column = recorded_sid_column(schema) if sid_column is None else sid_column
+        read_columns = list(columns)
+        if sid_range is not None or filter_sids is not None:
+            read_columns.append(sid_column)
+        if filter_tids is not None:
+            read_columns += temporal_columns(schema.names, tid_column)
+        read_columns = tuple(dict.fromkeys(read_columns))
+
+    stat = os.stat(filename)
+    key = (os.path.realpath(filename), stat.st_mtime_ns, stat.st_size, read_columns)
+    df = cache.get(key)
+    if df is None:
+        df = read_pod(filename, columns=None if read_columns is None else list(read_columns), format=format,
+                      sid_column=sid_column)
+        if df is None:
+            return None
+        cache.put(key, df)
+    # A shallow copy keeps callers adding columns from modifying the cached frame
+    return filter_pod(df.copy(deep=False), columns=columns, sid_range=sid_range, sid_column=sid_column,
+                      filter_sids=filter_sids, filter_tids=filter_tids, tid_column=tid_column)
 
 def read_pods(pod_root, sids=None, tids=None, pattern=None, add_podname=False, path_format=None, path_delimiter=None,
-              temporal_pattern=None, temporal_pattern_tid_index=None, verbose=False):
+              temporal_pattern=None, temporal_pattern_tid_index=None, verbose=False, columns=None, format=None,
+              sid_range=None, sid_column=None, manifest=None, num_workers=1, timings=None, roi_sids=None,
+              pod_level=None, filter_sids=None, filter_tids=None, tid_column=None, check_stale=False):
     """ Reads a STAREDataframe from a directory of STAREPods
 
     Parameters
@@ -47,13 +593,60 @@ def read_pods(pod_root, sids=None, tids=None, pattern=None, add_podname=False, p
         The field of the regexp temporal_pattern from which to extract a tid for matching.
         default: 0
     verbose: bool
+    columns: list
+        columns to read. Parquet chunks only decode the requested columns. Default: all columns
+    format: str
+        format of the chunks; 'pickle', 'parquet', or 'arrow'. Guessed from each chunk's magic bytes if None.
+    sid_range: tuple
+        (sid_min, sid_max); only rows with SIDs in the (inclusive) range are returned. Parquet
+        row groups whose SID statistics fall outside of the range are skipped.
+    sid_column: str
+        name of the SID column. Only required for sid_range on pickles that are not STAREDataFrames.
+    manifest: bool
+        resolve the query with a lookup in the manifest of pod_root (c.f. :func:`rebuild_manifest`) rather than
+        by listing the pod directories. Default: use the manifest if pod_root has one and path_format is None.
+        sids, tids and pattern are applied the same way; the TID cover of a chunk is the one recorded on write.
+        Chunks written without updating the manifest (e.g. by write_pods(manifest=False)) are not found until
+        :func:`rebuild_manifest` runs, unless check_stale is set.
+    check_stale: bool
+        with a manifest, also list pod_root and stat the queried pod directories, so that pods missing from the
+        manifest or changed after it was written are listed instead, with a warning to run
+        :func:`rebuild_manifest`. This costs metadata calls per pod, which the manifest otherwise avoids.
+    num_workers: int
+        number of threads decoding chunks concurrently (default: 1). Parquet, bz2, zstd, and lz4 decoding release the GIL.
+        Use :func:`iter_pods` to stream the pods in batches rather than materializing them at once.
+    timings: list
+        if given, a (chunk path, seconds, rows) tuple is appended for every chunk read.
+        The timings are also logged at the INFO level.
+    roi_sids: array-like
+        SIDs (at any level) of a region of interest. Only the existing pods intersecting the ROI are read
+        (c.f. :func:`roi_pods`) and only rows whose SIDs intersect the ROI are returned.
+        sids is not required in this case; if given, it further restricts the pods to read.
+    pod_level: int
+        level of the pods. Default: the level of the existing pods.
+    filter_sids: array-like
+        only rows whose SIDs intersect filter_sids are returned (c.f. :func:`starepandas.speedy_subset`).
+        Unlike roi_sids, filter_sids does not affect which pods are read. Default: roi_sids
+    filter_tids: array-like
+        only rows temporally overlapping one of filter_tids are returned (c.f. :func:`tid_mask`).
+        Unlike tids, which selects chunks by their TID cover, this compares the rows.
+    tid_column: str
+        name of the TID column compared by filter_tids. Default: 'tids'
+
+    Both filters are applied to each chunk right after it is decoded (by the worker when num_workers > 1),
+    so that rows outside of the query are never concatenated.
+
+    If the decoded-pod cache is enabled (c.f. :func:`enable_pod_cache`), decoded chunks are served from it and
+    the filters are applied to the cached chunks.
 
 
     The format of the path to the chunk is as follows.
 
         pod_path = path_format.format(pod_root=pod_root,delim1=path_delimiter,sid=sid)
 
-        pickles = sorted(glob.glob(os.path.expanduser(pod_path + '/*')))
+        entries = sorted(glob.glob(os.path.expanduser(pod_path + '/*')))
+        tpod_dirs = [e for e in entries if os.path.isdir(e)]
+        pickles = [e for e in entries if not os.path.isdir(e) and not e.endswith('.tmp')]
         search = '.*{pattern}.*'.format(pattern=pattern)
         pods = list(filter(re.compile(search).match, pickles))
 
@@ -111,6 +704,13 @@ def read_pods(pod_root, sids=None, tids=None, pattern=None, add_podname=False, p
         temporal_pattern           = '{pod_path}(0x.{{16}})_%s-(0x.{{16}})-.*'%tpod_resolution
         temporal_pattern_tid_index = 1
 
+    Pods written by STAREDataFrame.write_pods_tpod keep their tpods in subdirectories,
+
+        <pod-root>/<sid>/<tpod>/<tcover>-<dataset-name-pattern>
+
+    for which no temporal_pattern is needed: only the tpod directories that tids fall into are listed,
+    and chunks linked into several of them are read once.
+
     tids should be of the form...
 
         tids=[ tid1, tid2, ... ]
@@ -136,127 +736,618 @@ def read_pods(pod_root, sids=None, tids=None, pattern=None, add_podname=False, p
     # ...                             sids=['0x0a00000000000004'],
     # ...                             pattern='SSMIS.XCAL2016',
     # ...                             add_podname=True)
-    # >>>
+    # >>> sdf = starepandas.read_pods(pod_root='pods/', sids=['0x0a00000000000004'],
+    # ...                             columns=['sids', 'sur_refl_b01'], format='parquet')
+    # >>> roi = starepandas.sids_from_xy([135.5], [-44.6], level=10)
+    # >>> sdf = starepandas.read_pods(pod_root='tests/data/pods/', roi_sids=roi, sid_column='stare')
     """
 
-    sids                       = None if sids is None else sids
-    tids                       = None if tids is None else tids
-    pattern                    = "*" if pattern is None else pattern
+    chunks = iter_chunks(pod_root, sids=sids, tids=tids, pattern=pattern, add_podname=add_podname,
+                         path_format=path_format, path_delimiter=path_delimiter, temporal_pattern=temporal_pattern,
+                         temporal_pattern_tid_index=temporal_pattern_tid_index, verbose=verbose, columns=columns,
+                         format=format, sid_range=sid_range, sid_column=sid_column, manifest=manifest,
+                         num_workers=num_workers, timings=timings, roi_sids=roi_sids, pod_level=pod_level,
+                         filter_sids=filter_sids, filter_tids=filter_tids, tid_column=tid_column,
+                         check_stale=check_stale)
+    dfs = list(chunks)
+    if dfs != []:
+        df = pandas.concat(dfs)
+        df.reset_index(inplace=True, drop=True)
+        df = starepandas.STAREDataFrame(df)
+    else:
+        df = None
+    return df
+
+
+def iter_pods(pod_root, batch_rows=1000000, **kwargs):
+    """ Streams a directory of STAREPods as STAREDataFrames of (at most) batch_rows rows each.
+
+    Chunks are decoded ahead of the consumer by up to num_workers threads, but never more than
+    2*num_workers chunks are held in memory besides the batch being assembled.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory containing the pods
+    batch_rows: int
+        number of rows per batch. The last batch may be shorter.
+    kwargs:
+        query and read options as for :func:`read_pods` (e.g. sids, tids, pattern, columns, num_workers)
+
+    Yields
+    --------
+    df: starepandas.STAREDataFrame
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> total = 0
+    # >>> for batch in starepandas.iter_pods('pods/', sids=pod_names, columns=['sur_refl_b01'], num_workers=4):
+    # ...     total += batch['sur_refl_b01'].sum()
+    """
+    buffer = []
+    n_buffered = 0
+    for df in iter_chunks(pod_root, **kwargs):
+        buffer.append(df)
+        n_buffered += len(df)
+        if n_buffered < batch_rows:
+            continue
+        df = pandas.concat(buffer) if len(buffer) > 1 else buffer[0]
+        df.reset_index(inplace=True, drop=True)
+        n_full = len(df) // batch_rows * batch_rows
+        for start in range(0, n_full, batch_rows):
+            yield starepandas.STAREDataFrame(df.iloc[start:start + batch_rows])
+        buffer = [df.iloc[n_full:]] if n_full < len(df) else []
+        n_buffered = len(df) - n_full
+    if n_buffered > 0:
+        df = pandas.concat(buffer)
+        df.reset_index(inplace=True, drop=True)
+        yield starepandas.STAREDataFrame(df)
+
+
+def list_pods(pod_root, manifest=None, check_stale=False):
+    """ Lists the pods that exist in pod_root; from the manifest if possible.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory containing the pods
+    manifest: bool
+        use the manifest of pod_root. Default: if it exists.
+    check_stale: bool
+        with a manifest, also list the pod directories of pod_root. Pods missing from the manifest
+        (e.g. written with write_pods(manifest=False)) are listed as well, and a warning suggests running
+        :func:`~starepandas.io.manifest.rebuild_manifest`.
+
+    Returns
+    --------
+    pods: pandas.DataFrame
+        the pod (directory) names and their SIDs
+    """
+    if manifest is None:
+        manifest = starepandas.io.manifest.has_manifest(pod_root)
+    if manifest:
+        con = starepandas.io.manifest.connect(pod_root)
+        pods = pandas.read_sql_query('SELECT DISTINCT pod, sid FROM chunks ORDER BY sid', con)
+        con.close()
+        if not check_stale:
+            return pods
+        on_disk = list_pods(pod_root, manifest=False)
+        unlisted = on_disk[~on_disk['sid'].isin(pods['sid'])]
+        if len(unlisted) > 0:
+            logging.warning('%d pods of %s are not in its manifest; run rebuild_manifest to add them.'
+                            % (len(unlisted), pod_root))
+            pods = pandas.concat([pods, unlisted]).sort_values('sid', ignore_index=True)
+        return pods
+    names = []
+    for entry in os.scandir(pod_root):
+        if not entry.is_dir():
+            continue
+        try:
+            sid = starepandas.io.manifest.pod_sid(entry.name)
+        except ValueError:
+            continue
+        names.append((entry.name, sid))
+    return pandas.DataFrame(names, columns=['pod', 'sid']).sort_values('sid', ignore_index=True)
+
+
+def roi_pods(pod_root, roi_sids, pod_level=None, manifest=None, check_stale=False):
+    """ Resolves an ROI to the names of the existing pods that may contain data intersecting the ROI.
+
+    ROI SIDs finer than the pod level are coerced and cleared to the pod level; coarser ROI SIDs
+    are matched against all existing descendant pods.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory containing the pods
+    roi_sids: array-like
+        SIDs at arbitrary levels describing the ROI
+    pod_level: int
+        level of the pods. Default: the level of the (existing) pods of pod_root
+    manifest: bool
+        use the manifest of pod_root to list the existing pods. Default: if it exists.
+    check_stale: bool
+        also list pods missing from the manifest (c.f. :func:`list_pods`)
+
+    Returns
+    --------
+    pods: list
+        names of the pods intersecting the ROI
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> roi = starepandas.sids_from_xy([135.5], [-44.6], level=14)
+    # >>> starepandas.io.pod.roi_pods('tests/data/pods/', roi)
+    # ['0x0a00000000000004']
+    """
+    pods = list_pods(pod_root, manifest=manifest, check_stale=check_stale)
+    pod_sids = pods['sid'].to_numpy(dtype=numpy.int64)
+    levels = pystare.spatial_resolution(pod_sids)
+    if pod_level is None:
+        if len(numpy.unique(levels)) > 1:
+            raise ValueError('The pods of {} are at levels {}; specify pod_level'.format(pod_root, numpy.unique(levels)))
+    else:
+        pods = pods[levels == pod_level]
+        pod_sids = pod_sids[levels == pod_level]
+    if len(pods) == 0:
+        return []
+
+    pod_level = pystare.spatial_resolution(pod_sids[0])
+    roi_sids = numpy.unique(numpy.asarray(roi_sids, dtype=numpy.int64))
+    fine = pystare.spatial_resolution(roi_sids) > pod_level
+    coerced = pystare.spatial_coerce_resolution(roi_sids[fine], pod_level)
+    roi_sids[fine] = pystare.spatial_clear_to_resolution(coerced)
+    roi_sids = numpy.unique(roi_sids)
+    return list(pods['pod'][pystare.intersects(roi_sids, pod_sids)])
+
+
+def find_pods(pod_root, sids=None, tids=None, pattern=None, path_format=None, path_delimiter=None,
+              temporal_pattern=None, temporal_pattern_tid_index=None, manifest=None, roi_sids=None, pod_level=None,
+              check_stale=False):
+    """ Resolves a query to the paths of the chunks to read; from the manifest if possible.
+
+    C.f. :func:`read_pods` for the parameters.
+
+    Returns
+    --------
+    pods: list
+        paths to the matching chunks
+    """
+    if manifest is None:
+        manifest = path_format is None and starepandas.io.manifest.has_manifest(pod_root)
+    if roi_sids is not None:
+        pods = roi_pods(pod_root, roi_sids, pod_level=pod_level, manifest=manifest, check_stale=check_stale)
+        if sids is not None:
+            sids = set(starepandas.io.manifest.pod_sid(sid) for sid in sids)
+            pods = [pod for pod in pods if starepandas.io.manifest.pod_sid(pod) in sids]
+        sids = pods
+    if manifest:
+        chunks = starepandas.io.manifest.query_manifest(pod_root, sids=sids, tids=tids, pattern=pattern)
+        paths = [os.path.join(pod_root, path) for path in chunks['path']]
+        if not check_stale:
+            return paths
+        # Pods changed after the manifest was written are listed instead
+        if roi_sids is not None:
+            # roi_pods already listed the pod directories
+            pods = sids
+        else:
+            pods = list_pods(pod_root, manifest=True, check_stale=True)
+            if sids is not None:
+                pods = pods[pods['sid'].isin([starepandas.io.manifest.pod_sid(sid) for sid in sids])]
+            pods = pods['pod']
+        stale = starepandas.io.manifest.stale_pods(pod_root, pods)
+        if stale:
+            logging.warning('%d pods of %s changed after its manifest was written and are listed instead; '
+                            'run rebuild_manifest to update the manifest.' % (len(stale), pod_root))
+            stale_sids = [starepandas.io.manifest.pod_sid(pod) for pod in stale]
+            paths = [os.path.join(pod_root, path) for path in chunks['path'][~chunks['sid'].isin(stale_sids)]]
+            paths = sorted(paths + glob_pods(pod_root, stale, tids=tids, pattern=pattern))
+        return paths
+    return glob_pods(pod_root, sids=sids, tids=tids, pattern=pattern, path_format=path_format,
+                     path_delimiter=path_delimiter, temporal_pattern=temporal_pattern,
+                     temporal_pattern_tid_index=temporal_pattern_tid_index)
+
+
+def timed_read_pod(pod, add_podname=False, **kwargs):
+    """ Reads a chunk with :func:`read_pod` and returns it along with the time the read took."""
+    start = time.perf_counter()
+    df = read_pod(pod, **kwargs) if POD_CACHE is None else cached_read_pod(pod, **kwargs)
+    if df is not None and add_podname:
+        df['pod'] = pod
+    seconds = time.perf_counter() - start
+    logging.info('Reading chunk %s took %.3f seconds.' % (pod, seconds))
+    return pod, df, seconds
+
+
+def iter_chunks(pod_root, sids=None, tids=None, pattern=None, add_podname=False, path_format=None,
+                path_delimiter=None, temporal_pattern=None, temporal_pattern_tid_index=None, verbose=False,
+                columns=None, format=None, sid_range=None, sid_column=None, manifest=None, num_workers=1,
+                timings=None, roi_sids=None, pod_level=None, filter_sids=None, filter_tids=None,
+                tid_column=None, check_stale=False):
+    """ Yields the (non-empty) chunks matching a query as dataframes in the order of :func:`find_pods`.
+
+    C.f. :func:`read_pods` for the parameters.
+    """
+    pods = find_pods(pod_root, sids=sids, tids=tids, pattern=pattern, path_format=path_format,
+                     path_delimiter=path_delimiter, temporal_pattern=temporal_pattern,
+                     temporal_pattern_tid_index=temporal_pattern_tid_index, manifest=manifest,
+                     roi_sids=roi_sids, pod_level=pod_level, check_stale=check_stale)
+    read = functools.partial(timed_read_pod, add_podname=add_podname, columns=columns, format=format,
+                             sid_range=sid_range, sid_column=sid_column,
+                             filter_sids=roi_sids if filter_sids is None else filter_sids,
+                             filter_tids=filter_tids, tid_column=tid_column)
+
+    if num_workers is None or num_workers <= 1:
+        results = map(read, pods)
+    else:
+        results = read_ahead(read, pods, num_workers)
+
+    for pod, df, seconds in results:
+        if verbose:
+            print('read {} in {:.3f} s'.format(pod, seconds))
+        if timings is not None:
+            timings.append((pod, seconds, 0 if df is None else len(df)))
+        if df is None or len(df) == 0:
+            continue
+        yield df
+
+
+def read_ahead(func, items, num_workers):
+    """ Like map(func, items), but evaluated by num_workers threads that run at most 2*num_workers items ahead."""
+    items = iter(items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = collections.deque(executor.submit(func, item) for item in itertools.islice(items, 2 * num_workers))
+        while futures:
+            result = futures.popleft().result()
+            for item in itertools.islice(items, 1):
+                futures.append(executor.submit(func, item))
+            yield result
+
+
+def glob_pods(pod_root, sids, tids=None, pattern=None, path_format=None, path_delimiter=None,
+              temporal_pattern=None, temporal_pattern_tid_index=None):
+    """ Lists the chunks matching a query by globbing the pod directories.
+
+    This is the fallback of :func:`read_pods` for pod roots without a manifest.
+    C.f. :func:`read_pods` for the parameters; sids None globs all pods of the default path_format.
+
+    Returns
+    --------
+    pods: list
+        paths to the matching chunks
+    """
+    pattern                    = "" if pattern is None else pattern
     path_delimiter             = '/' if path_delimiter is None else path_delimiter
     temporal_pattern           = '{pod_path}(.*)-.*' if temporal_pattern is None else temporal_pattern
     temporal_pattern_tid_index = 0 if temporal_pattern_tid_index is None else temporal_pattern_tid_index
-
-    if tids is None:
-        path_format = '{pod_root}{delim1}{sid}' if path_format is None else path_format
-#        tids = [None]
-    else:
-        # cf. write_pods()
-        # path_format = '{pod_root}{delim1}{sid}{delim2}{tid}' if path_format is None else path_format
-        path_format = '{pod_root}{delim1}{sid}' if path_format is None else path_format
+    if sids is None and path_format is None:
+        # All pods
+        sids = list_pods(pod_root, manifest=False)['pod']
+    path_format                = '{pod_root}{delim1}{sid}' if path_format is None else path_format
+    if tids is not None:
         tids_cmp = numpy.array(tids).astype(numpy.int64)
-        
-#-        print('000: ',tids_cmp,list(map(pystare.hex16,tids_cmp)))
-
-#-    print('pod.read_pod')
-#-    if tids is not None:
-#-        print('tids: ',list(map(pystare.hex16,tids)))
-#-    else:
-#-        print('tids: ',tids)
-    
-    dfs = []
+
+    chunks = []
     for sid in sids:
-        # print('###########################################################################')
-        # If we have temporal pods, then the following makes sense.
-###        for tid in tids:
-        if True:
-            if tids is None:
-                pod_path = path_format.format(pod_root=pod_root,delim1=path_delimiter,sid=sid)
-            else:
-                # pod_path = path_format.format(pod_root=pod_root,delim1=path_delimiter,sid=sid,delim2=path_delimiter,tid=tids)
-                # Drop temporal chunking for now.
-                pod_path = path_format.format(pod_root=pod_root,delim1=path_delimiter,sid=sid)
-            if not os.path.exists(pod_path):
-                # print('no pod exists for {}'.format(sid))
-                # print('no pod exists for {}'.format(pod_path))
-                continue
-            pickles = sorted(glob.glob(os.path.expanduser(pod_path + '/*')))
-            search = '.*{pattern}.*'.format(pattern=pattern)
-            pods = list(filter(re.compile(search).match, pickles))
-            pods_dict = {}
+        pod_path = path_format.format(pod_root=pod_root,delim1=path_delimiter,sid=sid)
+        if not os.path.exists(pod_path):
+            continue
+        entries = sorted(glob.glob(os.path.expanduser(pod_path + '/*')))
+        tpod_dirs = [e for e in entries if os.path.isdir(e)]
+        pickles = [e for e in entries if not os.path.isdir(e) and not e.endswith('.tmp')]
+        search = '.*{pattern}.*'.format(pattern=pattern)
+        pods = list(filter(re.compile(search).match, pickles))
+
+        if tids is not None:
+            # 1. parse a tid out of a pod name.
+            # 2. if the tid overlaps tids, then keep, else don't load.
+            p = re.compile(temporal_pattern.format(pod_path=pod_path))
+            pods_to_keep = []
+            for p_ in pods:
+                m = p.match(p_)
+                if m is None:
+                    continue
+                if tid_overlaps(int(m.groups()[temporal_pattern_tid_index],16), tids_cmp):
+                    pods_to_keep.append(p_)
+            pods = pods_to_keep
+        chunks.extend(pods)
+        if tpod_dirs:
+            chunks.extend(glob_tpods(tpod_dirs, tids=tids, pattern=pattern))
+    return chunks
 
-#+            print('190 pods: ',pods)
 
+def tid_overlaps(tid, tids):
+    """ Tests if the temporal index value tid overlaps any of tids."""
+    tids = numpy.asarray(tids, dtype=numpy.int64)
+    cmp = pystare.temporal_value_intersection_if_overlap(tids, numpy.full(tids.shape, fill_value=tid, dtype=numpy.int64))
+    # -1 signals no overlap
+    return bool(numpy.any(cmp > 0))
+
+
+TPOD_PATTERN = re.compile('^(0x[0-9a-f]{16})_(\\d+)$')
+
+
+def glob_tpods(tpod_dirs, tids=None, pattern=None):
+    """ Lists the chunks in the temporal pods (c.f. STAREDataFrame.write_pods_tpod) of a spatial pod.
+
+    Only the tpods that the windows tids fall into are listed, and only chunks whose TID cover overlaps tids
+    are returned. Chunks linked into several of the listed tpods are returned once.
+
+    Parameters
+    -----------
+    tpod_dirs: list
+        paths to the tpod directories of a pod
+    tids: array-like
+        STARE temporal index values. Default: all tpods and chunks
+    pattern: str
+        name pattern of chunks to read
+
+    Returns
+    --------
+    chunks: list
+        paths to the matching chunks
+    """
+    tpods = {}
+    for tpod_dir in tpod_dirs:
+        m = TPOD_PATTERN.match(os.path.basename(tpod_dir))
+        if m is not None:
+            tpods[os.path.basename(tpod_dir)] = (tpod_dir, int(m.group(2)))
+    if tids is not None:
+        tids = numpy.atleast_1d(numpy.array(tids).astype(numpy.int64))
+        wanted = set()
+        for resolution in set(resolution for _, resolution in tpods.values()):
+            for tid in tids:
+                wanted.update(pystare.format_tpod(tpod) for tpod in pystare.pods_in_query(tid, resolution))
+        tpods = {name: tpod for name, tpod in tpods.items() if name in wanted}
+
+    search = re.compile('.*{pattern}.*'.format(pattern='' if pattern is None else pattern))
+    chunks = []
+    seen = set()
+    for name in sorted(tpods):
+        for chunk in sorted(glob.glob(tpods[name][0] + '/*')):
+            if search.match(chunk) is None or chunk.endswith('.tmp'):
+                continue
             if tids is not None:
-                # 1. parse a tid out of a pod name.
-                # 2. if the tid is in tids, then keep, else don't load.
-                #
-                # 1.
-#                regexp = pod_path+path_delimiter+'(.*)'+path_delimiter+'(.*)-.*'
-#                regexp = pod_path+path_delimiter+'(.*)'
-#+                regexp = pod_path+'(.*)-.*'
-                regexp = temporal_pattern.format(pod_path=pod_path)
-#+                print('regexp: ',regexp)
-                p = re.compile(regexp)
-                pods_tids = []
-                for p_ in pods:
-                    m = p.match(p_)
-                    if m is not None:
-#-                        print('200: ',m.groups())
-                        tid_ = int(m.groups()[temporal_pattern_tid_index],16)
-#-                        print('201: ',pystare.hex16(tid_),pystare.tiv_utc_to_string(pystare.expanded_tiv(numpy.int64(tid_))))
-                        pods_tids.append(tid_)
-                        pods_dict[tid_] = p_
-#-                print('pods_dict: ',pods_dict)
-                #
-                # 2.
-                pods_to_keep = []
-                # 2.1 Make an array of the search tids (done: that's tids_cmp)
-                # 2.2 Check each pod tid
-                for pt_ in pods_tids:
-                    # 2.3 Prepare for the overlap test
-                    pt_cmp = numpy.full(tids_cmp.shape,fill_value=pt_,dtype=numpy.int64)
-                    idx = None
-#-                    print('101: ',pt_cmp,list(map(pystare.hex16,pt_cmp)))
-                    cmp = pystare.temporal_value_intersection_if_overlap(tids_cmp,pt_cmp)
-#-                    print('102: ',cmp,list(map(pystare.hex16,cmp)))
-                    # -1 signals no overlap
-                    idx = numpy.where(cmp > 0)[0]
-#-                    print('103: ',idx)
-                    if len(idx) > 0:
-                        pods_to_keep.append(pods_dict[pt_])
-#-                        print('104: ',pods_to_keep)
-                        continue
-#-                    print('105: ',pods_to_keep)
-                pods = pods_to_keep
-
-### Note: we could parse out a tid from the path and compare with the tids.
-### Somehow only read a file once... If we're doing symlinks... cf. write_pods
-###            pods = cull_duplicates(pods)
-###
-#-            print('300 pods: ',pods)
-            for pod in pods:
-                not_done = True
-
-                with generic_open(pod)(pod,'rb') as input:
-                    if verbose:
-                        print('reading ',pod)
-                    while not_done:
-                        try:
-                            #df = pickle.load(input) # Not backwards compatible
-                            df = pandas.read_pickle(input)
-                            if add_podname:
-                                df['pod'] = pod
-                            dfs.append(df)
-                        except EOFError as e:
-                            not_done = False
+                m = starepandas.io.manifest.TID_PATTERN.match(os.path.basename(chunk))
+                if m is None or not tid_overlaps(int(m.group(1), 16), tids):
+                    continue
+            real_path = os.path.realpath(chunk)
+            if real_path not in seen:
+                seen.add(real_path)
+                chunks.append(chunk)
+    return chunks
 
-    if dfs != []:
-        df = pandas.concat(dfs)
-        df.reset_index(inplace=True, drop=True)
-        df = starepandas.STAREDataFrame(df)
+
+def compact_pod(pod_root, pod, pattern=None, chunk_name=None, max_rows=5000000, format=None, compress=None,
+                sid_column=None, manifest=None, lock=True):
+    """ Rewrites the chunks of a single pod into as few SID-sorted chunks of at most max_rows rows as possible.
+
+    C.f. :func:`compact_pods` for the parameters.
+
+    Returns
+    --------
+    report: dict
+        chunk counts and sizes before and after compaction
+    """
+    pod_path = os.path.join(pod_root, str(pod))
+    # Writers holding the pod lock (c.f. STAREDataFrame.write_pods(lock=True)) wait for the compaction
+    with starepandas.staredataframe.pod_lock(pod_path) if lock else contextlib.nullcontext():
+        return _compact_pod(pod_root, pod, pod_path, pattern=pattern, chunk_name=chunk_name, max_rows=max_rows,
+                            format=format, compress=compress, sid_column=sid_column, manifest=manifest)
+
+
+def _compact_pod(pod_root, pod, pod_path, pattern, chunk_name, max_rows, format, compress, sid_column, manifest):
+    """ Compacts the chunks of the pod at pod_path; c.f. :func:`compact_pod`."""
+    search = re.compile('.*{pattern}.*'.format(pattern='' if pattern is None else pattern))
+    chunks = sorted(entry.path for entry in os.scandir(pod_path)
+                    if entry.is_file(follow_symlinks=False) and not entry.name.endswith('.tmp')
+                    and not entry.name.startswith('.') and search.match(entry.path))
+    report = {'pod': str(pod), 'chunks_before': len(chunks), 'frames_before': 0,
+              'bytes_before': sum(os.path.getsize(c) for c in chunks), 'chunks_after': len(chunks),
+              'bytes_after': 0}
+    report['bytes_after'] = report['bytes_before']
+    if len(chunks) == 0:
+        return report
+
+    chunk_format = pod_format(chunks[0])
+    format = chunk_format if format is None else format
+    if compress is None and format == 'pickle':
+        compress = pod_compression(chunks[0])
+
+    frames = []
+    for chunk in chunks:
+        if pod_format(chunk) == 'pickle':
+            frames += read_pod_pickle(chunk)
+        else:
+            frames.append(read_pod(chunk))
+    report['frames_before'] = len(frames)
+    if len(frames) == len(chunks) == 1 and format == chunk_format and len(frames[0]) <= max_rows:
+        # nothing to gain
+        return report
+
+    df = pandas.concat(frames) if len(frames) > 1 else frames[0]
+    del frames
+    if sid_column is None:
+        sid_column = getattr(df, '_sid_column_name', None)
+    if sid_column is None and chunk_format == 'parquet':
+        sid_column = recorded_sid_column(pyarrow.parquet.ParquetFile(chunks[0]).schema_arrow, None)
+    if sid_column is None and chunk_format == 'arrow':
+        sid_column = recorded_sid_column(open_arrow(chunks[0]).schema, None)
+    if sid_column is None:
+        sid_column = starepandas.staredataframe.DEFAULT_SID_COLUMN_NAME
+    if sid_column in df.columns:
+        df = df.sort_values(sid_column, kind='stable')
+    df.reset_index(drop=True, inplace=True)
+
+    # Chunks named by their TID cover (c.f. write_pods_granule) keep a cover of all compacted chunks
+    names = [os.path.basename(c) for c in chunks]
+    matches = [starepandas.io.manifest.TID_PATTERN.match(name) for name in names]
+    tid = None
+    if all(matches):
+        chunk_tids = numpy.array([int(m.group(1), 16) for m in matches], dtype=numpy.int64)
+        bounds = [pystare.to_ms_since_epoch_utc(pystare.lower_bound_ms(chunk_tids)).min(),
+                  pystare.to_ms_since_epoch_utc(pystare.upper_bound_ms(chunk_tids)).max()]
+        tid = pystare.tiv_from_datetime2([pandas.Timestamp(ms, unit='ms').to_pydatetime() for ms in bounds])
+        names = [name[m.end():] for name, m in zip(names, matches)]
+    if chunk_name is None:
+        chunk_name = os.path.commonprefix(names).rstrip('.-_') or 'compacted'
+    prefix = '' if tid is None else pystare.hex16(tid) + '-'
+
+    n_chunks = max(1, -(-len(df) // max_rows))
+    written = []
+    records = []
+    for i in range(n_chunks):
+        name = prefix + (chunk_name if n_chunks == 1 else '{}.{}'.format(chunk_name, i))
+        fname = os.path.join(pod_path, name)
+        tmp_name = fname + '.compact.tmp'
+        g = df.iloc[i * max_rows:(i + 1) * max_rows]
+        starepandas.staredataframe.write_pod(g, tmp_name, compress=compress, format=format, sid_column=sid_column)
+        os.replace(tmp_name, fname)
+        written.append(fname)
+        records.append(starepandas.io.manifest.chunk_record(pod_root, fname, pod, len(g), g.columns, format, tid))
+
+    if manifest is None:
+        manifest = starepandas.io.manifest.has_manifest(pod_root)
+    if manifest:
+        # Updated before the old chunks are removed, so that readers of the manifest never miss a listed chunk
+        starepandas.io.manifest.replace_in_manifest(pod_root, [os.path.relpath(c, pod_root) for c in chunks], records)
+    obsolete = [c for c in chunks if c not in written]
+    for chunk in obsolete:
+        os.remove(chunk)
+
+    report['chunks_after'] = len(written)
+    report['bytes_after'] = sum(os.path.getsize(c) for c in written)
+    return report
+
+
+def compact_pods(pod_root, sids=None, pattern=None, chunk_name=None, max_rows=5000000, format=None, compress=None,
+                 sid_column=None, num_workers=1, manifest=None, verbose=False, lock=True):
+    """ Compacts pods that accumulated many (small or appended) chunks into a few large, SID-sorted chunks.
+
+    The chunks of each pod are decoded, concatenated, sorted by SID, and written to temporary files, which are
+    renamed into place. The manifest is then updated in a single transaction, before the old chunks are removed,
+    so that readers of the manifest find either the old or the new chunks. Readers listing the pod directories
+    may see both for the moment between rename and removal. Chunks named by their TID cover (c.f. write_pods_granule)
+    are replaced by chunks named by the cover of all of them.
+    Temporal pods (c.f. write_pods_tpod) are not compacted since their chunks may be linked from other tpods.
+
+    Parameters
+    -----------
+    pod_root: str
+        Root directory containing the pods
+    sids: array-like
+        names of the pods to compact. Default: all pods of pod_root
+    pattern: str
+        only compact the chunks matching the pattern
+    chunk_name: str
+        name of the compacted chunks. Default: the common prefix of the names of the compacted chunks
+    max_rows: int
+        maximum number of rows per compacted chunk
+    format: str
+        'pickle', 'parquet', or 'arrow'. Default: the format of the existing chunks.
+    compress: str
+        compression of the compacted chunks. Default: the compression of the existing pickles
+    sid_column: str
+        name of the SID column to sort by
+    num_workers: int
+        number of pods to compact concurrently
+    manifest: bool
+        update the manifest. Default: if pod_root has one
+    verbose: bool
+        print the reclaimed bytes and chunk counts
+    lock: bool
+        hold the advisory lock of each pod (c.f. :func:`starepandas.staredataframe.pod_lock`) from reading its
+        chunks until the old chunks are removed, so that writers appending with lock=True are not lost.
+        Writers not taking the lock must not write to pods while they are compacted. (default: True)
+
+    Returns
+    --------
+    report: pandas.DataFrame
+        per pod, the number of chunks, pickled frames, and bytes before, and the chunks and bytes after compaction
+
+    Examples
+    ----------
+    # >>> import starepandas
+    # >>> report = starepandas.compact_pods('pods/', pattern='MOD09', format='parquet', num_workers=8)
+    # >>> (report['bytes_before'] - report['bytes_after']).sum()
+    """
+    if sids is None:
+        sids = list_pods(pod_root, manifest=False)['pod']
+    compact = functools.partial(compact_pod, pod_root, pattern=pattern, chunk_name=chunk_name, max_rows=max_rows,
+                                format=format, compress=compress, sid_column=sid_column, manifest=manifest,
+                                lock=lock)
+    if num_workers is None or num_workers <= 1:
+        reports = list(map(compact, sids))
     else:
-        df = None
-    return df
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            reports = list(executor.map(compact, sids))
+
+    report = pandas.DataFrame(reports, columns=['pod', 'chunks_before', 'frames_before', 'bytes_before',
+                                                'chunks_after', 'bytes_after'])
+    message = 'Compacted {} chunks ({} frames) into {}; reclaimed {} bytes.'.format(
+        report['chunks_before'].sum(), report['frames_before'].sum(), report['chunks_after'].sum(),
+        report['bytes_before'].sum() - report['bytes_after'].sum())
+    logging.info(message)
+    if verbose:
+        print(message)
+    return report
+
 
+def benchmark_codecs(chunks, codecs=None, repeat=3):
+    """ Compares the compression ratio and the encode and decode throughput of pickle codecs on sample chunks.
 
+    Meant to choose the codec of an archive from a few representative (e.g. MOD09 or VIIRS) pods.
+    Throughputs are in MB of uncompressed pickle per second, the best of repeat runs.
+
+    Parameters
+    -----------
+    chunks: list
+        paths of sample pod chunks (in any format and compression) or dataframes
+    codecs: list
+        compress arguments to compare (c.f. :func:`compression_method`).
+        Default: uncompressed, bz2, lz4, and zstd at levels 3 and 19, skipping codecs whose package is missing.
+    repeat: int
+        number of times each chunk is encoded and decoded
+
+    Returns
+    --------
+    report: pandas.DataFrame
+        per codec, the uncompressed and compressed bytes, the ratio, and the write and read throughput
+
+    Examples
+    ----------
+    # >>> import glob
+    # >>> import starepandas
+    # >>> starepandas.io.pod.benchmark_codecs(glob.glob('pods/*/MOD09*')[:10])
+    """
+    if codecs is None:
+        codecs = [None, 'bz2', 'lz4', 'zstd', {'method': 'zstd', 'level': 19}]
+        codecs = [c for c in codecs if compression_method(c)[0] not in CODEC_MODULES
+                  or importlib.util.find_spec(CODEC_MODULES[compression_method(c)[0]].split('.')[0]) is not None]
+    frames = [read_pod(c) if isinstance(c, str) else c for c in chunks]
+    raw_bytes = sum(len(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)) for df in frames)
 
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fname = os.path.join(tmp_dir, 'chunk')
+        for codec in codecs:
+            method, level = compression_method(codec)
+            write_time, read_time, n_bytes = 0, 0, 0
+            for df in frames:
+                write_times, read_times = [], []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    starepandas.staredataframe.write_pod_pickle(df, fname, compress=codec)
+                    write_times.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    read_pod_pickle(fname)
+                    read_times.append(time.perf_counter() - start)
+                write_time += min(write_times)
+                read_time += min(read_times)
+                n_bytes += os.path.getsize(fname)
+            reports.append({'codec': method or 'none', 'level': level, 'raw_bytes': raw_bytes, 'bytes': n_bytes,
+                            'ratio': raw_bytes / n_bytes, 'write_mb_s': raw_bytes / write_time / 1e6,
+                            'read_mb_s': raw_bytes / read_time / 1e6})
+    return pandas.DataFrame(reports)
@@ -1,4 +1,3 @@
-import bz2
 import geopandas.plotting
 import pystare
 import pandas
@@ -8,8 +7,19 @@ import netCDF4
 import starepandas.tools.trixel_conversions
 import starepandas.tools.temporal_conversions
 import starepandas.io.pod
+import starepandas.io.manifest
 import multiprocessing
+import concurrent.futures
+import contextlib
 import pickle
+import json
+import os
+import socket
+import uuid
+import pyarrow
+import pyarrow.compute
+import pyarrow.ipc
+import pyarrow.parquet
 
 import logging
 import time
@@ -17,10 +27,17 @@ import copy
 
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 DEFAULT_SID_COLUMN_NAME = 'sids'
 DEFAULT_TID_COLUMN_NAME = 'tids'
 DEFAULT_TRIXEL_COLUMN_NAME = 'trixels'
 DEFAULT_GEOMETRY_COLUMN_NAME = 'geometry'
+# Rows per row group of parquet chunks, whose SID statistics let readers skip row groups within a chunk
+PARQUET_ROW_GROUP_SIZE = 65536
 
 def compress_sids_group(group):
     sids = group[1].to_numpy()  # zero element is group label, 1 element is the df
@@ -32,27 +49,173 @@ def compress_sids_group(group):
     return tuple([group[0], sids])
 
 def write_pod_pickle(g, fname, append=False, compress=None):
-    """Write or append to a pickle."""
+    """Write or append to a (bz2, zstd, or lz4 compressed) pickle.
+
+    Appending adds another pickled frame (for compressed pickles, another compressed stream) to the end of the file.
+    It is not safe for concurrent writers; c.f. :func:`write_pod` for locking and atomic writes.
+    """
     logging.info('Writing to pickle: %s' % fname)
-    if append:
-        raise NotImplementedError('appending not implemented')
-        with starepandas.io.pod.generic_open(fname)(fname, 'a+b') as f:
-            pickle.dump(g, f)
-    else:
-        # Overwrite
-        start = time.time()
-        if compress == None:
-            with open(fname, 'wb') as f:
-                pickle.dump(g, f)
-                logging.info('Writing chunk %s took %d seconds.' % (fname, time.time() - start))
-        elif compress == 'bz2':
-            with bz2.open(fname, 'wb') as f:
-                pickle.dump(g, f)
-                logging.info('Writing bz2 chunk %s took %d seconds.' % (fname, time.time() - start))
-        else:
-            raise ValueError('write_pod_pickle argument compress="%s" not understood.'%compress)
+    start = time.time()
+    mode = 'ab' if append else 'wb'
+    if append and os.path.exists(fname):
+        # Appended frames have to match the compression of the existing ones
+        existing = starepandas.io.pod.pod_compression(fname)
+        if existing != starepandas.io.pod.compression_method(compress)[0]:
+            compress = existing
+    method, _ = starepandas.io.pod.compression_method(compress)
+    if method not in [None, 'bz2', 'zstd', 'lz4']:
+        raise ValueError('write_pod_pickle argument compress="%s" not understood.'%compress)
+    with starepandas.io.pod.open_compressed(fname, mode, compress) as f:
+        pickle.dump(g, f)
+    logging.info('Writing %s chunk %s took %d seconds.' % (method or 'uncompressed', fname, time.time() - start))
+    return
+
+
+def temporary_path(fname):
+    """Returns a hidden, writer-unique temporary path next to fname."""
+    dname, name = os.path.split(fname)
+    return os.path.join(dname, '.{}.{}.tmp'.format(name, uuid.uuid4().hex))
+
+
+def sibling_path(fname):
+    """Returns a new, writer-unique chunk path next to fname, which keeps the name of fname as its prefix."""
+    return '{}.{}'.format(fname, uuid.uuid4().hex[:16])
+
+
+@contextlib.contextmanager
+def pod_lock(dname):
+    """Holds an exclusive advisory (fcntl) lock on the pod directory dname.
+
+    The lock file is a hidden file next to dname, so that locking leaves the pod directory unchanged
+    (c.f. :func:`starepandas.io.manifest.stale_pods`).
+    """
+    if fcntl is None:
+        raise NotImplementedError('pod locks require fcntl, which is not available on this platform')
+    parent, name = os.path.split(os.path.normpath(dname))
+    with open(os.path.join(parent, '.{}.lock'.format(name)), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_pod_parquet(g, fname, append=False, compress=None, sid_column=DEFAULT_SID_COLUMN_NAME, row_group_size=None):
+    """Write a parquet chunk, or append to it as a new part file.
+
+    The rows are sorted by their SIDs, which are stored as int64, and written in row groups of row_group_size
+    (default: PARQUET_ROW_GROUP_SIZE) rows, so that the min/max statistics of the row groups can be used to
+    prune row groups within a chunk on read (c.f. :func:`starepandas.io.pod.read_pod`).
+    Parquet files cannot be extended in place. Appending to an existing chunk therefore writes the rows to a new
+    part file next to it (c.f. :func:`sibling_path`), which readers pick up along with the chunk and
+    :func:`starepandas.compact_pods` merges into it. The part file has to match the schema of the chunk and keeps
+    its compression: compress=None uses it, and a different compress raises a ValueError.
+
+    Returns the path of the written file.
+    """
+    logging.info('Writing to parquet: %s' % fname)
+    start = time.time()
+    g = pandas.DataFrame(g).sort_values(sid_column, kind='stable')
+    g[sid_column] = g[sid_column].astype(numpy.int64)
+    table = pyarrow.Table.from_pandas(g, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'starepandas'] = json.dumps({'sid_column': sid_column}).encode()
+    table = table.replace_schema_metadata(metadata)
+    compression, compression_level = starepandas.io.pod.compression_method(compress)
+    compression = 'none' if compression is None else compression
+
+    if append and os.path.exists(fname):
+        existing = pyarrow.parquet.ParquetFile(fname)
+        if not existing.schema_arrow.equals(table.schema, check_metadata=False):
+            raise ValueError('Cannot append to %s: schema does not match the existing row groups.' % fname)
+        existing_compression = existing.metadata.row_group(0).column(0).compression.lower()
+        existing_compression = 'none' if existing_compression == 'uncompressed' else existing_compression
+        existing.close()
+        if compress is None:
+            compression = existing_compression
+        elif compression != existing_compression:
+            raise ValueError('Cannot append to %s: compress="%s" does not match its %s compression.'
+                             % (fname, compression, existing_compression))
+        fname = sibling_path(fname)
+    if row_group_size is None:
+        row_group_size = PARQUET_ROW_GROUP_SIZE
+    pyarrow.parquet.write_table(table, fname, row_group_size=max(min(len(table), row_group_size), 1),
+                                compression=compression, compression_level=compression_level,
+                                write_statistics=True)
+    logging.info('Writing parquet chunk %s took %d seconds.' % (fname, time.time() - start))
+    return fname
+
+
+def write_pod_arrow(g, fname, append=False, compress=None, sid_column=DEFAULT_SID_COLUMN_NAME):
+    """Write or append to an Arrow IPC (Feather v2) chunk.
+
+    The rows are sorted by SID and written as a single record batch, so that
+    :func:`starepandas.io.pod.read_pod_arrow` can memory map the columns and binary search the SIDs.
+    Chunks should be left uncompressed (the default); compressed ones ('zstd' or 'lz4') are decoded on read.
+    Appending rewrites the chunk with the existing and the new rows.
+    """
+    logging.info('Writing to arrow: %s' % fname)
+    start = time.time()
+    g = pandas.DataFrame(g)
+    g[sid_column] = g[sid_column].astype(numpy.int64)
+    table = pyarrow.Table.from_pandas(g, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'starepandas'] = json.dumps({'sid_column': sid_column}).encode()
+    table = table.replace_schema_metadata(metadata)
+    if append and os.path.exists(fname):
+        existing = starepandas.io.pod.open_arrow(fname)
+        if not existing.schema.equals(table.schema, check_metadata=False):
+            raise ValueError('Cannot append to %s: schema does not match the existing chunk.' % fname)
+        table = pyarrow.concat_tables([existing, table.cast(existing.schema)])
+    table = table.take(pyarrow.compute.sort_indices(table, [(sid_column, 'ascending')])).combine_chunks()
+    method, level = starepandas.io.pod.compression_method(compress)
+    options = pyarrow.ipc.IpcWriteOptions(compression=None if method is None else pyarrow.Codec(method, level))
+
+    # Appends may not overwrite the file that existing is mapped from
+    tmp_name = temporary_path(fname)
+    with pyarrow.ipc.new_file(tmp_name, table.schema, options=options) as writer:
+        writer.write_table(table, max_chunksize=max(len(table), 1))
+    os.replace(tmp_name, fname)
+    logging.info('Writing arrow chunk %s took %d seconds.' % (fname, time.time() - start))
     return
 
+
+def write_pod(g, fname, append=False, compress=None, format='pickle', sid_column=DEFAULT_SID_COLUMN_NAME,
+              atomic=False, lock=False):
+    """Write or append g to the pod chunk fname in the given format ('pickle', 'parquet', or 'arrow').
+
+    With atomic, the chunk is written to a temporary file that is then renamed to fname, so that readers
+    see either the old or the new chunk but never a partial one. Appending atomically to an existing chunk,
+    or appending to an existing parquet chunk, writes the rows to a new chunk next to it (c.f. :func:`sibling_path`)
+    instead of rewriting it; such chunks are merged by :func:`starepandas.compact_pods`.
+    With lock, an advisory lock on the pod directory is held while writing, which serializes writers of the pod.
+
+    Returns the path of the written chunk.
+    """
+    with pod_lock(os.path.dirname(fname)) if lock else contextlib.nullcontext():
+        if atomic and append and os.path.exists(fname):
+            fname = sibling_path(fname)
+            append = False
+        target = temporary_path(fname) if atomic else fname
+        try:
+            if format == 'pickle':
+                write_pod_pickle(g, target, append, compress)
+            elif format == 'parquet':
+                written = write_pod_parquet(g, target, append, compress, sid_column=sid_column)
+                # Non-atomic appends go to a new part file
+                fname = fname if atomic else written
+            elif format == 'arrow':
+                write_pod_arrow(g, target, append, compress, sid_column=sid_column)
+            else:
+                raise ValueError('write_pod argument format="%s" not understood.' % format)
+            if atomic:
+                os.replace(target, fname)
+        finally:
+            if atomic and os.path.exists(target):
+                os.remove(target)
+    return fname
+
+
 def write_pod_hdf(g, fname, append=False):
     """Write or append to an HDF file."""
     # raise NotImplementedError
@@ -62,6 +225,32 @@ def write_pod_hdf(g, fname, append=False):
     #     pass
     return
 
+def display_level(ax, extent):
+    """ Derives the STARE level at which a trixel is roughly the size of a pixel of the axes.
+
+    Parameters
+    -----------
+    ax: matplotlib.axes.Axes
+        the axes to plot into. Its size in pixels depends on the figure DPI.
+    extent: tuple
+        (lon_min, lon_max, lat_min, lat_max) of the region to plot
+
+    Returns
+    --------
+    level: int
+        STARE level
+    """
+    window = ax.get_window_extent()
+    width = max(window.width, 1)
+    height = max(window.height, 1)
+    degrees_per_pixel = max((extent[1] - extent[0]) / width, (extent[3] - extent[2]) / height)
+    if degrees_per_pixel <= 0:
+        return 27
+    # The edges of level 0 trixels span roughly 90 degrees; each level halves them
+    level = int(numpy.floor(numpy.log2(90 / degrees_per_pixel)))
+    return min(max(level, 0), 27)
+
+
 class STAREDataFrame(geopandas.GeoDataFrame):
     _metadata = ['_sid_column_name', '_trixel_column_name', '_geometry_column_name', '_tid_column_name']
 
@@ -695,12 +884,12 @@ class STAREDataFrame(geopandas.GeoDataFrame):
         trixels = geopandas.GeoSeries(df[trixel_column_name])
         split = starepandas.tools.trixel_conversions.split_antimeridian_series(trixels, drop=drop)
 
-        df[df._trixel_column_name] = split
+        df[trixel_column_name] = split
 
         if not inplace:
             return df
 
-    def plot(self, trixels=True, boundary=True, **kwargs):
+    def plot(self, trixels=True, boundary=True, max_level=None, aggfunc='mean', **kwargs):
         """ Generate a plot with matplotlib.
         Seminal method to
         `GeoDataFrame.plot() <https://geopandas.org/docs/reference/api/geopandas.GeoDataFrame.plot.html>`_
@@ -712,6 +901,13 @@ class STAREDataFrame(geopandas.GeoDataFrame):
             Toggle if trixels (rather than the SF geometry) is to be plotted
         boundary: bool
             Toggle if the ring is to be plotted as a linestring rather than the polygon. Only relevant if trixels==True
+        max_level: int or 'auto'
+            If set, the trixels are not taken from the trixel column. Instead, the SIDs are coarsened to max_level
+            (c.f. :func:`~coarsen`) and trixels are created only for the coarse SIDs within the axes extent.
+            If 'auto', max_level is derived from the axes extent and the figure DPI so that
+            a trixel is roughly the size of a pixel.
+        aggfunc: str or callable
+            Aggregation of the plotted column per coarse trixel. Only relevant if max_level is set.
 
         Examples
         --------
@@ -721,7 +917,16 @@ class STAREDataFrame(geopandas.GeoDataFrame):
         # >>> germany = world[world.name=='Germany']
         # >>> germany = starepandas.STAREDataFrame(germany, add_sids=True, level=8, add_trixels=True, n_partitions=1)
         # >>> ax = germany.plot(trixels=True, boundary=True, color='y', zorder=0)
+        #
+        # Level of detail plotting of a full resolution granule
+        #
+        # >>> fname = starepandas.datasets.get_path('MOD05_L2.A2019336.0000.061.2019336211522.hdf')
+        # >>> modis = starepandas.read_granule(fname, sidecar=True, nom_res='5km')
+        # >>> ax = modis.plot(max_level='auto', column='Water_Vapor_Infrared', boundary=False)
         """
+        if max_level is not None:
+            return self._plot_coarsened(max_level=max_level, boundary=boundary, aggfunc=aggfunc, **kwargs)
+
         df = self.__deepcopy__()
 
         if trixels:
@@ -735,6 +940,61 @@ class STAREDataFrame(geopandas.GeoDataFrame):
             df.set_geometry(self._geometry_column_name, inplace=True)
         return geopandas.plotting.plot_dataframe(df, **kwargs)
 
+    def _plot_coarsened(self, max_level, boundary=True, aggfunc='mean', **kwargs):
+        """ Plots the trixels of the SIDs coarsened to max_level. C.f. :func:`~plot` """
+        import matplotlib.pyplot
+
+        ax = kwargs.pop('ax', None)
+        if ax is None:
+            fig, ax = matplotlib.pyplot.subplots(figsize=kwargs.pop('figsize', None))
+        column = kwargs.get('column')
+
+        df = self.dropna(subset=[self._sid_column_name])
+        if df[self._sid_column_name].dtype == numpy.dtype('O'):
+            df = df.explode(self._sid_column_name)
+        sids = df[self._sid_column_name].to_numpy(dtype=numpy.int64)
+        if len(sids) == 0:
+            return ax
+
+        if ax.get_autoscale_on():
+            # The distinct level 10 trixels locate the data well enough to determine the extent
+            probe = pystare.spatial_coerce_resolution(sids, 10)
+            probe = numpy.unique(pystare.spatial_clear_to_resolution(numpy.array(probe)))
+            lat, lon = pystare.to_latlon(probe)
+            lon = (lon + 180) % 360.0 - 180
+            extent = (lon.min(), lon.max(), lat.min(), lat.max())
+        else:
+            extent = ax.get_xlim() + ax.get_ylim()
+
+        if max_level == 'auto':
+            max_level = display_level(ax, extent)
+
+        coarse = df.coarsen(level=max_level, column=column, aggfunc=aggfunc)
+
+        if not ax.get_autoscale_on():
+            # Only create trixels for what is visible. We first find the visible parents a few levels up
+            # and then only look at the children of those.
+            for level in (max(max_level - 4, 0), max_level):
+                coarse_sids = coarse[coarse._sid_column_name].to_numpy()
+                parents = pystare.spatial_coerce_resolution(coarse_sids, level)
+                parents = pystare.spatial_clear_to_resolution(numpy.array(parents))
+                distinct = numpy.unique(parents)
+                lat, lon = pystare.to_latlon(distinct)
+                lon = (lon + 180) % 360.0 - 180
+                margin = 90 / 2 ** level
+                visible = (lon >= extent[0] - margin) & (lon <= extent[1] + margin) & \
+                          (lat >= extent[2] - margin) & (lat <= extent[3] + margin)
+                coarse = coarse[numpy.isin(parents, distinct[visible])]
+
+        trixels = starepandas.tools.trixel_conversions.trixels_from_stareseries(coarse[coarse._sid_column_name],
+                                                                                 wrap_lon=False)
+        trixels = starepandas.tools.trixel_conversions.split_antimeridian_series(trixels)
+        if boundary:
+            trixels = trixels.boundary
+
+        gdf = geopandas.GeoDataFrame(coarse.drop(columns=[coarse._sid_column_name]), geometry=trixels)
+        return geopandas.plotting.plot_dataframe(gdf, ax=ax, **kwargs)
+
     def to_scidb(self, connection):
         pass
 
@@ -978,6 +1238,50 @@ class STAREDataFrame(geopandas.GeoDataFrame):
         if not inplace:
             return df
 
+    def coarsen(self, level, column=None, aggfunc='mean'):
+        """
+        Coarsens the STARE index values to level and aggregates the rows falling into the same coarse trixel.
+        SIDs that already are at or below level are kept as is.
+
+        Parameters
+        ------------
+        level: int
+            STARE level to coarsen to.
+        column: str
+            column to aggregate per coarse trixel. If None, the coarse SIDs are dissolved (c.f.
+            :func:`~starepandas.compress_sids`), merging siblings into their parents.
+        aggfunc: str or callable
+            aggregation function. E.g. 'first', 'sum', 'mean'.
+
+        Returns
+        -------------
+        coarse: STAREDataFrame
+            One row per coarse trixel, holding the coarse SIDs and, if set, the aggregated column.
+
+        Examples
+        --------
+        # >>> sids = [2299437706637111721, 2299435211084507593, 2299566194809236969]
+        # >>> sdf = starepandas.STAREDataFrame(sids=sids, data={'a': [1, 2, 3]})
+        # >>> sdf.coarsen(level=4, column='a')
+        #                   sids    a
+        # 0  2299435055447015428  1.5
+        # 1  2299564797819093004  3.0
+        """
+        sids = self[self._sid_column_name].to_numpy(dtype=numpy.int64)
+        coarse_sids = sids.copy()
+        finer = pystare.spatial_resolution(sids) > level
+        if finer.any():
+            coerced = pystare.spatial_coerce_resolution(sids[finer], level)
+            coarse_sids[finer] = pystare.spatial_clear_to_resolution(numpy.array(coerced))
+
+        if column is None:
+            coarse_sids = starepandas.compress_sids(coarse_sids)
+            return STAREDataFrame(sids=coarse_sids)
+
+        aggregated = self[column].groupby(coarse_sids).agg(aggfunc)
+        coarse = STAREDataFrame({column: aggregated.to_numpy()}, sids=aggregated.index.to_numpy())
+        return coarse
+
     def clear_to_level(self, inplace=False):
         """
         Clears location bits to level
@@ -1083,99 +1387,140 @@ class STAREDataFrame(geopandas.GeoDataFrame):
                 sids.append(pystare.int2hex(row))
         return sids
 
-    def write_pods_spatial(self, pod_root, level, chunk_name, hex=True, path_format=None, append=False,
-                           compress=None
-                           ):
-        pod_path_format = '{pod_root}/{pod}'
-        path_format = '{pod_path_format}/{chunk_name}' if path_format is None else path_format
-        pods_written = []
+    def pod_partitions(self, level, temporal_keys=None):
+        """ Partitions the rows into the pods at level with a single stable sort.
 
-        grouped = self.groupby(self.to_sids_level(level=level, clear_to_level=True)[self._sid_column_name])
-        for group in grouped.groups:
-            # print('group: ',group,type(group),grouped.get_group(group).size)
-            if group < 0:
-                continue
-            g = grouped.get_group(group)
-            if hex:
-                pod = pystare.int2hex(group)
-            else:
-                pod = group
+        Rows without (valid) SIDs are not assigned to any pod.
 
-            # Original
-            # g.to_pickle('{pod_root}/{pod}/{chunk_name}'.format(pod_root=pod_root, pod=pod, chunk_name=chunk_name))
+        Parameters
+        ------------
+        level: int
+            level of the pods
+        temporal_keys: array-like
+            optional per-row keys (e.g. tpods) by which the pods are partitioned further.
+            A pod then appears once per distinct key.
 
-            # New MLR 2022-1117-1
-            # Note: with the following approach we could update a headr that includes extent information.
-            #
+        Returns
+        ---------
+        pod_sids: numpy.ndarray
+            the SIDs of the (non-empty) pods
+        starts: numpy.ndarray
+            for each pod, the position of its first row in the sorted frame
+        ends: numpy.ndarray
+            for each pod, the position after its last row in the sorted frame
+        order: numpy.ndarray
+            the permutation sorting the frame by pod; i.e. the rows of pod i are self.take(order)[starts[i]:ends[i]]
+        """
+        sids = self[self._sid_column_name]
+        if not pandas.api.types.is_integer_dtype(sids):
+            raise TypeError('Pods can only be written from a column of single (integer) SIDs')
+        sids = sids.to_numpy(dtype=numpy.int64, na_value=-1)
+        keys = numpy.full(len(sids), -1, dtype=numpy.int64)
+        valid = sids >= 0
+        keys[valid] = pystare.spatial_clear_to_resolution(pystare.spatial_coerce_resolution(sids[valid], level))
+        if temporal_keys is None:
+            order = numpy.argsort(keys, kind='stable')
+            keys = keys[order]
+            change = keys[1:] != keys[:-1]
+        else:
+            temporal_keys = numpy.asarray(temporal_keys)
+            order = numpy.lexsort((temporal_keys, keys))
+            keys = keys[order]
+            temporal_keys = temporal_keys[order]
+            change = (keys[1:] != keys[:-1]) | (temporal_keys[1:] != temporal_keys[:-1])
+        starts = numpy.flatnonzero(numpy.r_[True, change]) if len(keys) > 0 else numpy.array([], int)
+        ends = numpy.r_[starts[1:], len(keys)].astype(int)
+        valid = keys[starts] >= 0
+        return keys[starts[valid]], starts[valid], ends[valid], order
+
+    def _write_pod_partitions(self, pod_root, level, hex, path_format, append, compress, format, manifest,
+                              num_workers, atomic=False, lock=False, tid=None, **names):
+        """Writes the pod partitions at level to path_format.format(pod_path_format=<pod dir>, **names)."""
+        if manifest is None:
+            manifest = not atomic
+        pod_path_format = '{pod_root}/{pod}'
+        start = time.time()
+        pod_sids, starts, ends, order = self.pod_partitions(level)
+        frame = self.take(order)
+        logging.info('Partitioning %s took %d seconds.' % (names.get('chunk_name'), time.time() - start))
+
+        def write(i):
+            pod = pystare.int2hex(pod_sids[i]) if hex else int(pod_sids[i])
             dname = pod_path_format.format(pod_root=pod_root, pod=pod)
-            if not Path(dname).exists():
-                Path(dname).mkdir()
+            Path(dname).mkdir(parents=True, exist_ok=True)
+            fname = path_format.format(pod_path_format=dname, **names)
+            g = frame.iloc[starts[i]:ends[i]]
+            with pod_lock(dname) if lock else contextlib.nullcontext():
+                fname = write_pod(g, fname, append, compress, format, self._sid_column_name, atomic=atomic)
+                record = starepandas.io.manifest.chunk_record(pod_root, fname, pod, len(g), g.columns, format, tid)
+                if manifest and lock:
+                    # Recorded under the pod lock, so that a compaction of the pod (c.f. compact_pod) cannot
+                    # remove the chunk before it is in the manifest
+                    starepandas.io.manifest.update_manifest(pod_root, [record], append=append)
+            return fname, record
+
+        if num_workers is None or num_workers <= 1:
+            written = list(map(write, range(len(pod_sids))))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+                written = list(executor.map(write, range(len(pod_sids))))
 
-            fname = path_format.format(pod_path_format=dname, chunk_name=chunk_name)
-            write_pod_pickle(g, fname, append, compress)
-            pods_written.append(fname)
+        if manifest and not lock:
+            starepandas.io.manifest.update_manifest(pod_root, [record for _, record in written], append=append)
+        return [fname for fname, _ in written]
 
-        return pods_written
+    def write_pods_spatial(self, pod_root, level, chunk_name, hex=True, path_format=None, append=False,
+                           compress=None, format='pickle', manifest=None, num_workers=1, atomic=False, lock=False
+                           ):
+        path_format = '{pod_path_format}/{chunk_name}' if path_format is None else path_format
+        return self._write_pod_partitions(pod_root, level, hex, path_format, append, compress, format, manifest,
+                                          num_workers, atomic=atomic, lock=lock, chunk_name=chunk_name)
 
     def write_pods_granule(self, pod_root, level, chunk_name, hex=True, path_format=None, append=False,
-                           compress=None
+                           compress=None, format='pickle', manifest=None, num_workers=1, atomic=False, lock=False
                            ):
         start0 = time.time()
-        pod_path_format = '{pod_root}/{pod}'
         path_format = '{pod_path_format}/{tchunk_name}-{chunk_name}' if path_format is None else path_format
 
-        pods_written = []
+        # The granule's temporal cover is shared by all of its pods
+        t_mnmx = (self['ts_start'].min(), self['ts_end'].max())
+        dt_mnmx = [t.to_pydatetime() for t in t_mnmx]
+        ds_tid = pystare.tiv_from_datetime2(dt_mnmx)
+        tchunk_name = pystare.hex16(ds_tid)
 
-        start = time.time()
-        grouped = self.groupby(self.to_sids_level(level=level, clear_to_level=True)[self._sid_column_name])
-        logging.info('Grouping chunk %s took %d seconds.' % (chunk_name, time.time() - start))
-
-        for group in grouped.groups:
+        pods_written = self._write_pod_partitions(pod_root, level, hex, path_format, append, compress, format,
+                                                  manifest, num_workers, atomic=atomic, lock=lock, tid=ds_tid,
+                                                  chunk_name=chunk_name,
+                                                  tchunk_name=tchunk_name)
+        logging.info('write_pods_granule chunk %s took %d seconds total.' % (chunk_name, time.time() - start0))
+        return pods_written
 
-            # Future            
-            # self.write_pods_granule_group(self,(group,pod_path_format,pod_root,chunk_name))            
-            # print('group: ',group,type(group),grouped.get_group(group).size)
-            if group < 0:  # This cannot be right. group is a dictionary.
-                continue
+    def _row_tids(self):
+        """Returns a temporal index value per row; its TID or the TID covering [ts_start, ts_end]."""
+        if self._tid_column_name in self.columns:
+            return self[self._tid_column_name].to_numpy(dtype=numpy.int64)
+        if 'ts_start' not in self.columns:
+            raise ValueError('Temporal pods require a TID column ({}) or ts_start/ts_end columns'.format(
+                self._tid_column_name))
+        end_column = 'ts_end' if 'ts_end' in self.columns else 'ts_start'
+        start_ms, end_ms = [pandas.to_datetime(self[column], utc=True).dt.tz_localize(None)
+                            .to_numpy(dtype='datetime64[ms]').astype(numpy.int64)
+                            for column in ['ts_start', end_column]]
+        return starepandas.tools.temporal_conversions.tivs_from_ms_intervals(start_ms, end_ms)
 
-            start = time.time()
-            g = grouped.get_group(group)
-            logging.info('Get group %s took %d seconds.' % (group, time.time() - start))
+    def write_pods_tpod(self, pod_root, level, chunk_name, hex=True, path_format=None, append=False,
+                        temporal_chunking_resolution=16, compress=None, format='pickle', manifest=None,
+                        num_workers=1, atomic=False, lock=False):
+        """ Writes the dataframe into spatial pods, which are partitioned further into temporal pods (tpods).
 
-            if hex:
-                pod = pystare.int2hex(group)
-            else:
-                pod = group
+        Each row goes into the tpod (c.f. pystare.make_tpod_tuple) in which its temporal cover starts. Rows
+        are compared by their TIDs or, if the frame has no TID column, by their [ts_start, ts_end] interval.
+        A chunk whose rows extend into later tpods is written once and symlinked into each of these tpods.
 
-            dname = pod_path_format.format(pod_root=pod_root, pod=pod)
-            if not Path(dname).exists():
-                Path(dname).mkdir()
-                pass
-
-            # One might cheat and use the fact that ts_start and ts_end are for the granule, so index to [0]
-            start = time.time()
-            t_mnmx = (self['ts_start'].min(), self['ts_end'].max())
-            logging.info('Get group %s min/max took %d seconds.' % (group, time.time() - start))
-
-            start = time.time()
-            dt_mnmx = [t.to_pydatetime() for t in t_mnmx]
-            ds_tid = pystare.tiv_from_datetime2(dt_mnmx)
-            logging.info('Get group %s min/max tiv took %d seconds.' % (group, time.time() - start))
-
-            # ds_tpod = pystare.make_tpod_tuple(ds_tid,temporal_resolution)
-            # tpod        = pystare.hex16(ds_tpod[0])
-            tchunk_name = pystare.hex16(ds_tid)
-            fname = path_format.format(pod_path_format=dname, chunk_name=chunk_name, tchunk_name=tchunk_name)
-            write_pod_pickle(g, fname, append, compress)
-            pods_written.append(fname)
+        The layout is {pod_root}/{pod}/{tpod}/{tchunk}-{chunk_name}, where tchunk is the TID cover of the chunk. E.g.
 
-        logging.info('write_pods_granule chunk %s took %d seconds total.' % (chunk_name, time.time() - start0))
-        return pods_written
+            pods/0x0a00000000000004/0x1f94000000000000_16/0x1f94540025001145-MOD09.A2021025.pkl
 
-    def write_pods_tpod(self, pod_root, level, chunk_name, hex=True, path_format=None, append=False,
-                        temporal_chunking_resolution=16, compress=None
-                        ):
-        """
         Parameters
         ----------
         pod_root: str
@@ -1184,76 +1529,88 @@ class STAREDataFrame(geopandas.GeoDataFrame):
         hex: bool
             toggle hex
         path_format
+            default: '{pod_path_format}/{tchunk_name}-{chunk_name}' with pod_path_format the tpod directory
         append: bool
         temporal_chunking_resolution: int
             defaults to 16 (28 days)
+        compress: str
+        format: str
+        manifest: bool
+            Default: unless atomic (c.f. :meth:`write_pods`)
+        num_workers: int
+        atomic: bool
+        lock: bool
 
         Returns
         -------
-
-        """
-
-        """
-        TODO: Add temporal partitioning. Currently broken.
+        pods_written: list
+            the paths of the chunks written (not including the links)
         """
-        raise NotImplementedError
-
-        pod_path_format = '{pod_root}/{pod}'
-        path_format = '{pod_path_format}/{tpod_name}-{tchunk_name}-{chunk_name}' if path_format is None else path_format
-        pods_written = []
-
-        grouped = self.groupby(self.to_sids_level(level=level, clear_to_level=True)[self._sid_column_name])
-        for group in grouped.groups:
-            # print('group: ',group,type(group),grouped.get_group(group).size)
-            if group < 0:  # cannot be right. group is a dictionary
-                continue
-            g = grouped.get_group(group)
-            if hex:
-                pod = pystare.int2hex(group)
-            else:
-                pod = group
-
-            dname = pod_path_format.format(pod_root=pod_root, pod=pod)
-            if not Path(dname).exists():
-                Path(dname).mkdir()
-                pass
-
-            t_mnmx = self.ts_start.min(), self.ts_end.max()
-            dt_mnmx = [t.to_pydatetime() for t in t_mnmx]
-            ds_tid = pystare.tiv_from_datetime2(dt_mnmx)
-
-            tpod_name = pystare.format_tpod(pystare.make_tpod_tuple(ds_tid, temporal_chunking_resolution))
-
-            # ds_tpod = pystare.make_tpod_tuple(ds_tid,temporal_resolution)
-            # tpod        = pystare.hex16(ds_tpod[0])
-            tchunk_name = pystare.hex16(ds_tid)
-            fname = path_format.format(pod_path_format=dname,
-                                       tpod_name=tpod_name,
-                                       tchunk_name=tchunk_name,
-                                       chunk_name=chunk_name)
-            write_pod_pickle(g, fname, append, compress)
-            pods_written.append(fname)
+        if manifest is None:
+            manifest = not atomic
+        resolution = temporal_chunking_resolution
+        pod_path_format = '{pod_root}/{pod}/{tpod_name}'
+        path_format = '{pod_path_format}/{tchunk_name}-{chunk_name}' if path_format is None else path_format
 
-        return pods_written
+        start = time.time()
+        tids = self._row_tids()
+        lower = pystare.lower_bound_ms(tids)
+        upper = pystare.upper_bound_ms(tids)
+        # The first and last tpods of each row, c.f. pystare.pods_in_query
+        first_tpods = pystare.make_tpod_tuple(lower, resolution)[0].astype(numpy.int64)
+        last_tpods = pystare.make_tpod_tuple(upper, resolution)[0].astype(numpy.int64)
+
+        pod_sids, starts, ends, order = self.pod_partitions(level, temporal_keys=first_tpods)
+        frame = self.take(order)
+        last_tpods = last_tpods[order]
+        # Rows without SIDs sort first, so that the chunks are consecutive up to the last row
+        covers = starepandas.tools.temporal_conversions.tivs_from_ms_intervals(
+            numpy.minimum.reduceat(pystare.to_ms_since_epoch_utc(lower)[order], starts),
+            numpy.maximum.reduceat(pystare.to_ms_since_epoch_utc(upper)[order], starts))
+        logging.info('Partitioning %s took %d seconds.' % (chunk_name, time.time() - start))
+
+        def write(i):
+            pod = pystare.int2hex(pod_sids[i]) if hex else int(pod_sids[i])
+            first_tpod = int(first_tpods[order[starts[i]]])
+            chunk_last_tpods = numpy.unique(last_tpods[starts[i]:ends[i]])
+            # The union of the pystare.pods_in_query() tpods of the rows
+            step = 1 << (62 - resolution)
+            tpods = sorted(set(range(first_tpod, int(chunk_last_tpods[-1]), step)) | set(chunk_last_tpods.tolist()))
+            cover = covers[i]
+
+            fnames = []
+            for tpod in tpods:
+                dname = pod_path_format.format(pod_root=pod_root, pod=pod,
+                                               tpod_name=pystare.format_tpod((tpod, resolution)))
+                Path(dname).mkdir(parents=True, exist_ok=True)
+                fnames.append(path_format.format(pod_path_format=dname, tchunk_name=pystare.hex16(cover),
+                                                 chunk_name=chunk_name))
+            g = frame.iloc[starts[i]:ends[i]]
+            written = write_pod(g, fnames[0], append, compress, format, self._sid_column_name, atomic=atomic,
+                                lock=lock)
+            # Rows appended atomically went into a new chunk, which is linked under the same suffix
+            suffix = written[len(fnames[0]):]
+            fnames = [written] + [link + suffix for link in fnames[1:]]
+            for link in fnames[1:]:
+                tmp_link = temporary_path(link)
+                os.symlink(os.path.relpath(fnames[0], os.path.dirname(link)), tmp_link)
+                os.replace(tmp_link, link)
+            return fnames[0], starepandas.io.manifest.chunk_record(pod_root, fnames[0], pod, len(g), g.columns,
+                                                                   format, cover)
+
+        if num_workers is None or num_workers <= 1:
+            written = list(map(write, range(len(pod_sids))))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+                written = list(executor.map(write, range(len(pod_sids))))
 
-    ### Just stashing this here for the moment.
-
-    ### if temporal_chunking:
-    ###     # link other pods to this one? sigh... no chunking really.
-    ###     tpods = pystare.pods_in_query(ds_tid,temporal_resolution)
-    ###     for tp_ in tpods:
-    ###         tp=pystare.hex16(tp_[0])
-    ###         if tp != tpod:
-    ###             dst_name = path_format.format(pod_root=pod_root
-    ###                                    , pod=pod
-    ###                                    , chunk_name=chunk_name
-    ###                                    , tpod=tp
-    ###                                    , tchunk_name=tchunk_name
-    ###                                    )
-    ###             os.symlink(fname,dst_name) # creates dst_name symlinking to fname (the src)
+        if manifest:
+            starepandas.io.manifest.update_manifest(pod_root, [record for _, record in written], append=append)
+        return [fname for fname, _ in written]
 
     def write_pods(self, pod_root, level, chunk_name, hex=True, path_format=None, append=False,
-                   temporal_chunking=None, compress=None):
+                   temporal_chunking=None, compress=None, format='pickle', manifest=None, num_workers=1,
+                   writer_id=None, lock=False):
         """ Writes dataframe into a STAREPods hierarchy.
 
         Appends the dataframe to the pod (pickle), if it exists.
@@ -1275,24 +1632,74 @@ class STAREDataFrame(geopandas.GeoDataFrame):
             default: '{pod_root}/{pod}/{chunk_name}'
         append: bool
             toggle appending to existing pods (default: False)
-            Not implemented.
+            Pickles get another pickled frame, arrow chunks are rewritten. Parquet files cannot be extended, so
+            appends go to new part files next to the chunk ('{chunk_name}.{suffix}'), which read_pods reads along
+            with the chunk and compact_pods merges. Pods appended to often are best compacted regularly.
         temporal_chunking: dict
             toggle writing into temporal pods (default: None)
             Supported options...
             - {'partitioning':'granule'}
             - {'partitioning':'pod','resolution':16 } # 16 => month chunk (28 days)
+        compress: str
+            compression of the chunks. 'bz2', 'zstd', or 'lz4' for pickles; any parquet codec (e.g. 'zstd', 'snappy')
+            for parquet. A dict like {'method': 'zstd', 'level': 19} also sets the compression level.
+            zstd and lz4 pickles require the zstandard and lz4 packages. Readers detect the compression.
+        format: str
+            'pickle' (default), 'parquet', or 'arrow'. Parquet chunks are SID sorted, support column projection
+            and SID range pruning on read, also within a chunk since rows are written in row groups of
+            PARQUET_ROW_GROUP_SIZE rows.
+            Arrow (IPC/Feather v2) chunks are SID sorted and uncompressed, and are memory mapped on read:
+            their numeric columns are zero-copy views that page in only what a query touches.
+        manifest: bool
+            record the written chunks in the manifest of pod_root (c.f. :func:`starepandas.rebuild_manifest`),
+            which lets read_pods resolve queries without listing the pod directories.
+            The manifest is a single SQLite file, updated by every writer under SQLite's file locks. These
+            serialize concurrent writers and are unreliable on network filesystems such as NFS or Lustre.
+            Parallel ingests should therefore write with a writer_id and without the manifest, and run
+            rebuild_manifest once they are done; until then, read_pods only finds their chunks in a pod_root
+            with a manifest if check_stale is set. Default: True, unless writer_id is set
+        num_workers: int
+            number of threads writing pods concurrently (default: 1)
+        writer_id: str or bool
+            Gives this writer its own chunk files, named '{chunk_name}.{writer_id}', so that any number of
+            (ingest) processes can write and append to the same pods concurrently. Chunks are then written to
+            temporary files that are renamed into place, so that readers never see partial chunks. Appends
+            go into new chunks named '{chunk_name}.{writer_id}.{suffix}', which compact_pods merges.
+            True uses '{hostname}.{pid}'. (default: None)
+        lock: bool
+            hold an advisory fcntl lock per pod while writing it and recording it in the manifest. Serializes
+            writers sharing chunk files, e.g. appending without a writer_id, and compact_pods. (default: False)
+
+        Examples
+        ---------
+        Each ingest process appending granules into shared pods
+
+        # >>> sdf.write_pods('pods/', level=6, chunk_name='MOD09', append=True, writer_id=True)
         """
+        atomic = writer_id is not None
+        if manifest is None:
+            manifest = not atomic
+        if writer_id is True:
+            writer_id = '{}.{}'.format(socket.gethostname(), os.getpid())
+        if writer_id is not None:
+            chunk_name = '{}.{}'.format(chunk_name, writer_id)
 
         if temporal_chunking is None:
             return self.write_pods_spatial(pod_root=pod_root, level=level, chunk_name=chunk_name, hex=hex,
-                                           path_format=path_format, append=append, compress=compress)
+                                           path_format=path_format, append=append, compress=compress,
+                                           format=format, manifest=manifest, num_workers=num_workers,
+                                           atomic=atomic, lock=lock)
         elif temporal_chunking['partitioning'] == 'granule':
             return self.write_pods_granule(pod_root=pod_root, level=level, chunk_name=chunk_name, hex=hex,
-                                           path_format=path_format, append=append, compress=compress)
+                                           path_format=path_format, append=append, compress=compress,
+                                           format=format, manifest=manifest, num_workers=num_workers,
+                                           atomic=atomic, lock=lock)
         elif temporal_chunking['partitioning'] == 'pod':
             return self.write_pods_tpod(pod_root=pod_root, level=level, chunk_name=chunk_name, hex=hex,
                                         path_format=path_format, append=append, compress=compress,
-                                        temporal_chunking_resolution=temporal_chunking['resolution'])
+                                        temporal_chunking_resolution=temporal_chunking.get('resolution', 16),
+                                        format=format, manifest=manifest, num_workers=num_workers,
+                                        atomic=atomic, lock=lock)
         else:
             raise (Exception('Pod configuration not supported. temporal_chunking = %s' % (temporal_chunking)))
 
@@ -1382,6 +1789,96 @@ class STAREDataFrame(geopandas.GeoDataFrame):
 
         return arrays
 
+    def rasterize(self, column, width, height, bbox=None, agg='mean', method='centers'):
+        """ Rasterizes a column into a 2D array without creating trixel geometries.
+
+        Each SID is binned into the pixel holding its trixel center. With method='footprint', each SID is binned
+        into every pixel whose center its trixel covers, so that trixels larger than a pixel are rasterized without
+        holes (c.f. :func:`~starepandas.tools.trixel_conversions.to_pixels`); each trixel counts once per pixel.
+        With method='latlon', the location encoded in the SID (c.f. pystare.to_latlon()) is binned; this skips
+        the trixel vertex lookup and is the fastest option for SIDs looked up from e.g. pixel centers.
+        The values are then aggregated per pixel. The array is north-up; i.e. pixel [0, 0] is the
+        north-west corner of bbox. It can be passed to e.g. matplotlib's imshow(extent=...) or written to a GeoTIFF.
+
+        Parameters
+        ----------
+        column: str
+            column to rasterize
+        width: int
+            number of pixels in longitude direction
+        height: int
+            number of pixels in latitude direction
+        bbox: tuple
+            (lon_min, lat_min, lon_max, lat_max) of the raster. Default: (-180, -90, 180, 90)
+        agg: str
+            aggregation of the values falling into the same pixel. Either 'mean', 'sum', 'count', 'min', or 'max'
+        method: str
+            either 'centers', 'footprint', or 'latlon'
+
+        Returns
+        --------
+        raster: numpy.array
+            array of shape (height, width). Pixels without any values are NaN.
+
+        Examples
+        ----------
+        # >>> sdf = starepandas.STAREDataFrame({'a': [1, 2, 3]}, sids=starepandas.sids_from_xy([10, 10, -10], [5, 5, -5], 10))
+        # >>> sdf.rasterize('a', width=2, height=2, bbox=(-20, -10, 20, 10))
+        # array([[nan, 1.5],
+        #        [3. , nan]])
+        """
+        if bbox is None:
+            bbox = (-180, -90, 180, 90)
+        lon_min, lat_min, lon_max, lat_max = bbox
+
+        df = self.dropna(subset=[self._sid_column_name])
+        sids = df[df._sid_column_name].to_numpy(dtype=numpy.int64)
+        values = df[column].to_numpy(dtype=numpy.double, na_value=numpy.nan)
+
+        if method == 'footprint':
+            pixels, trixels = starepandas.tools.trixel_conversions.to_pixels(sids, bbox, width, height)
+            values = values[trixels]
+            valid = ~numpy.isnan(values)
+            pixels = pixels[valid]
+            values = values[valid]
+        else:
+            if method == 'latlon':
+                lat, lon = pystare.to_latlon(sids)
+                lon = (lon + 180) % 360.0 - 180
+            elif method == 'centers':
+                vertices = starepandas.tools.trixel_conversions.to_vertices(sids)
+                lat = vertices[2]
+                lon = vertices[3]
+            else:
+                raise ValueError('rasterize argument method="%s" not understood.' % method)
+
+            col = numpy.floor((lon - lon_min) / (lon_max - lon_min) * width).astype(numpy.int64)
+            row = numpy.floor((lat_max - lat) / (lat_max - lat_min) * height).astype(numpy.int64)
+            inside = (col >= 0) & (col < width) & (row >= 0) & (row < height) & ~numpy.isnan(values)
+            pixels = row[inside] * width + col[inside]
+            values = values[inside]
+
+        n_pixels = width * height
+        counts = numpy.bincount(pixels, minlength=n_pixels)
+        if agg == 'count':
+            raster = counts.astype(numpy.double)
+        elif agg in ('mean', 'sum'):
+            raster = numpy.bincount(pixels, weights=values, minlength=n_pixels)
+            if agg == 'mean':
+                with numpy.errstate(invalid='ignore', divide='ignore'):
+                    raster = raster / counts
+        elif agg == 'min':
+            raster = numpy.full(n_pixels, numpy.inf)
+            numpy.minimum.at(raster, pixels, values)
+        elif agg == 'max':
+            raster = numpy.full(n_pixels, -numpy.inf)
+            numpy.maximum.at(raster, pixels, values)
+        else:
+            raise ValueError('rasterize argument agg="%s" not understood.' % agg)
+
+        raster[counts == 0] = numpy.nan
+        return raster.reshape(height, width)
+
     def to_sidecar(self, file_name, cover=False, shuffle=True, zlib=True):
         """ Writes STARE Sidecar
 
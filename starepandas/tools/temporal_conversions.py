@@ -1,6 +1,19 @@
 import astropy.time
+import numpy
 import pystare
 
+# Position of the millisecond field in temporal index values
+MS_SHIFT = 14
+
+# Milliseconds spanned by the STARE temporal resolutions 0..48 (c.f. pystare.coarsest_resolution_finer_or_equal_ms());
+# resolution 49 is an instant
+RESOLUTION_MS = numpy.array([129171456000000, 64585728000000, 32292864000000, 16146432000000, 8073216000000,
+                             4036608000000, 2018304000000, 1009152000000, 504576000000, 252288000000, 126144000000,
+                             63072000000, 31536000000, 19353600000, 9676800000, 4838400000, 2419200000, 1209600000,
+                             604800000, 345600000, 172800000, 86400000, 57600000, 28800000, 14400000, 7200000,
+                             3600000, 1920000, 960000, 480000, 240000, 120000, 60000, 32000, 16000, 8000, 4000, 2000,
+                             1000, 512, 256, 128, 64, 32, 16, 8, 4, 2, 1, 0], dtype=numpy.int64)
+
 
 def tivs_from_timeseries(series, scale='utc', format='datetime64', forward_res=48, reverse_res=48):
     """ Converts a timeseries to temporal index values.
@@ -87,3 +100,92 @@ def tivs_from_timeseries(series, scale='utc', format='datetime64', forward_res=4
     times = astropy.time.Time(series, scale=scale, format=format)
     tivs = pystare.from_julian_date(times.jd1, times.jd2, scale=scale, forward_res=forward_res, reverse_res=reverse_res)
     return tivs
+
+
+def tivs_from_ms_since_epoch(ms_since_epoch_utc, forward_res=48, reverse_res=48):
+    """ Converts milliseconds since unix epoch (UTC) to temporal index values.
+
+    Gives the same result as pystare.from_ms_since_epoch_utc(), but only the whole seconds spanned
+    by the timestamps are converted by pystare; the milliseconds are then added to the millisecond field
+    of the temporal index values. This is fast for many timestamps spanning a short time, e.g.
+    the pixels of a swath granule.
+
+    Parameters
+    -----------
+    ms_since_epoch_utc: array-like of ints
+        milliseconds since unix epoch in UTC
+    forward_res: int. Valid range is 0..48
+        The forward resolution (c.f pystare.coarsest_resolution_finer_or_equal_ms())
+    reverse_res: int. Valid range is 0..48
+        The reverse resolution (c.f. pystare.coarsest_resolution_finer_or_equal_ms())
+
+    Returns
+    ----------
+    tivs: numpy.array
+        STARE temporal index values
+
+    Examples
+    ------------
+    >>> import numpy
+    >>> ms = numpy.array(['2021-01-03', '2021-01-03T00:00:00.001'], dtype='datetime64[ms]').astype(numpy.int64)
+    >>> tivs_from_ms_since_epoch(ms)
+    array([2275448110396223681, 2275448110396240065])
+    """
+    ms_since_epoch_utc = numpy.asarray(ms_since_epoch_utc, dtype=numpy.int64)
+    if ms_since_epoch_utc.size == 0:
+        return ms_since_epoch_utc.copy()
+    seconds = ms_since_epoch_utc // 1000
+    first, last = seconds.min(), seconds.max()
+    if last - first < seconds.size:
+        unique_seconds = numpy.arange(first, last + 1, dtype=numpy.int64)
+        inverse = seconds - first
+    else:
+        unique_seconds, inverse = numpy.unique(seconds, return_inverse=True)
+    tivs = pystare.from_ms_since_epoch_utc(unique_seconds * 1000, forward_res, reverse_res)[inverse]
+    tivs += (ms_since_epoch_utc - seconds * 1000) << MS_SHIFT
+    return tivs
+
+
+def tivs_from_ms_intervals(start_ms, end_ms):
+    """ Converts [start, end] intervals of milliseconds since unix epoch (UTC) to temporal index values.
+
+    Each interval is converted to the temporal index value of its midpoint, with the finest forward and reverse
+    resolutions covering the two halves of the interval. This is a vectorized pystare.tiv_from_datetime2(),
+    which also keeps the milliseconds. Where a half of an interval ends just past a calendar boundary,
+    pystare.tiv_from_datetime2() may pick a resolution one step finer.
+
+    Parameters
+    -----------
+    start_ms: array-like of ints
+        starts of the intervals in milliseconds since unix epoch in UTC
+    end_ms: array-like of ints
+        ends of the intervals in milliseconds since unix epoch in UTC
+
+    Returns
+    ----------
+    tivs: numpy.array
+        STARE temporal index values
+
+    Examples
+    ------------
+    >>> import numpy
+    >>> start = numpy.array(['2021-01-05', '2021-01-25'], dtype='datetime64[ms]').astype(numpy.int64)
+    >>> end = numpy.array(['2021-01-06', '2021-02-20'], dtype='datetime64[ms]').astype(numpy.int64)
+    >>> tivs = tivs_from_ms_intervals(start, end)
+    >>> bool(tivs[1] == pystare.tiv_from_string2(['2021-01-25T00:00:00', '2021-02-20T00:00:00']))
+    True
+    """
+    start_ms = numpy.asarray(start_ms, dtype=numpy.int64)
+    end_ms = numpy.asarray(end_ms, dtype=numpy.int64)
+    mid_ms = start_ms + (end_ms - start_ms) // 2
+    forward = numpy.searchsorted(-RESOLUTION_MS, mid_ms - end_ms, side='right') - 1
+    reverse = numpy.searchsorted(-RESOLUTION_MS, start_ms - mid_ms, side='right') - 1
+    # One conversion per distinct pair of resolutions
+    pairs, inverse = numpy.unique(forward * 64 + reverse, return_inverse=True)
+    order = numpy.argsort(inverse, kind='stable')
+    bounds = numpy.searchsorted(inverse[order], numpy.arange(len(pairs) + 1))
+    tivs = numpy.empty(mid_ms.shape, dtype=numpy.int64)
+    for pair, start, stop in zip(pairs, bounds[:-1], bounds[1:]):
+        rows = order[start:stop]
+        tivs[rows] = tivs_from_ms_since_epoch(mid_ms[rows], int(pair // 64), int(pair % 64))
+    return tivs
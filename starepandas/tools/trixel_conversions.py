@@ -1,7 +1,9 @@
 import math
+import warnings
 
 import dask.dataframe
 import numpy
+import pandas
 import pystare
 import shapely
 import geopandas
@@ -171,16 +173,9 @@ def vertices2corners(vertices):
 
     """
 
-    lats = vertices[0]
-    lons = vertices[1]
-
-    corners = []
-    i = 0
-    while i < len(lons):
-        corner = ((lons[i], lats[i]), (lons[i + 1], lats[i + 1]), (lons[i + 2], lats[i + 2]))
-        corners.append(corner)
-        i += 3
-    corners = numpy.array(corners)
+    lats = numpy.asarray(vertices[0]).reshape(-1, 3)
+    lons = numpy.asarray(vertices[1]).reshape(-1, 3)
+    corners = numpy.stack([lons, lats], axis=-1)
     return corners
 
 
@@ -457,6 +452,85 @@ def corners2gring(corners):
     return gcs
 
 
+def to_pixels(sids, bbox, width, height):
+    """ Finds the pixels of a raster covered by the trixels of sids.
+
+    A pixel is covered by a trixel if the pixel center lies inside the trixel (with straight edges in lon/lat).
+    Only the pixels within the bounding box of a trixel are tested. Trixels not covering any pixel center, i.e.
+    trixels smaller than a pixel, cover the pixel holding their center. Each trixel covers each pixel at most once.
+
+    Parameters
+    -----------
+    sids: array-like
+        STARE index values
+    bbox: tuple
+        (lon_min, lat_min, lon_max, lat_max) of the raster
+    width: int
+        number of pixels in longitude direction
+    height: int
+        number of pixels in latitude direction
+
+    Returns
+    --------
+    pixels: numpy.array
+        flat (row * width + col) indices of the covered pixels; row 0 being the north of bbox
+    trixels: numpy.array
+        position in sids of the trixel covering each of the pixels
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    dx = (lon_max - lon_min) / width
+    dy = (lat_max - lat_min) / height
+    sids = numpy.asarray(sids, dtype=numpy.int64)
+    vertices = to_vertices(sids, wrap_lon=False)
+    lat = vertices[0].reshape(-1, 3)
+    lon = ((vertices[1] + 180) % 360.0 - 180).reshape(-1, 3)
+
+    # Trixels crossing the antimeridian are unwrapped to the east and also tested shifted by a globe to the west
+    wrapped = (lon.max(axis=1) - lon.min(axis=1)) > 180
+    lon[wrapped] = numpy.where(lon[wrapped] < 0, lon[wrapped] + 360, lon[wrapped])
+    crossing = numpy.flatnonzero(lon.max(axis=1) > 180)
+    owners = numpy.concatenate([numpy.arange(len(sids)), crossing])
+    lat = numpy.concatenate([lat, lat[crossing]])
+    lon = numpy.concatenate([lon, lon[crossing] - 360])
+
+    # The pixels whose centers fall into the bounding box of each trixel
+    col_0 = numpy.clip(numpy.ceil((lon.min(axis=1) - lon_min) / dx - 0.5), 0, width).astype(numpy.int64)
+    col_1 = numpy.clip(numpy.floor((lon.max(axis=1) - lon_min) / dx - 0.5), -1, width - 1).astype(numpy.int64)
+    row_0 = numpy.clip(numpy.ceil((lat_max - lat.max(axis=1)) / dy - 0.5), 0, height).astype(numpy.int64)
+    row_1 = numpy.clip(numpy.floor((lat_max - lat.min(axis=1)) / dy - 0.5), -1, height - 1).astype(numpy.int64)
+    n_cols = numpy.maximum(col_1 - col_0 + 1, 0)
+    n_rows = numpy.maximum(row_1 - row_0 + 1, 0)
+    n_pixels = n_cols * n_rows
+
+    candidates = numpy.repeat(numpy.arange(len(lon)), n_pixels)
+    offsets = numpy.arange(n_pixels.sum()) - numpy.repeat(numpy.cumsum(n_pixels) - n_pixels, n_pixels)
+    cols = col_0[candidates] + offsets % n_cols[candidates]
+    rows = row_0[candidates] + offsets // n_cols[candidates]
+    x = lon_min + (cols + 0.5) * dx
+    y = lat_max - (rows + 0.5) * dy
+
+    # Point in triangle: the center is on the same side of all three edges
+    lat, lon = lat[candidates], lon[candidates]
+    sides = [(lon[:, (i + 1) % 3] - lon[:, i]) * (y - lat[:, i]) - (lat[:, (i + 1) % 3] - lat[:, i]) * (x - lon[:, i])
+             for i in range(3)]
+    sides = numpy.stack(sides)
+    inside = (sides >= 0).all(axis=0) | (sides <= 0).all(axis=0)
+    pixels = rows[inside] * width + cols[inside]
+    trixels = owners[candidates[inside]]
+
+    # Trixels smaller than a pixel cover the pixel of their center
+    small = numpy.ones(len(sids), dtype=bool)
+    small[trixels] = False
+    center_lat = vertices[2][small]
+    center_lon = (vertices[3][small] + 180) % 360.0 - 180
+    col = numpy.floor((center_lon - lon_min) / dx).astype(numpy.int64)
+    row = numpy.floor((lat_max - center_lat) / dy).astype(numpy.int64)
+    in_bbox = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+    pixels = numpy.concatenate([pixels, row[in_bbox] * width + col[in_bbox]])
+    trixels = numpy.concatenate([trixels, numpy.flatnonzero(small)[in_bbox]])
+    return pixels, trixels
+
+
 def to_trixels(sids, as_multipolygon=False, wrap_lon=True):
     """
     Converts a (collection of) sid(s) into a (collection of) trixel(s)
@@ -494,11 +568,8 @@ def to_trixels(sids, as_multipolygon=False, wrap_lon=True):
     if isinstance(sids, str):
         sids = numpy.array(sids.strip('[]').split(), dtype=numpy.int64)
 
-    trixels = []
     vertices = to_corners(sids, wrap_lon=wrap_lon)
-    for vertex in vertices:
-        geom = shapely.geometry.Polygon(vertex)
-        trixels.append(geom)
+    trixels = list(shapely.polygons(vertices))
 
     if len(trixels) == 1 and not as_multipolygon:
         trixels = trixels[0]
@@ -517,14 +588,18 @@ def trixels_from_stareseries(sids_series, n_partitions=1, num_workers=None, wrap
     sids_series: array-like
         Series or array-like with STARE index values
     n_partitions: int
-        number of workers to use to lookup geometries in parallel
+        number of partitions to lookup geometries in parallel. With a single partition, the trixels of a
+        column of single SIDs are created in one vectorized call.
+    num_workers: int
+        number of processes to look up the partitions with
     wrap_lon: bool
             toggle if trixels should be wraped around antimeridian.
 
     Returns
     -----------
     trixel_series: geopandas.GeoSeries
-        Series of trixels / triangle geometries
+        Series of trixels / triangle geometries. Polygons for rows of single SIDs, multipolygons for rows of
+        sets of SIDs.
 
     Examples
     -------------
@@ -540,7 +615,10 @@ def trixels_from_stareseries(sids_series, n_partitions=1, num_workers=None, wrap
         # Cannot have more partitions than rows
         npartitions = len(sids_series) - 1
 
-    if npartitions == 1:
+    if npartitions == 1 and pandas.api.types.is_integer_dtype(sids_series):
+        # A column of single SIDs; we can create all trixels in one go
+        trixels_series = shapely.polygons(to_corners(sids_series.to_numpy(dtype=numpy.int64), wrap_lon=wrap_lon))
+    elif npartitions == 1:
         trixels_series = []
         for sids in sids_series:
             trixels = to_trixels(sids, as_multipolygon=True, wrap_lon=wrap_lon)
@@ -559,39 +637,121 @@ def trixels_from_stareseries(sids_series, n_partitions=1, num_workers=None, wrap
     return trixels_series
 
 
-def split_antimeridian_series(trixels_series, n_partitions=1, num_workers=None, drop=False):
-    n_partitions = n_partitions
+ANTIMERIDIAN_BBOX = shapely.geometry.box(-180, -90, 180, 90)
 
-    if len(trixels_series) <= 1:
-        n_partitions = 1
-    elif n_partitions >= len(trixels_series):
-        # Cannot have more partitions than rows
-        n_partitions = len(trixels_series) - 1
-
-    if n_partitions == 1:
-        split = []
-        for row in trixels_series:
-            if row.geom_type == 'Polygon':
-                # We need to catch single Polygons
-                row = [row]
-            row = split_antimeridian(row, drop=drop)
-            split.append(row)
-        trixels_series = geopandas.GeoSeries(split,
-                                             crs='EPSG:4326',
-                                             index=trixels_series.index)
-    else:
-        ddf = dask.dataframe.from_pandas(trixels_series, npartitions=n_partitions)
-        meta = {'trixels': 'object'}
-        res = ddf.map_partitions(lambda df:
-                                 from_shapely(
-                                     split_antimeridian_series(df, n_partitions=1, drop=drop)).to_numpy().flatten(),
-                                 meta=meta)
-        trixels_series = res.compute(scheduler='processes', num_workers=num_workers)
-        # Since the array would be ragged, we are probably safer with a list of arrays
-        trixels_series = trixels_series.tolist()
 
-    trixels_series = geopandas.GeoSeries(trixels_series, crs='EPSG:4326', index=trixels_series.index)
-    return trixels_series
+def _translate_x(geoms, xoff):
+    """ Shifts each geometry of an array of geometries by its own longitude offset """
+    geoms = numpy.array(geoms, dtype=object)
+    coords, idx = shapely.get_coordinates(geoms, return_index=True)
+    coords[:, 0] += xoff[idx]
+    return shapely.set_coordinates(geoms, coords)
+
+
+def _split_antimeridian_parts(parts, rows, n_rows, drop=False):
+    """ Splits an array of polygons at the antimeridian and collects the pieces into one multipolygon per row.
+
+    Parameters
+    ------------
+    parts: numpy.array
+        array of polygons (e.g. trixels)
+    rows: numpy.array
+        the row each of the parts belongs to
+    n_rows: int
+        the number of rows to collect the parts into
+    drop: bool
+        If drop is True, we drop the parts whose longitudes have been wrapped around the antimeridian
+
+    Returns
+    ---------
+    split: numpy.array
+        array of n_rows multipolygons
+    """
+    parts = numpy.array(parts, dtype=object)
+    rows = numpy.asarray(rows)
+
+    valid = ~(shapely.is_missing(parts) | shapely.is_empty(parts))
+    parts = parts[valid]
+    rows = rows[valid]
+
+    # Trixels whose corners are more than half the globe apart have been wrapped around the (anti)meridian.
+    # We unwrap them by moving their western corners over by 360 degrees.
+    bounds = shapely.bounds(parts)
+    x_min, x_max = bounds[:, 0], bounds[:, 2]
+    wrapped = (x_max - x_min) > 180
+    if drop:
+        parts = parts[~wrapped]
+        rows = rows[~wrapped]
+        bounds = bounds[~wrapped]
+        x_min, x_max = bounds[:, 0], bounds[:, 2]
+        wrapped = wrapped[~wrapped]
+    if wrapped.any():
+        coords, idx = shapely.get_coordinates(parts[wrapped], return_index=True)
+        x_mid = ((x_min + x_max) / 2)[wrapped][idx]
+        coords[:, 0] += numpy.where(coords[:, 0] < x_mid, 360.0, 0.0)
+        parts[wrapped] = shapely.set_coordinates(parts[wrapped].copy(), coords)
+        bounds = shapely.bounds(parts)
+        x_min, x_max = bounds[:, 0], bounds[:, 2]
+
+    east = x_max > 180
+    west = x_min < -180
+    xoff = numpy.where(east, -360.0, numpy.where(west, 360.0, 0.0))
+    crossing = (east & (x_min < 180)) | (west & (x_max > -180))
+    outside_only = (xoff != 0) & ~crossing
+
+    inside = parts.copy()
+    inside[outside_only] = _translate_x(parts[outside_only], xoff[outside_only])
+    inside[crossing] = shapely.intersection(parts[crossing], ANTIMERIDIAN_BBOX)
+    outside = shapely.difference(parts[crossing], ANTIMERIDIAN_BBOX)
+    outside = _translate_x(outside, xoff[crossing])
+
+    pieces = numpy.concatenate([inside, outside])
+    piece_rows = numpy.concatenate([rows, rows[crossing]])
+
+    # Clipping may leave us with collections, slivers of lines, or empty geometries. We only keep the polygons
+    pieces, idx = shapely.get_parts(pieces, return_index=True)
+    piece_rows = piece_rows[idx]
+    polygons = (shapely.get_type_id(pieces) == shapely.GeometryType.POLYGON) & ~shapely.is_empty(pieces)
+    pieces = pieces[polygons]
+    piece_rows = piece_rows[polygons]
+
+    order = numpy.argsort(piece_rows, kind='stable')
+    split = numpy.full(n_rows, shapely.geometry.MultiPolygon(), dtype=object)
+    if len(pieces) > 0:
+        split = shapely.multipolygons(pieces[order], indices=piece_rows[order], out=split)
+    return split
+
+
+def split_antimeridian_series(trixels_series, n_partitions=None, num_workers=None, drop=False):
+    """Splits the trixels of each row of a series at the antimeridian
+
+    All trixels of the series are split in one pass. Crossing trixels are detected from their corner
+    longitudes, only those are clipped, and the pieces are collected back into one multipolygon per row.
+
+    Parameters
+    ------------
+    trixels_series: geopandas.GeoSeries
+        Series of trixels (polygons or multipolygons)
+    n_partitions: int
+        Deprecated and ignored; the series is split in a single vectorized pass.
+    num_workers: int
+        Deprecated and ignored.
+    drop: bool
+        If drop is True, we drop the trixels whose longitudes have been wrapped around the antimeridian
+        (i.e. trixels created with wrap_lon=True that cross it); other crossing trixels are split.
+
+    Returns
+    ---------
+    split: geopandas.GeoSeries
+        Series of multipolygons
+    """
+    if n_partitions is not None or num_workers is not None:
+        warnings.warn('split_antimeridian_series arguments n_partitions and num_workers are deprecated and ignored.',
+                      DeprecationWarning, stacklevel=2)
+    geoms = numpy.array(list(trixels_series), dtype=object)
+    parts, rows = shapely.get_parts(geoms, return_index=True)
+    split = _split_antimeridian_parts(parts, rows, n_rows=len(geoms), drop=drop)
+    return geopandas.GeoSeries(split, crs='EPSG:4326', index=trixels_series.index)
 
 
 def split_antimeridian(trixels, drop=False):
@@ -605,44 +765,25 @@ def split_antimeridian(trixels, drop=False):
     trixels: A polygon, multipolygon, collection of polygons, or a geometry series
         A collection of trixels.
     drop: bool
-        If drop is True, we drop the trixels that cross the antimeridian
+        If drop is True, we drop the trixels whose longitudes have been wrapped around the antimeridian
 
-    """
-    bbox = shapely.geometry.Polygon([(-180, -90), (180, -90), (180, 90), (-180, 90)])
-    trixels = geopandas.GeoSeries(trixels, crs='EPSG:4326')
-    exploded = trixels.explode(index_parts=True).reset_index(drop=True)
-
-    for idx, trixel in exploded.items(): # future warning; items or iter
-        if not trixel.exterior.is_ccw:
-            # If trixels are not CCW, they have been constructed incorrectly.
-            # We wrap their vertices around the antimeridian
-            if drop:
-                # we might just add empty polygons instead?
-                exploded[idx] = shapely.wkt.loads('POLYGON EMPTY')
-            else:
-                x = (numpy.array(trixel.exterior.xy[0]) + 180) % 360.0 - 180
-                y = numpy.array(trixel.exterior.xy[1])
-                exploded[idx] = shapely.geometry.Polygon(zip(x, y))
-
-    inside = exploded.intersection(bbox) # Seems to cause a warning as of 2023-07-13 https://github.com/shapely/shapely/issues/1345. No obvious harm?
-    inside[inside.geom_type != 'Polygon'] = shapely.wkt.loads('POLYGON EMPTY')
-    inside = geopandas.tools.collect(inside, multi=True)
-
-    outside = exploded.difference(bbox)
-    outside[outside.geom_type != 'Polygon'] = shapely.wkt.loads('POLYGON EMPTY')
-    outside = outside.apply(lambda x: shapely.affinity.translate(x, xoff=-360))
-    outside = geopandas.tools.collect(outside)
-
-    split = inside.union(outside)
-    return split
+    Returns
+    ---------
+    split: MultiPolygon
+        The trixels, split at the antimeridian
 
-def split_antimeridian_series(trixels, drop=False):
-    split = []
-    for row in trixels:
-        if row.geom_type == 'Polygon':
-            # We need to catch single Polygons
-            row = [row]
-        row = split_antimeridian(row, drop=drop)
-        split.append(row)
-    split = geopandas.GeoSeries(split, index=trixels.index)
-    return split
+    Examples
+    ---------
+    # >>> import shapely
+    # >>> geom = shapely.geometry.Polygon([(170, 0), (190, 0), (180, 10)])
+    # >>> split = starepandas.split_antimeridian(geom)
+    # >>> len(split.geoms)
+    # 2
+    """
+    if isinstance(trixels, shapely.Geometry):
+        trixels = [trixels]
+    geoms = numpy.array(list(trixels), dtype=object)
+    parts = shapely.get_parts(geoms)
+    rows = numpy.zeros(len(parts), dtype=numpy.int64)
+    split = _split_antimeridian_parts(parts, rows, n_rows=1, drop=drop)
+    return split[0]
@@ -2,6 +2,8 @@ import starepandas
 import pandas
 import geopandas
 import pytest
+import pystare
+import numpy
 
 
 cities = ['Buenos Aires', 'Brasilia', 'Santiago', 'Bogota', 'Caracas']
@@ -34,3 +36,34 @@ def test_plot_notrixel():
 def test_issue51_a():
     with pytest.raises(AttributeError):
         sdf.plot(trixels=True)
+
+
+def test_plot_max_level():
+    coarse = sdf.coarsen(level=3, column='Latitude')
+    ax = sdf.plot(max_level=3, column='Latitude')
+    collection = ax.collections[-1]
+    assert len(collection.get_paths()) == len(coarse)
+    assert sorted(collection.get_array()) == sorted(coarse['Latitude'])
+    sdf.plot(max_level='auto', boundary=False)
+
+
+def test_coarsen():
+    coarse = sdf.coarsen(level=1, column='Latitude', aggfunc='mean')
+    assert list(pystare.spatial_resolution(coarse.sids)) == [1] * len(coarse)
+    trixels = starepandas.trixels_from_stareseries(coarse.sids)
+    assert list(trixels.geom_type) == ['Polygon'] * len(coarse)
+    # Every city falls into exactly one coarse trixel, which holds the mean latitude of its cities
+    contains = numpy.array([pystare.intersects(numpy.array([sid]), sdf.sids.to_numpy()) for sid in coarse.sids]).T
+    assert (contains.sum(axis=1) == 1).all()
+    for i, latitude in enumerate(coarse['Latitude']):
+        assert latitude == pytest.approx(sdf['Latitude'][contains[:, i]].mean())
+    counts = sdf.coarsen(level=1, column='Latitude', aggfunc='count')
+    assert counts['Latitude'].sum() == len(sdf) and len(counts) < len(sdf)
+
+    dissolved = sdf.coarsen(level=1)
+    assert set(dissolved.sids) == set(coarse.sids)
+
+    multi = starepandas.trixels_from_stareseries(coarse.sids.astype(object))
+    assert all(a.equals(b) for a, b in zip(trixels, multi))
+    partitioned = starepandas.trixels_from_stareseries(coarse.sids, n_partitions=2)
+    assert all(a.equals(b) for a, b in zip(trixels, partitioned))
@@ -0,0 +1,412 @@
+import starepandas
+import starepandas.io.pod
+import starepandas.io.manifest
+import concurrent.futures
+import functools
+import importlib.util
+import numpy
+import os
+import pandas
+import pickle
+import pytest
+import threading
+import time
+import pyarrow.parquet
+import pystare
+
+
+lons = numpy.linspace(-170, 170, 200)
+lats = numpy.linspace(-60, 60, 200)
+sids = starepandas.sids_from_xy(lons, lats, level=27)
+sdf = starepandas.STAREDataFrame({'lat': lats, 'lon': lons, 'val': numpy.arange(200)}, sids=sids)
+
+
+def test_pods_parquet(tmp_path):
+    written = sdf.write_pods(str(tmp_path), level=2, chunk_name='chunk', format='parquet')
+    assert starepandas.io.pod.pod_format(written[0]) == 'parquet'
+    pods = [p.split('/')[-2] for p in written]
+    df = starepandas.read_pods(str(tmp_path), sids=pods, pattern='chunk', columns=['sids', 'val'])
+    assert list(df.columns) == ['sids', 'val']
+    assert len(df) == len(sdf)
+    assert sorted(df['val']) == list(range(200))
+
+    mtime = os.stat(written[0]).st_mtime_ns
+    parts = sdf.write_pods(str(tmp_path), level=2, chunk_name='chunk', format='parquet', append=True)
+    # Appends go to new part files and leave the chunks as they are
+    assert os.stat(written[0]).st_mtime_ns == mtime
+    assert [os.path.dirname(p) for p in parts] == [os.path.dirname(p) for p in written]
+    assert all(os.path.basename(p).startswith('chunk.') for p in parts)
+    for manifest in [True, False]:
+        df = starepandas.read_pods(str(tmp_path), sids=pods, pattern='chunk', format='parquet', manifest=manifest)
+        assert len(df) == 2 * len(sdf)
+
+    starepandas.compact_pods(str(tmp_path))
+    assert sorted(p.name for p in tmp_path.glob('*/chunk*')) == ['chunk'] * len(written)
+    assert sorted(starepandas.read_pods(str(tmp_path))['val']) == sorted(list(range(200)) * 2)
+
+
+def test_pods_parquet_sid_range(tmp_path):
+    written = sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='parquet')
+    chunk = max(written, key=lambda c: len(starepandas.io.pod.read_pod(c)))
+    pod_sids = starepandas.io.pod.read_pod(chunk, columns=['sids'])['sids']
+    assert numpy.all(numpy.diff(pod_sids) >= 0)
+
+    sid_range = (int(pod_sids.iloc[3]), int(pod_sids.iloc[5]))
+    df = starepandas.io.pod.read_pod(chunk, columns=['val'], sid_range=sid_range)
+    assert list(df.columns) == ['val']
+    assert len(df) == 3
+
+    metadata = pyarrow.parquet.ParquetFile(chunk).metadata
+    assert starepandas.io.pod.prune_row_groups(metadata, 'sids', (-2, -1)) == []
+
+
+def test_pods_parquet_row_groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(starepandas.staredataframe, 'PARQUET_ROW_GROUP_SIZE', 16)
+    written = sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='parquet')
+    chunk = max(written, key=lambda c: pyarrow.parquet.ParquetFile(c).metadata.num_rows)
+    metadata = pyarrow.parquet.ParquetFile(chunk).metadata
+    assert metadata.num_row_groups == -(-metadata.num_rows // 16) > 1
+
+    # A SID range within one row group only reads that row group
+    pod_sids = starepandas.io.pod.read_pod(chunk, columns=['sids'])['sids']
+    sid_range = (int(pod_sids.iloc[17]), int(pod_sids.iloc[20]))
+    assert starepandas.io.pod.prune_row_groups(metadata, 'sids', sid_range) == [1]
+    assert len(starepandas.io.pod.read_pod(chunk, sid_range=sid_range)) == 4
+
+
+def test_manifest(tmp_path):
+    granule = sdf.copy()
+    granule['ts_start'] = pandas.Timestamp('2021-01-10T07:14:55')
+    granule['ts_end'] = pandas.Timestamp('2021-01-10T08:56:50')
+    written = granule.write_pods(str(tmp_path), level=2, chunk_name='granule',
+                                 temporal_chunking={'partitioning': 'granule'})
+    manifest = starepandas.io.manifest.read_manifest(str(tmp_path))
+    assert len(manifest) == len(written)
+    assert manifest['n_rows'].sum() == len(sdf)
+    assert manifest['tid'].notna().all()
+
+    tid = int(manifest['tid'].iloc[0])
+    df = starepandas.read_pods(str(tmp_path), tids=[tid])
+    assert len(df) == len(sdf)
+    df = starepandas.read_pods(str(tmp_path), sids=manifest['pod'][:1], pattern='granule')
+    assert len(df) == manifest['n_rows'].iloc[0]
+
+    assert starepandas.rebuild_manifest(str(tmp_path)) == len(written)
+    rebuilt = starepandas.io.manifest.read_manifest(str(tmp_path))
+    assert rebuilt[['path', 'sid', 'tid', 'n_rows']].equals(manifest[['path', 'sid', 'tid', 'n_rows']])
+
+
+def test_iter_pods(tmp_path):
+    written = sdf.write_pods(str(tmp_path), level=2, chunk_name='chunk', format='parquet')
+    timings = []
+    df = starepandas.read_pods(str(tmp_path), num_workers=3, timings=timings)
+    assert len(timings) == len(written)
+    assert sorted(df['val']) == list(range(200))
+
+    batches = list(starepandas.iter_pods(str(tmp_path), batch_rows=64, num_workers=2, columns=['val']))
+    assert [len(b) for b in batches] == [64, 64, 64, 8]
+    assert sorted(pandas.concat(batches)['val']) == list(range(200))
+
+
+def test_read_pods_roi(tmp_path):
+    sdf.write_pods(str(tmp_path), level=4, chunk_name='chunk')
+    coarse_roi = starepandas.sids_from_xy([100], [40], level=1)
+    fine_roi = starepandas.sids_from_xy(lons[:5], lats[:5], level=12)
+    for roi in [coarse_roi, fine_roi, numpy.concatenate([coarse_roi, fine_roi])]:
+        pods = starepandas.io.pod.roi_pods(str(tmp_path), roi)
+        assert 0 < len(pods) < len(starepandas.io.pod.list_pods(str(tmp_path)))
+        expected = starepandas.speedy_subset(sdf, roi)
+        df = starepandas.read_pods(str(tmp_path), roi_sids=roi)
+        assert sorted(df['val']) == sorted(expected['val'])
+        df = starepandas.read_pods(str(tmp_path), roi_sids=roi, pod_level=4, manifest=False)
+        assert sorted(df['val']) == sorted(expected['val'])
+
+
+def test_read_pods_filter(tmp_path):
+    timed = sdf.copy()
+    dates = numpy.where(timed['val'] < 100, '2021-01-10', '2022-06-01').astype('datetime64[ns]')
+    timed['ts_start'] = dates
+    timed['tids'] = starepandas.tivs_from_timeseries(dates, forward_res=20, reverse_res=20)
+    window = starepandas.tivs_from_timeseries(numpy.array(['2021-01-10T12:00'], dtype='datetime64[ns]'),
+                                              forward_res=20, reverse_res=20)
+    roi = starepandas.sids_from_xy([lons[50], lons[150]], [lats[50], lats[150]], level=3)
+    expected = starepandas.speedy_subset(timed, roi)
+    expected = expected[expected['val'] < 100]
+    assert len(expected) > 0
+
+    for format in ['pickle', 'parquet']:
+        root = tmp_path / format
+        root.mkdir()
+        timed.write_pods(str(root), level=3, chunk_name='chunk', format=format)
+        df = starepandas.read_pods(str(root), filter_sids=roi, filter_tids=window, columns=['val'])
+        assert list(df.columns) == ['val']
+        assert sorted(df['val']) == sorted(expected['val'])
+
+        no_tids = starepandas.io.pod.read_pod(next(root.glob('*/chunk')).as_posix(), columns=['ts_start', 'val'])
+        mask = starepandas.io.pod.tid_mask(no_tids, window)
+        assert (no_tids['val'][mask] < 100).all()
+
+
+def test_pod_partitions(tmp_path):
+    pod_sids, starts, ends, order = sdf.pod_partitions(level=3)
+    expected = sdf.groupby(sdf.to_sids_level(level=3, clear_to_level=True)['sids']).size()
+    assert list(pod_sids) == list(expected.index)
+    assert list(ends - starts) == list(expected)
+    assert numpy.all(numpy.diff(order[starts[0]:ends[0]]) > 0)
+
+    written = sdf.write_pods(str(tmp_path), level=3, chunk_name='chunk', num_workers=4)
+    assert len(written) == len(pod_sids)
+    assert len(starepandas.read_pods(str(tmp_path))) == len(sdf)
+
+
+def test_pods_tpod(tmp_path):
+    timed = sdf.copy()
+    timed['ts_start'] = numpy.where(timed['val'] < 100, '2021-01-05', '2021-01-25').astype('datetime64[ns]')
+    timed['ts_end'] = numpy.where(timed['val'] < 100, '2021-01-06', '2021-02-20').astype('datetime64[ns]')
+    written = timed.write_pods(str(tmp_path), level=1, chunk_name='chunk',
+                               temporal_chunking={'partitioning': 'pod', 'resolution': 16})
+    tpods = {p.split('/')[-2] for p in written}
+    assert tpods == {'0x1f94000000000000_16'}
+    links = [p for p in tmp_path.glob('*/*/*') if p.is_symlink()]
+    assert len(links) > 0
+    assert {p.parent.name for p in links} == {'0x1f94400000000000_16'}
+
+    pods = starepandas.io.pod.list_pods(str(tmp_path))['pod']
+    february = starepandas.tivs_from_timeseries(numpy.array(['2021-02-10'], dtype='datetime64[ns]'),
+                                                forward_res=20, reverse_res=20)
+    for manifest in [True, False]:
+        df = starepandas.read_pods(str(tmp_path), sids=pods, manifest=manifest)
+        assert sorted(df['val']) == list(range(200))
+        df = starepandas.read_pods(str(tmp_path), sids=pods, tids=february, manifest=manifest)
+        assert set(range(100, 200)) <= set(df['val']) and df['val'].is_unique
+        df = starepandas.read_pods(str(tmp_path), sids=pods, tids=february, filter_tids=february, manifest=manifest)
+        assert sorted(df['val']) == list(range(100, 200))
+
+    assert starepandas.rebuild_manifest(str(tmp_path)) == len(written)
+
+
+def test_pods_tpod_row_times(tmp_path):
+    timed = sdf.copy()
+    start = numpy.datetime64('2021-01-20', 'ms') + numpy.arange(200) * numpy.timedelta64(4, 'h')
+    timed['ts_start'] = start.astype('datetime64[ns]')
+    timed['ts_end'] = (start + (numpy.arange(200) % 7) * numpy.timedelta64(1, 'D')).astype('datetime64[ns]')
+    timed.write_pods(str(tmp_path), level=1, chunk_name='chunk', temporal_chunking={'partitioning': 'pod'})
+
+    # Each row's chunk is in (or linked from) each of the tpods its TID overlaps
+    pods = timed.to_sids_level(level=1, clear_to_level=True)['sids']
+    expected = {(pystare.int2hex(pod), pystare.format_tpod(tpod))
+                for pod, tid in zip(pods, timed._row_tids()) for tpod in pystare.pods_in_query(tid, 16)}
+    assert {(p.parent.parent.name, p.parent.name) for p in tmp_path.glob('*/*/*')} == expected
+    df = starepandas.read_pods(str(tmp_path), sids=starepandas.io.pod.list_pods(str(tmp_path))['pod'])
+    assert sorted(df['val']) == list(range(200))
+
+
+def test_compact_pods(tmp_path):
+    for i in range(3):
+        starepandas.STAREDataFrame(sdf.iloc[i::3]).write_pods(str(tmp_path), level=1, chunk_name='MOD09.{}'.format(i))
+    pod = starepandas.io.pod.list_pods(str(tmp_path))['pod'][0]
+    with open(tmp_path / pod / 'appended', 'wb') as f:
+        pickle.dump(sdf.iloc[:5], f)
+        pickle.dump(sdf.iloc[5:10], f)
+    n_before = len(starepandas.read_pods(str(tmp_path), sids=[pod], manifest=False))
+
+    report = starepandas.compact_pods(str(tmp_path), pattern='MOD09', num_workers=2)
+    assert (report['chunks_after'] == 1).all()
+    assert report['chunks_before'].sum() > len(report)
+    assert sorted(p.name for p in (tmp_path / pod).iterdir()) == ['MOD09', 'appended']
+
+    df = starepandas.read_pods(str(tmp_path), pattern='MOD09')
+    assert sorted(df['val']) == list(range(200))
+    chunk = starepandas.io.pod.read_pod(str(tmp_path / pod / 'MOD09'))
+    assert chunk['sids'].is_monotonic_increasing
+
+    report = starepandas.compact_pods(str(tmp_path), sids=[pod], pattern='appended', format='parquet')
+    assert report['frames_before'].sum() == 2
+    assert starepandas.io.pod.pod_format(str(tmp_path / pod / 'appended')) == 'parquet'
+    assert len(starepandas.read_pods(str(tmp_path), sids=[pod], manifest=False)) == n_before
+    assert len(starepandas.read_pods(str(tmp_path), sids=[pod])) == n_before
+
+
+def test_pods_concurrent_writers(tmp_path):
+    pickle_chunk = sdf.write_pods(str(tmp_path / 'pickle'), level=1, chunk_name='chunk')[0]
+    sdf.write_pods(str(tmp_path / 'pickle'), level=1, chunk_name='chunk', append=True, lock=True)
+    assert len(starepandas.io.pod.read_pod_pickle(pickle_chunk)) == 2
+
+    root = str(tmp_path / 'shared')
+
+    def ingest(i):
+        part = starepandas.STAREDataFrame(sdf.iloc[i::4])
+        part.write_pods(root, level=1, chunk_name='MOD09', writer_id='writer{}'.format(i), append=True)
+        part.write_pods(root, level=1, chunk_name='MOD09', writer_id='writer{}'.format(i), append=True)
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        list(executor.map(ingest, range(4)))
+    assert not list((tmp_path / 'shared').glob('*/.*.tmp'))
+    chunks = [p.name for p in (tmp_path / 'shared').glob('*/MOD09*')]
+    assert {'.'.join(name.split('.')[:2]) for name in chunks} == {'MOD09.writer{}'.format(i) for i in range(4)}
+    # Every append went into a new chunk next to the writer's chunk
+    assert sum(name.count('.') == 2 for name in chunks) == sum(name.count('.') == 1 for name in chunks)
+    # Writers with a writer_id leave the manifest alone, which is built once the ingest is done
+    assert not starepandas.io.manifest.has_manifest(root)
+    df = starepandas.read_pods(root, pattern='MOD09')
+    assert sorted(df['val']) == sorted(list(range(200)) * 2)
+    starepandas.rebuild_manifest(root)
+    assert starepandas.io.manifest.read_manifest(root)['n_rows'].sum() == 2 * len(sdf)
+    assert sorted(starepandas.read_pods(root, pattern='MOD09')['val']) == sorted(list(range(200)) * 2)
+
+
+def test_pods_codecs(tmp_path):
+    codecs = ['bz2', {'method': 'bz2', 'level': 1}]
+    codecs += [c for c in ['zstd', {'method': 'zstd', 'level': 19}, 'lz4'] if importlib.util.find_spec(
+        starepandas.io.pod.CODEC_MODULES[starepandas.io.pod.compression_method(c)[0]].split('.')[0])]
+    for i, codec in enumerate(codecs):
+        root = str(tmp_path / str(i))
+        written = sdf.write_pods(root, level=1, chunk_name='chunk', compress=codec)
+        assert starepandas.io.pod.pod_compression(written[0]) == starepandas.io.pod.compression_method(codec)[0]
+        sdf.write_pods(root, level=1, chunk_name='chunk', append=True)
+        assert len(starepandas.io.pod.read_pod_pickle(written[0])) == 2
+        df = starepandas.read_pods(root)
+        assert sorted(df['val']) == sorted(list(range(200)) * 2)
+
+    report = starepandas.io.pod.benchmark_codecs([sdf], codecs=[None] + codecs, repeat=1)
+    assert list(report['codec'])[:2] == ['none', 'bz2']
+    assert (report['ratio'][1:] > 1).all()
+
+
+def test_pods_arrow(tmp_path):
+    written = sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='arrow')
+    assert starepandas.io.pod.pod_format(written[0]) == 'arrow'
+    chunk = max(written, key=lambda c: len(starepandas.io.pod.read_pod(c)))
+    df = starepandas.io.pod.read_pod(chunk)
+    assert df['sids'].is_monotonic_increasing
+    assert not df['sids'].to_numpy().flags.writeable and not df['val'].to_numpy().flags.owndata
+
+    sid_range = (int(df['sids'].iloc[3]), int(df['sids'].iloc[5]))
+    assert list(starepandas.io.pod.read_pod(chunk, columns=['val'], sid_range=sid_range)['val']) == \
+        list(df['val'].iloc[3:6])
+
+    roi = starepandas.sids_from_xy([lons[50]], [lats[50]], level=3)
+    expected = starepandas.speedy_subset(sdf, roi)
+    df = starepandas.read_pods(str(tmp_path), filter_sids=roi, columns=['val'])
+    assert sorted(df['val']) == sorted(expected['val'])
+
+    sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='arrow', append=True)
+    df = starepandas.read_pods(str(tmp_path))
+    assert sorted(df['val']) == sorted(list(range(200)) * 2)
+    assert starepandas.rebuild_manifest(str(tmp_path)) == len(written)
+    assert starepandas.io.manifest.read_manifest(str(tmp_path))['n_rows'].sum() == 2 * len(sdf)
+
+
+def test_pod_cache(tmp_path):
+    cache = starepandas.enable_pod_cache()
+    try:
+        written = sdf.write_pods(str(tmp_path), level=1, chunk_name='chunk')
+        n_chunks = len(written)
+        df = starepandas.read_pods(str(tmp_path))
+        assert starepandas.pod_cache_info().misses == n_chunks
+        roi = starepandas.sids_from_xy([lons[50]], [lats[50]], level=3)
+        df = starepandas.read_pods(str(tmp_path), roi_sids=roi, add_podname=True)
+        assert sorted(df['val']) == sorted(starepandas.speedy_subset(sdf, roi)['val'])
+        assert starepandas.pod_cache_info().hits > 0
+        assert 'pod' not in cache.frames[next(iter(cache.frames))][0].columns
+
+        sdf.write_pods(str(tmp_path), level=1, chunk_name='chunk', append=True)
+        df = starepandas.read_pods(str(tmp_path))
+        assert len(df) == 2 * len(sdf)
+        assert starepandas.pod_cache_info().entries == n_chunks
+
+        starepandas.enable_pod_cache(max_bytes=cache.bytes // 2)
+        assert starepandas.pod_cache_info().evictions > 0 and cache.bytes <= cache.max_bytes
+    finally:
+        starepandas.disable_pod_cache()
+    assert starepandas.pod_cache_info() is None
+
+
+def test_pods_parquet_append_compression(tmp_path):
+    sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='parquet', compress='zstd')
+    parts = sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='parquet', append=True)
+    metadata = pyarrow.parquet.ParquetFile(parts[0]).metadata
+    assert {metadata.row_group(i).column(0).compression for i in range(metadata.num_row_groups)} == {'ZSTD'}
+    with pytest.raises(ValueError):
+        sdf.write_pods(str(tmp_path), level=0, chunk_name='chunk', format='parquet', append=True, compress='snappy')
+    assert len(starepandas.read_pods(str(tmp_path))) == 2 * len(sdf)
+
+
+def test_manifest_stale(tmp_path, caplog):
+    root = str(tmp_path)
+    sdf.write_pods(root, level=1, chunk_name='indexed')
+    pod = starepandas.io.pod.list_pods(root)['pod'][0]
+    # Backdate the manifest, so that the chunks below are newer whatever the filesystem's timestamp resolution
+    backdated = os.stat(starepandas.io.manifest.manifest_path(root)).st_mtime_ns - 10 ** 9
+    os.utime(starepandas.io.manifest.manifest_path(root), ns=(backdated, backdated))
+    late = starepandas.STAREDataFrame(sdf.iloc[:3])
+    late.write_pods(root, level=1, chunk_name='unindexed', manifest=False)
+    with open(tmp_path / pod / 'by_hand', 'wb') as f:
+        pickle.dump(sdf.iloc[:2], f)
+    # By default, the query is answered from the manifest alone
+    assert len(starepandas.io.manifest.read_manifest(root)) == len(starepandas.io.pod.find_pods(root))
+    assert len(starepandas.read_pods(root)) == len(sdf)
+    assert 'rebuild_manifest' not in caplog.text
+
+    df = starepandas.read_pods(root, check_stale=True)
+    assert len(df) == len(sdf) + 3 + 2
+    assert 'rebuild_manifest' in caplog.text
+    assert len(starepandas.read_pods(root, pattern='unindexed', check_stale=True)) == 3
+    paths = starepandas.io.pod.find_pods(root, sids=[pod], check_stale=True)
+    assert str(tmp_path / pod / 'by_hand') in paths
+    roi = [starepandas.io.manifest.pod_sid(pod)]
+    assert paths == starepandas.io.pod.find_pods(root, roi_sids=roi, check_stale=True)
+
+    starepandas.rebuild_manifest(root)
+    caplog.clear()
+    assert len(starepandas.read_pods(root)) == len(sdf) + 3 + 2
+    assert len(starepandas.read_pods(root, check_stale=True)) == len(sdf) + 3 + 2
+    assert 'rebuild_manifest' not in caplog.text
+
+
+def test_compact_pods_interleaved_append(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    for i in range(2):
+        starepandas.STAREDataFrame(sdf.iloc[i::2]).write_pods(root, level=0, chunk_name='MOD09.{}'.format(i))
+    read_pod_pickle = starepandas.io.pod.read_pod_pickle
+    appenders = []
+
+    def read_and_append(filename):
+        if not appenders:
+            # An append to a chunk being compacted
+            append = functools.partial(sdf.write_pods, root, level=0, chunk_name='MOD09.0', append=True, lock=True)
+            appenders.append(threading.Thread(target=append))
+            appenders[0].start()
+            time.sleep(0.2)
+            assert appenders[0].is_alive()
+        return read_pod_pickle(filename)
+
+    monkeypatch.setattr(starepandas.io.pod, 'read_pod_pickle', read_and_append)
+    starepandas.compact_pods(root, pattern='MOD09')
+    appenders[0].join()
+    df = starepandas.read_pods(root, pattern='MOD09')
+    assert sorted(df['val']) == sorted(list(range(200)) * 2)
+    assert not list(tmp_path.glob('*/.*'))
+    paths = starepandas.io.manifest.read_manifest(root)['path']
+    assert all(os.path.exists(os.path.join(root, path)) for path in paths)
+
+
+def test_pods_atomic_append(tmp_path):
+    root = str(tmp_path)
+    for format in ['pickle', 'arrow', 'parquet']:
+        chunk = sdf.write_pods(root, level=0, chunk_name=format, format=format, writer_id='w')[0]
+        stat = os.stat(chunk)
+        appended = sdf.write_pods(root, level=0, chunk_name=format, format=format, writer_id='w', append=True)
+        assert chunk not in appended and all(path.startswith(os.path.dirname(path) + '/' + format + '.w.')
+                                             for path in appended)
+        # The existing chunk was neither copied nor rewritten
+        assert os.stat(chunk).st_mtime_ns == stat.st_mtime_ns and os.stat(chunk).st_ino == stat.st_ino
+        assert len(starepandas.read_pods(root, pattern=format)) == 2 * len(sdf)
+    assert not starepandas.io.manifest.has_manifest(root)
+    sdf.write_pods(root, level=0, chunk_name='pickle', format='pickle', writer_id='w', append=True, manifest=True)
+    assert starepandas.io.manifest.read_manifest(root)['n_rows'].sum() == len(sdf)
+    starepandas.rebuild_manifest(root)
+    assert starepandas.io.manifest.read_manifest(root)['n_rows'].sum() == 7 * len(sdf)
+    report = starepandas.compact_pods(root, pattern='pickle')
+    assert (report['chunks_after'] == 1).all()
+    assert len(starepandas.read_pods(root, pattern='pickle')) == 3 * len(sdf)
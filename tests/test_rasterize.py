@@ -0,0 +1,71 @@
+import starepandas
+import numpy
+import pystare
+import pytest
+import shapely
+
+
+lons = [10, 10, -10, 170]
+lats = [5, 5, -5, 80]
+sids = starepandas.sids_from_xy(lons, lats, level=12)
+sdf = starepandas.STAREDataFrame({'a': [1.0, 2.0, 3.0, 4.0]}, sids=sids)
+
+
+def test_rasterize_mean():
+    raster = sdf.rasterize('a', width=2, height=2, bbox=(-20, -10, 20, 10))
+    assert raster.shape == (2, 2)
+    assert raster[0, 1] == 1.5
+    assert raster[1, 0] == 3.0
+    assert numpy.isnan(raster[0, 0]) and numpy.isnan(raster[1, 1])
+
+
+def test_rasterize_agg():
+    assert numpy.nansum(sdf.rasterize('a', width=36, height=18, agg='count')) == 4
+    assert numpy.nanmax(sdf.rasterize('a', width=36, height=18, agg='max')) == 4.0
+    assert numpy.nanmin(sdf.rasterize('a', width=36, height=18, agg='min')) == 1.0
+    assert numpy.nansum(sdf.rasterize('a', width=36, height=18, agg='sum')) == 10.0
+
+
+def test_rasterize_footprint():
+    sids = starepandas.sids_from_xy([10], [5], level=3)
+    coarse = starepandas.STAREDataFrame({'a': [1.0]}, sids=sids)
+    raster = coarse.rasterize('a', width=360, height=180, method='footprint', agg='count')
+    # Each pixel of the trixel is covered exactly once; the covered area is about the area of the trixel
+    assert numpy.nanmax(raster) == 1
+    trixel = starepandas.to_trixels(sids[0])
+    assert abs(numpy.nansum(raster) - trixel.area) / trixel.area < 0.05
+    # No holes: every pixel whose center is inside the trixel is covered
+    lon, lat = numpy.meshgrid(numpy.arange(-179.5, 180), numpy.arange(89.5, -90, -1))
+    inside = shapely.contains_xy(trixel, lon, lat)
+    assert (raster[inside] == 1).all() and numpy.isnan(raster[~inside]).all()
+
+
+def test_rasterize_footprint_count():
+    # Level 12 trixels are much smaller than a pixel; each counts once
+    raster = sdf.rasterize('a', width=36, height=18, method='footprint', agg='count')
+    assert numpy.nansum(raster) == len(sdf)
+    assert numpy.nansum(sdf.rasterize('a', width=36, height=18, method='footprint', agg='sum')) == 10.0
+
+    # Four sibling trixels, each spanning many pixels, count once in each pixel they cover
+    children = pystare.spatial_clear_to_resolution(pystare.spatial_coerce_resolution(
+        starepandas.sids_from_xy([10], [5], level=4), 3)) + numpy.arange(4) * (1 << (59 - 2 * 4)) + 1
+    siblings = starepandas.STAREDataFrame({'a': [1.0, 2.0, 3.0, 4.0]}, sids=children)
+    parent = starepandas.STAREDataFrame({'a': [1.0]}, sids=pystare.spatial_coerce_resolution(children[:1], 3))
+    count = siblings.rasterize('a', width=720, height=360, method='footprint', agg='count')
+    parent_count = parent.rasterize('a', width=720, height=360, method='footprint', agg='count')
+    assert numpy.nansum(count) == pytest.approx(numpy.nansum(parent_count), rel=0.02)
+    assert numpy.nanmax(count) <= 2
+
+
+def test_rasterize_footprint_antimeridian():
+    sids = starepandas.sids_from_xy([179.9], [0], level=4)
+    df = starepandas.STAREDataFrame({'a': [1.0]}, sids=sids)
+    raster = df.rasterize('a', width=360, height=180, method='footprint', agg='count')
+    assert (raster[:, 0] == 1).any() and (raster[:, -1] == 1).any()
+    assert numpy.nansum(raster[:, 10:-10]) == 0
+
+
+def test_rasterize_latlon():
+    raster = sdf.rasterize('a', width=2, height=2, bbox=(-20, -10, 20, 10), method='latlon')
+    assert raster[0, 1] == 1.5
+    assert raster[1, 0] == 3.0
@@ -1,6 +1,11 @@
 import pytest
 import starepandas
 import os
+import netCDF4
+import numpy
+import pandas
+import pystare
+from starepandas.io.granules.modis import repeat_view
 
 
 def test_read_cldmsk_viirsl2():
@@ -95,3 +100,344 @@ def test_find_companion():
     granule = starepandas.io.granules.VNP02DNB('tests/data/granules/viirs/VNP02DNB.A2022308.1930.002.2022309051542.nc')
     companion = granule.guess_companion_path(prefix='VNP03DNB')
     assert companion == 'tests/data/granules/viirs/VNP03DNB.A2022308.1930.002.2022309041547.nc'
+
+
+class NPZGranule(starepandas.io.granules.granule.Granule):
+    """ A minimal loader for granules stored as numpy .npz archives of lat, lon, and val arrays."""
+
+    windowed = True
+
+    def read_latlon(self):
+        with numpy.load(self.file_path) as npz:
+            self.lat = self.read_rows(npz['lat'])
+            self.lon = self.read_rows(npz['lon'])
+
+    def n_rows(self):
+        with numpy.load(self.file_path) as npz:
+            return npz['lat'].shape[0]
+
+    def read_data(self):
+        with numpy.load(self.file_path) as npz:
+            self.data['val'] = self.read_rows(npz['val'])
+
+
+def test_read_granules_batch(tmp_path, monkeypatch):
+    monkeypatch.setitem(starepandas.io.granules.granule_factory_library, 'NPZGRANULE', NPZGranule)
+    paths = []
+    for i in range(3):
+        lon, lat = numpy.meshgrid(numpy.linspace(-10, 10, 8 * (i + 1)) + 30 * i, numpy.linspace(-5, 5, 4))
+        paths.append(str(tmp_path / 'NPZGRANULE.{}.npz'.format(i)))
+        numpy.savez(paths[-1], lat=lat, lon=lon, val=numpy.full(lat.shape, i, dtype=numpy.int16))
+    paths.append(str(tmp_path / 'unsupported.txt'))
+
+    failures = []
+    df = starepandas.read_granules(paths, num_workers=2, latlon=True, failures=failures)
+    assert len(df) == 4 * (8 + 16 + 24)
+    assert failures[0][0] == paths[-1]
+    assert isinstance(failures[0][1], starepandas.io.granules.UnsupportedFileError)
+    with pytest.raises(starepandas.io.granules.UnsupportedFileError):
+        starepandas.read_granules(paths, errors='raise')
+
+    roi = starepandas.sids_from_xy([30], [0], level=3)
+    frames = list(starepandas.read_granules(paths[:3], iterate=True, add_sids=True, roi_sids=roi, errors='ignore'))
+    assert len(frames) == 3
+    assert set(pandas.concat(frames)['val']) == {1}
+
+
+def write_npz_granule(path, lat, lon):
+    val = numpy.arange(lat.size, dtype=numpy.int32).reshape(lat.shape)
+    numpy.savez(path, lat=lat, lon=lon, val=val)
+    sids = starepandas.sids_from_xy(lon.flatten(), lat.flatten(), level=12).reshape(lat.shape)
+    cover = numpy.unique(pystare.spatial_clear_to_resolution(pystare.spatial_coerce_resolution(sids.flatten(), 4)))
+    with netCDF4.Dataset(path.replace('.npz', '_stare.nc'), 'w') as nc:
+        nc.createDimension('i', lat.shape[0])
+        nc.createDimension('j', lat.shape[1])
+        nc.createDimension('l', len(cover))
+        nc.createVariable('STARE_index', 'i8', ('i', 'j'))[:] = sids
+        nc.createVariable('Latitude', 'f8', ('i', 'j'))[:] = lat
+        nc.createVariable('Longitude', 'f8', ('i', 'j'))[:] = lon
+        nc.createVariable('STARE_cover', 'i8', ('l',))[:] = cover
+
+
+def test_read_granule_roi(tmp_path, monkeypatch):
+    monkeypatch.setitem(starepandas.io.granules.granule_factory_library, 'NPZGRANULE', NPZGranule)
+    lon, lat = numpy.meshgrid(numpy.linspace(0, 10, 10), numpy.linspace(-20, 20, 40))
+    path = str(tmp_path / 'NPZGRANULE.0.npz')
+    write_npz_granule(path, lat, lon)
+
+    roi = starepandas.sids_from_xy([5], [0], level=4)
+    full = starepandas.read_granule(path, sidecar=True, latlon=True, xy=True)
+    expected = starepandas.speedy_subset(full, roi)
+    assert 0 < len(expected) < len(full)
+
+    granule = NPZGranule(path)
+    assert granule.set_roi(roi)
+    assert 0 < granule.window[1] - granule.window[0] < lat.shape[0]
+    df = starepandas.read_granule(path, sidecar=True, latlon=True, xy=True, roi=roi)
+    assert list(df['val']) == list(expected['val'])
+    assert list(df['y']) == list(expected['y'])
+    assert (df['lat'].to_numpy() == expected['lat'].to_numpy()).all()
+
+    assert starepandas.read_granule(path, sidecar=True, roi=starepandas.sids_from_xy([-100], [60], level=6)) is None
+    df = starepandas.read_granule(path, add_sids=True, roi=roi)
+    assert sorted(df['val']) == sorted(expected['val'])
+
+
+def test_to_df_fast():
+    lon, lat = numpy.meshgrid(numpy.linspace(0, 10, 5), numpy.linspace(-20, 20, 4))
+    granule = NPZGranule('NPZGRANULE.0.npz')
+    granule.lat, granule.lon = lat, lon
+    sids = starepandas.sids_from_xy(lon.flatten(), lat.flatten(), level=12).reshape(lat.shape)
+    granule.sids = numpy.ma.masked_array(sids, mask=numpy.zeros(sids.shape, dtype=bool))
+    counts = numpy.arange(20, dtype=numpy.int16).reshape(4, 5)
+    granule.data['counts'] = numpy.ma.masked_equal(counts, 7)
+    granule.data['reflectance'] = numpy.ma.masked_array(counts / 10, mask=counts == 3)
+
+    df = granule.to_df(mode='fast', xy=True)
+    assert df['sids'].dtype == numpy.int64 and df['counts'].dtype == numpy.int16
+    assert numpy.shares_memory(df['counts'].to_numpy(), granule.data['counts'].data)
+    assert df['counts'].iloc[7] == 7 and numpy.isnan(df['reflectance'].iloc[3])
+    nullable = granule.to_df(xy=True)
+    assert (df['x'] == nullable['x']).all() and (df['sids'] == nullable['sids']).all()
+
+    granule.sids[0, 1] = numpy.ma.masked
+    df = granule.to_df(mode='fast')
+    assert len(df) == 19 and 1 not in df.index
+    with pytest.raises(ValueError):
+        granule.to_df(mode='compact')
+
+
+def test_decode_bitfields():
+    from starepandas.io.granules.bitfields import decode_bitfields, MOD09_STATE, MOD09_BAND_QA
+    rng = numpy.random.default_rng(0)
+    state = rng.integers(0, 2**16, size=(40, 30), dtype=numpy.uint16)
+    state = numpy.ma.masked_equal(state, state[0, 0])
+    fields = decode_bitfields(state, MOD09_STATE)
+    assert fields['land_water'].dtype == numpy.uint8
+    assert (fields['land_water'] == (state >> 3) % 8).all()
+    assert (fields['snow_internal'] == (state >= 2**15)).all()
+    assert fields['cloud'].mask[0, 0]
+
+    qa = pandas.Series(rng.integers(0, 2**31, size=100, dtype=numpy.int64) - 2**30).astype(numpy.int32)
+    df = decode_bitfields(qa, MOD09_BAND_QA)
+    assert (df['band3_quality'] == (qa.to_numpy().view(numpy.uint32) >> 10) % 16).all()
+    assert (df['adjacency_correction'] == (qa < 0)).all()
+    assert (starepandas.io.granules.modis.decode_qa(qa) == df['modland']).all()
+
+    states = starepandas.io.granules.modis.decode_state(pandas.Series([9, None, 4], dtype='UInt16'))
+    assert isinstance(states['cloud'].dtype, pandas.CategoricalDtype)
+    assert list(states['cloud'].astype(object).fillna('na')) == ['cloudy', 'na', 'clear']
+    assert list(states['cloud_shadow'].astype(object).fillna('na')) == [False, 'na', True]
+
+    qf2 = starepandas.io.granules.viirsl2.decode_qf2(pandas.Series([0b1101, 0b0100], dtype=numpy.uint8))
+    assert list(qf2['land_water']) == ['coastal', 'undefined']
+    assert list(qf2['shadow']) == [True, False]
+
+
+class FakeSDS:
+    """ Stands in for a pyhdf SDS of an HDF4 granule."""
+
+    def __init__(self, array, attributes):
+        self.array = array
+        self.attrs = attributes
+
+    def get(self):
+        return self.array.copy()
+
+    def __getitem__(self, key):
+        return self.array[key].copy()
+
+    def attributes(self):
+        return self.attrs
+
+
+def test_modis_read_dataset_resampled(monkeypatch):
+    reflectance = numpy.arange(12, dtype=numpy.int16).reshape(3, 4) * 1000
+    reflectance[1, 2] = -28672
+    datasets = {'reflectance': FakeSDS(reflectance, {'_FillValue': -28672, 'scale_factor': 10000.0}),
+                'state': FakeSDS(reflectance.view(numpy.uint16), {}),
+                'clear': FakeSDS(reflectance // 1000, {'_FillValue': -1})}
+    hdf = type('FakeSD', (), {'select': lambda self, name: datasets[name]})()
+    monkeypatch.setattr(starepandas.io.s3, 'sd_wrapper', lambda file_path: hdf)
+
+    granule = starepandas.io.granules.Mod09('MOD09.A2019.hdf', nom_res='500m')
+    expected = reflectance.repeat(2, axis=0).repeat(2, axis=1)
+    assert (granule.resample(reflectance, 2) == expected).all()
+    assert (repeat_view(reflectance, 2).flatten() == expected.flatten()).all()
+
+    granule.read_dataset('reflectance', resample_factor=2)
+    granule.read_dataset('state', resample_factor=2)
+    data = granule.data['reflectance']
+    assert data.dtype == numpy.float32 and data.shape == (6, 8)
+    assert data.mask.sum() == 4 and data.mask[2:4, 4:6].all()
+    assert numpy.allclose(data.compressed(), expected[expected != -28672] / 10000)
+    assert granule.data['state'].dtype == numpy.uint16
+    # No mask array is allocated for datasets without fill values
+    granule.read_dataset('clear', resample_factor=2)
+    assert granule.data['clear'].mask is numpy.ma.nomask and granule.data['clear'].shape == (6, 8)
+
+    granule.window = (1, 4)
+    granule.read_dataset('reflectance', resample_factor=2, dtype='float64')
+    assert granule.data['reflectance'].dtype == numpy.float64
+    assert numpy.allclose(granule.data['reflectance'].filled(0), data[1:4].filled(0))
+
+
+def test_mod03_read_scan_times(monkeypatch):
+    # TAI93 seconds of 2021-01-03T00:00:00 UTC, i.e. including the 10 leap seconds since 1993
+    t_0 = numpy.array([883785610.0, 883785611.4775, -999.0, 883785614.4325])
+    datasets = {'EV start time': FakeSDS(t_0, {})}
+    hdf = type('FakeSD', (), {'select': lambda self, name: datasets[name]})()
+    monkeypatch.setattr(starepandas.io.s3, 'sd_wrapper', lambda file_path: hdf)
+
+    mod03 = starepandas.io.granules.Mod03('MOD03.A2021003.0000.hdf')
+    mod03.read_scan_times(tids=False)
+    ts = mod03.data['ts']
+    assert ts.shape == (40, 1354)
+    assert ts[0, 0] == numpy.datetime64('2021-01-03T00:00:00.005')
+    assert (ts[:10] == ts[0]).all() and ts.mask[20:30].all() and not ts.mask[30:].any()
+    assert numpy.diff(ts[0].astype(numpy.int64)).max() <= 1
+
+    mod03.window = (15, 35)
+    mod03.read_scan_times()
+    tids = mod03.data['tids']
+    assert tids.shape == (20, 1354) and tids.mask[5:15].all()
+    expected = pystare.from_ms_since_epoch_utc(ts[15:35].compressed().astype(numpy.int64), 48, 48)
+    assert (tids.compressed() == expected).all()
+
+    mod03 = starepandas.io.granules.Mod03('MOD03.A2021003.0000.hdf', nom_res='500m')
+    mod03.read_scan_times(tids=False)
+    assert mod03.data['ts'].shape == (80, 2708)
+
+
+def test_build_sidecars(tmp_path, monkeypatch):
+    monkeypatch.setitem(starepandas.io.granules.granule_factory_library, 'NPZGRANULE', NPZGranule)
+    paths = []
+    for i in range(3):
+        lon, lat = numpy.meshgrid(numpy.linspace(-10, 10, 12) + 30 * i, numpy.linspace(-5, 5, 7))
+        paths.append(str(tmp_path / 'NPZGRANULE.{}.npz'.format(i)))
+        numpy.savez(paths[-1], lat=lat, lon=lon, val=numpy.full(lat.shape, i, dtype=numpy.int16))
+    (tmp_path / 'notes.txt').write_text('not a granule')
+
+    sidecars = starepandas.build_sidecars(str(tmp_path), num_workers=2, cover_res=4, rows_per_block=3)
+    assert sidecars == [p.replace('.npz', '_stare.nc') for p in paths]
+    assert starepandas.build_sidecars(str(tmp_path), num_workers=1) == []
+
+    granule = NPZGranule(paths[1])
+    granule.read_latlon()
+    granule.add_sids()
+    df = starepandas.read_granule(paths[1], sidecar=True, latlon=True)
+    assert (df['sids'].to_numpy() == granule.sids.flatten()).all()
+    assert (df['lat'].to_numpy() == granule.lat.flatten()).all()
+    granule.read_sidecar_cover()
+    sids = numpy.unique(pystare.spatial_clear_to_resolution(pystare.spatial_coerce_resolution(granule.sids, 4)))
+    assert pystare.intersects(granule.stare_cover, sids).all()
+    area = lambda s: (4.0 ** -pystare.spatial_resolution(s)).sum()
+    assert len(granule.stare_cover) <= len(sids) and area(granule.stare_cover) == area(sids)
+
+    os.utime(paths[0], (0, os.path.getmtime(sidecars[0]) + 10))
+    assert starepandas.build_sidecars(str(tmp_path), product='NPZGRANULE.0', num_workers=1) == sidecars[:1]
+
+
+def test_build_sidecar_cover(tmp_path, monkeypatch):
+    monkeypatch.setitem(starepandas.io.granules.granule_factory_library, 'NPZGRANULE', NPZGranule)
+    lon, lat = numpy.meshgrid(numpy.linspace(0, 10, 60), numpy.linspace(-20, 20, 60))
+    path = str(tmp_path / 'NPZGRANULE.0.npz')
+    numpy.savez(path, lat=lat, lon=lon, val=numpy.zeros(lat.shape, dtype=numpy.int16))
+    area = lambda s: (4.0 ** -pystare.spatial_resolution(s)).sum()
+
+    for level in [None, 6]:
+        sidecar = starepandas.io.granules.sidecars.build_sidecar(path, level=level, rows_per_block=7, overwrite=True)
+        with netCDF4.Dataset(sidecar) as nc:
+            sids = nc['STARE_index'][:].astype(numpy.int64).flatten()
+            cover = nc['STARE_cover'][:].astype(numpy.int64)
+        # The cover of the uncoerced SIDs consists of cleared SIDs
+        assert (pystare.spatial_clear_to_resolution(cover) == cover).all()
+        trixels = numpy.unique(pystare.spatial_clear_to_resolution(sids))
+        assert pystare.intersects(cover, sids).all()
+        assert area(cover) == area(trixels)
+    # At level 6, the 60x60 pixels fill complete sets of siblings, which are merged
+    assert len(cover) < len(trixels)
+    assert (pystare.spatial_resolution(cover) < 6).any()
+
+
+def test_sidecar_handles(tmp_path, monkeypatch):
+    lon, lat = numpy.meshgrid(numpy.linspace(0, 10, 10), numpy.linspace(-20, 20, 40))
+    path = str(tmp_path / 'NPZGRANULE.0.npz')
+    write_npz_granule(path, lat, lon)
+    opened = []
+    nc4_dataset_wrapper = starepandas.io.s3.nc4_dataset_wrapper
+
+    def wrapper(file_path, *args, **kwargs):
+        opened.append(nc4_dataset_wrapper(file_path, *args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(starepandas.io.s3, 'nc4_dataset_wrapper', wrapper)
+
+    with NPZGranule(path) as granule:
+        assert granule.set_roi(starepandas.sids_from_xy([5], [0], level=4))
+        granule.read_sidecar_latlon()
+        granule.read_sidecar_cover()
+        assert len(opened) == 1 and opened[0].isopen()
+        assert granule.sidecar_path == path.replace('.npz', '_stare.nc')
+    assert not opened[0].isopen() and granule.sidecars == {}
+
+    monkeypatch.setitem(starepandas.io.granules.granule_factory_library, 'NPZGRANULE', NPZGranule)
+    starepandas.read_granule(path, sidecar=True, latlon=True)
+    assert len(opened) == 2 and not opened[1].isopen()
+
+
+class GridGranule(starepandas.io.granules.granule.Granule):
+    def read_latlon(self):
+        self.set_grid(numpy.linspace(-85, 85, 18), numpy.linspace(-175, 175, 36))
+
+
+def test_grid_cache(tmp_path, monkeypatch):
+    from_latlon_2d = pystare.from_latlon_2d
+    calls = []
+    monkeypatch.setattr(pystare, 'from_latlon_2d',
+                        lambda *args, **kwargs: calls.append(1) or from_latlon_2d(*args, **kwargs))
+    starepandas.enable_grid_cache(str(tmp_path / 'grids'))
+    try:
+        granules = [GridGranule('grid_{}.nc'.format(i)) for i in range(2)]
+        for granule in granules:
+            granule.read_latlon()
+            granule.add_sids()
+    finally:
+        starepandas.disable_grid_cache()
+    assert len(calls) == 1
+    assert isinstance(granules[1].sids, numpy.memmap)
+    assert granules[1].sids.filename == granules[0].sids.filename
+    assert len(os.listdir(tmp_path / 'grids')) == 3
+
+    granule = GridGranule('grid.nc')
+    granule.read_latlon()
+    granule.add_sids()
+    assert not isinstance(granule.sids, numpy.memmap)
+    assert (granule.sids == granules[0].sids).all()
+    assert (granule.lat == granules[0].lat).all() and (granule.lon == granules[0].lon).all()
+
+
+def test_iter_blocks(tmp_path, monkeypatch):
+    monkeypatch.setitem(starepandas.io.granules.granule_factory_library, 'NPZGRANULE', NPZGranule)
+    lon, lat = numpy.meshgrid(numpy.linspace(0, 10, 10), numpy.linspace(-20, 20, 40))
+    path = str(tmp_path / 'NPZGRANULE.0.npz')
+    write_npz_granule(path, lat, lon)
+    full = starepandas.read_granule(path, sidecar=True, latlon=True, xy=True)
+
+    granule = NPZGranule(path)
+    blocks = list(granule.iter_blocks(rows_per_block=16, sidecar=True, xy=True))
+    assert [len(block) for block in blocks] == [160, 160, 80]
+    df = pandas.concat(blocks, ignore_index=True)
+    assert (df['sids'] == full['sids']).all() and (df['y'] == full['y']).all()
+    assert (df['lat'].to_numpy() == full['lat'].to_numpy()).all() and (df['val'] == full['val']).all()
+    assert granule.window is None and granule.data == {}
+
+    df = pandas.concat(granule.iter_blocks(rows_per_block=7, add_sids=True, mode='fast'), ignore_index=True)
+    assert (df['val'] == full['val']).all() and df['sids'].dtype == numpy.int64
+
+    roi = starepandas.sids_from_xy([5], [0], level=4)
+    expected = starepandas.speedy_subset(full, roi)
+    assert granule.set_roi(roi)
+    window = granule.window
+    df = pandas.concat(granule.iter_blocks(rows_per_block=2, sidecar=True, xy=True))
+    assert list(df['val']) == list(expected['val']) and list(df['y']) == list(expected['y'])
+    assert granule.window == window
@@ -1,3 +1,4 @@
+import pytest
 import starepandas
 import geopandas
 import shapely
@@ -32,3 +33,19 @@ def test_wrap():
     geom = shapely.wkt.loads('POLYGON((-100 0, -200 0, -150 40, -100 0))')
     geom_split = starepandas.split_antimeridian(geom)
     assert min(geom_split.geoms[0].exterior.xy[0]) >= -180.0
+
+
+def test_wrap_series():
+    trixels = geopandas.GeoSeries([shapely.wkt.loads('POLYGON((170 0, 190 0, 180 10, 170 0))'),
+                                   shapely.wkt.loads('POLYGON((179 0, -179 0, 180 10, 179 0))'),
+                                   shapely.wkt.loads('POLYGON((10 0, 20 0, 15 10, 10 0))')],
+                                  index=[5, 6, 7])
+    split = starepandas.split_antimeridian_series(trixels)
+    assert list(split.index) == [5, 6, 7]
+    assert [len(geom.geoms) for geom in split] == [2, 2, 1]
+    assert split.total_bounds[0] >= -180.0 and split.total_bounds[2] <= 180.0
+
+    dropped = starepandas.split_antimeridian_series(trixels, drop=True)
+    assert list(dropped.is_empty) == [False, True, False]
+    with pytest.warns(DeprecationWarning):
+        starepandas.split_antimeridian_series(trixels, n_partitions=2)